@@ -76,6 +76,8 @@
       sops.defaultGroups = config.clan.core.sops.defaultGroups;
       inherit (config.clan.core.networking) targetHost buildHost;
       inherit (config.clan.deployment) requireExplicitUpdate;
+      # machines of the same platform are preferably built on the same build host
+      inherit (pkgs.stdenv.hostPlatform) system;
     };
     system.clan.deployment.file = pkgs.writeText "deployment.json" (
       builtins.toJSON config.system.clan.deployment.data
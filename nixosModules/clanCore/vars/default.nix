@@ -45,6 +45,13 @@ in
             prompts
             share
             ;
+          # the script as written, to fingerprint the generator without the
+          # wrapper of finalScript
+          script =
+            if builtins.isPath generator.script then
+              builtins.readFile generator.script
+            else
+              generator.script;
           files = lib.flip lib.mapAttrs generator.files (_name: file: { inherit (file) secret; });
         }
       );
@@ -3,7 +3,7 @@ import logging
 from typing import Any
 
 import gi
-from clan_cli.api import MethodRegistry, dataclass_to_dict, from_dict
+from clan_cli.api import MethodRegistry, dataclass_to_json, from_dict
 
 from clan_app.api import GObjApi, GResult, ImplFunc
 from clan_app.api.file import open_file
@@ -123,17 +123,20 @@ class WebExecutor(GObject.Object):
         GLib.idle_add(fn_instance._async_run, reconciled_arguments)
 
     def on_result(self, source: ImplFunc, data: GResult) -> None:
-        result = dataclass_to_dict(data.result)
-        serialized = json.dumps(result, indent=4)
+        serialized = dataclass_to_json(data.result)
         log.debug(f"Result for {data.method_name}: {serialized}")
 
         # Use idle_add to queue the response call to js on the main GTK thread
         self.return_data_to_js(data.method_name, serialized)
 
     def return_data_to_js(self, method_name: str, serialized: str) -> bool:
+        # The json is embedded in a js template literal
+        literal = (
+            serialized.replace("\\", "\\\\").replace("`", "\\`").replace("${", "\\${")
+        )
         self.webview.evaluate_javascript(
             f"""
-            window.clan.{method_name}(`{serialized}`);
+            window.clan.{method_name}(`{literal}`);
             """,
             -1,
             None,
@@ -0,0 +1,79 @@
+"""
+Commit generated files, one git add per file versus commit_files.
+
+    python benchmarks/bench_commit_files.py --files 1000
+
+Requires git.
+"""
+
+import argparse
+import subprocess
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from harness import Benchmark
+
+from clan_cli.git import commit_files
+
+
+def init_repo(repo_dir: Path) -> None:
+    subprocess.run(["git", "init", "-q", str(repo_dir)], check=True)
+    for key, value in [("user.name", "bench"), ("user.email", "bench@localhost")]:
+        subprocess.run(["git", "-C", str(repo_dir), "config", key, value], check=True)
+
+
+def generate_files(repo_dir: Path, num_files: int, content: str) -> list[Path]:
+    paths = []
+    for i in range(num_files):
+        path = repo_dir / "vars" / f"file-{i}" / "value"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+        paths.append(path)
+    return paths
+
+
+def commit_files_per_path(paths: list[Path], repo_dir: Path, message: str) -> None:
+    # what commit_files used to do
+    for path in paths:
+        subprocess.run(["git", "-C", str(repo_dir), "add", "--", str(path)], check=True)
+    subprocess.run(
+        ["git", "-C", str(repo_dir), "diff", "--cached", "--exit-code", "--"]
+        + [str(path) for path in paths],
+        stdout=subprocess.DEVNULL,
+    )
+    subprocess.run(
+        ["git", "-C", str(repo_dir), "commit", "-q", "-m", message, "--no-verify"]
+        + [str(path) for path in paths],
+        check=True,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=1000)
+    args = parser.parse_args()
+
+    bench = Benchmark("commit_files")
+    with TemporaryDirectory() as tmp:
+        repo_dir = Path(tmp)
+        init_repo(repo_dir)
+
+        paths = generate_files(repo_dir, args.files, "first")
+        with bench.measure("git add per file", items=len(paths)):
+            commit_files_per_path(paths, repo_dir, "first")
+
+        paths = generate_files(repo_dir, args.files, "second")
+        with bench.measure("commit_files", items=len(paths)):
+            commit_files(paths, repo_dir, "second")
+
+        # nothing changed, only the diff check runs
+        bench.run(
+            "commit_files, unchanged",
+            lambda: commit_files(paths, repo_dir, "third"),
+            items=len(paths),
+        )
+    bench.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Build the API json schema by introspection and compare it to loading
+the file generated at build time.
+
+    python benchmarks/bench_schema.py
+"""
+
+import argparse
+import json
+import tempfile
+from pathlib import Path
+
+from harness import Benchmark
+
+# some unused imports are needed to trigger registrations of api functions
+import clan_cli.config.schema  # noqa: F401
+from clan_cli.api import API
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    bench = Benchmark("schema")
+    bench.run("to_json_schema (introspection)", API.to_json_schema, repeat=args.repeat)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        schema_file = Path(tmpdir) / "schema.json"
+        schema_file.write_text(json.dumps(API.to_json_schema(), indent=2))
+
+        def load() -> None:
+            with open(schema_file) as f:
+                json.load(f)
+
+        bench.run("load the generated schema.json", load, repeat=args.repeat)
+    bench.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Deserialize a synthetic inventory with the compiled plans of from_dict
+and with the reflective construct_dataclass.
+
+    python benchmarks/bench_serde.py --machines 1000
+"""
+
+import argparse
+from typing import Any
+
+from harness import Benchmark
+
+from clan_cli.api import from_dict
+from clan_cli.api.serde import construct_dataclass
+from clan_cli.inventory import Inventory
+
+
+def inventory_data(num_machines: int) -> dict[str, Any]:
+    machines = {
+        f"machine-{i}": {
+            "name": f"machine-{i}",
+            "description": f"Machine number {i}",
+            "system": "x86_64-linux",
+            "tags": ["all", f"rack-{i % 10}"],
+            "deploy": {"targetHost": f"root@10.0.{i // 256}.{i % 256}"},
+        }
+        for i in range(num_machines)
+    }
+    return {
+        "meta": {"name": "benchmark"},
+        "machines": machines,
+        "services": {
+            "borgbackup": {
+                "backup": {
+                    "meta": {"name": "backup"},
+                    "config": {
+                        "destinations": {"remote": {"name": "remote", "repo": "r"}}
+                    },
+                    "roles": {
+                        "client": {"tags": ["all"], "machines": list(machines)},
+                        "server": {"machines": ["machine-0"]},
+                    },
+                    "machines": {name: {"imports": []} for name in machines},
+                }
+            },
+            "single-disk": {
+                "disk": {
+                    "meta": {"name": "disk"},
+                    "roles": {"default": {"tags": ["all"]}},
+                    "machines": {
+                        name: {"config": {"device": "/dev/sda"}} for name in machines
+                    },
+                }
+            },
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    data = inventory_data(args.machines)
+    assert from_dict(Inventory, data) == construct_dataclass(Inventory, data)
+
+    bench = Benchmark("serde")
+    bench.run(
+        "construct_dataclass (reflective)",
+        lambda: construct_dataclass(Inventory, data),
+        repeat=args.repeat,
+        items=args.machines,
+    )
+    bench.run(
+        "from_dict (compiled plan)",
+        lambda: from_dict(Inventory, data),
+        repeat=args.repeat,
+        items=args.machines,
+    )
+    bench.report()
+
+
+if __name__ == "__main__":
+    main()
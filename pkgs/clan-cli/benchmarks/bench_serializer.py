@@ -0,0 +1,85 @@
+"""
+Serialize the responses of get_inventory and list_inventory_machines
+for a synthetic clan, the way the webview returns them to the frontend.
+
+    python benchmarks/bench_serializer.py --machines 1000
+"""
+
+import argparse
+import json
+from dataclasses import fields, is_dataclass
+from pathlib import Path
+from typing import Any
+
+from bench_serde import inventory_data
+from harness import Benchmark
+
+from clan_cli.api import dataclass_to_dict, dataclass_to_json, from_dict
+from clan_cli.api.serde import sanitize_string
+from clan_cli.inventory import Inventory
+
+
+def dataclass_to_dict_reflective(obj: Any) -> Any:
+    """
+    The previous implementation, inspecting the fields of every instance
+    and escaping every string
+    """
+    if is_dataclass(obj):
+        return {
+            sanitize_string(field.metadata.get("alias", field.name)): (
+                dataclass_to_dict_reflective(getattr(obj, field.name))
+            )
+            for field in fields(obj)
+            if not field.name.startswith("_") and getattr(obj, field.name) is not None
+        }
+    elif isinstance(obj, list | tuple):
+        return [dataclass_to_dict_reflective(item) for item in obj]
+    elif isinstance(obj, dict):
+        return {
+            sanitize_string(k): dataclass_to_dict_reflective(v) for k, v in obj.items()
+        }
+    elif isinstance(obj, Path):
+        return sanitize_string(str(obj))
+    elif isinstance(obj, str):
+        return sanitize_string(obj)
+    return obj
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    inventory = from_dict(Inventory, inventory_data(args.machines))
+    responses = {"get_inventory": inventory, "list_machines": inventory.machines}
+
+    bench = Benchmark("serializer")
+    for name, response in responses.items():
+        expected = json.loads(json.dumps(dataclass_to_dict(response)))
+        assert json.loads(dataclass_to_json(response)) == expected
+        bench.run(
+            f"{name}: reflective + json.dumps",
+            lambda response=response: json.dumps(
+                dataclass_to_dict_reflective(response)
+            ),
+            repeat=args.repeat,
+            items=args.machines,
+        )
+        bench.run(
+            f"{name}: compiled + json.dumps",
+            lambda response=response: json.dumps(dataclass_to_dict(response)),
+            repeat=args.repeat,
+            items=args.machines,
+        )
+        bench.run(
+            f"{name}: dataclass_to_json",
+            lambda response=response: dataclass_to_json(response),
+            repeat=args.repeat,
+            items=args.machines,
+        )
+    bench.report()
+
+
+if __name__ == "__main__":
+    main()
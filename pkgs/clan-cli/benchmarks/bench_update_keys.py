@@ -0,0 +1,78 @@
+"""
+Add a recipient to all secrets of a synthetic tree, with one sops process
+at a time and with a process pool.
+
+    python benchmarks/bench_update_keys.py --secrets 200
+
+Requires sops and age (directly or via nix shell).
+"""
+
+import argparse
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from harness import Benchmark
+
+from clan_cli.secrets import groups
+from clan_cli.secrets.folders import sops_secrets_folder, sops_users_folder
+from clan_cli.secrets.secrets import collect_keys_for_path, encrypt_secret
+from clan_cli.secrets.sops import generate_private_key, update_keys_many, write_key
+
+
+def create_tree(flake_dir: Path, num_secrets: int) -> None:
+    priv_key, pub_key = generate_private_key()
+    os.environ["SOPS_AGE_KEY"] = priv_key
+    write_key(sops_users_folder(flake_dir) / "admin", pub_key, False)
+    groups.add_user(flake_dir, "admins", "admin")
+    for i in range(num_secrets):
+        encrypt_secret(
+            flake_dir,
+            sops_secrets_folder(flake_dir) / f"secret-{i}",
+            f"value-{i}",
+            add_groups=["admins"],
+        )
+    _, pub_key = generate_private_key()
+    write_key(sops_users_folder(flake_dir) / "new-admin", pub_key, False)
+
+
+def secrets_with_keys(flake_dir: Path) -> list[tuple[Path, list[str]]]:
+    return [
+        (secret, sorted(collect_keys_for_path(secret)))
+        for secret in sorted(sops_secrets_folder(flake_dir).iterdir())
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--secrets", type=int, default=200)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    bench = Benchmark("update_keys")
+    with TemporaryDirectory() as tmp:
+        flake_dir = Path(tmp)
+        create_tree(flake_dir, args.secrets)
+        member = groups.users_folder(flake_dir, "admins") / "new-admin"
+        new_admin = sops_users_folder(flake_dir) / "new-admin"
+
+        for jobs in dict.fromkeys([1, args.jobs]):
+            # the same rotation for both job counts: add the new admin to every
+            # secret, then remove it again untimed for the next round
+            member.symlink_to(os.path.relpath(new_admin, member.parent))
+            secrets = secrets_with_keys(flake_dir)
+            with bench.measure(f"add recipient, {jobs} jobs", items=len(secrets)):
+                update_keys_many(secrets, max_workers=jobs)
+            member.unlink()
+            update_keys_many(secrets_with_keys(flake_dir), max_workers=args.jobs)
+
+        secrets = secrets_with_keys(flake_dir)
+        # nothing changed, no sops process is spawned
+        bench.run(
+            "no-op rotation", lambda: update_keys_many(secrets), items=len(secrets)
+        )
+    bench.report()
+
+
+if __name__ == "__main__":
+    main()
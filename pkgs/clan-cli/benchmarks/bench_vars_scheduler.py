@@ -0,0 +1,59 @@
+"""
+Schedule a synthetic set of vars generators, serially and in parallel.
+
+    python benchmarks/bench_vars_scheduler.py --machines 50 --generators 20
+
+Every generator is a process that sleeps for --duration seconds,
+like a generator script running in its bubblewrap sandbox.
+"""
+
+import argparse
+import random
+import subprocess
+
+from harness import Benchmark
+
+from clan_cli.vars.scheduler import run_in_dependency_order
+
+
+def synthetic_graph(
+    machines: int, generators: int, seed: int = 0
+) -> dict[tuple[str, str], set[tuple[str, str]]]:
+    rng = random.Random(seed)
+    graph = {}
+    for m in range(machines):
+        for g in range(generators):
+            # every generator depends on up to two earlier generators of its machine
+            deps = rng.sample(range(g), min(g, rng.randint(0, 2)))
+            graph[(f"machine-{m}", f"gen-{g}")] = {
+                (f"machine-{m}", f"gen-{d}") for d in deps
+            }
+    return graph
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--machines", type=int, default=50)
+    parser.add_argument("--generators", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=0.01)
+    parser.add_argument("--jobs", type=int, default=8)
+    args = parser.parse_args()
+
+    graph = synthetic_graph(args.machines, args.generators)
+
+    def execute(node: tuple[str, str]) -> None:
+        subprocess.run(["sleep", str(args.duration)], check=True)
+
+    bench = Benchmark("vars_scheduler")
+    for jobs in [1, args.jobs]:
+        bench.run(
+            f"{len(graph)} generators, {jobs} jobs",
+            lambda: run_in_dependency_order(graph, execute, max_workers=jobs),
+            repeat=1,
+            items=len(graph),
+        )
+    bench.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Minimal harness for the clan-cli benchmarks.
+
+Every benchmark is a script in this directory, run it from the clan-cli directory:
+
+    python benchmarks/bench_update_keys.py
+
+Results are printed as a table. If BENCH_RESULTS is set, every measurement is
+also appended as a json line to that file so runs can be compared over time.
+"""
+
+import json
+import os
+import statistics
+import sys
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+# make clan_cli importable without installing it
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@dataclass
+class Measurement:
+    benchmark: str
+    name: str
+    times: list[float] = field(default_factory=list)
+    # number of items processed per run, used to report the throughput
+    items: int | None = None
+
+    @property
+    def best(self) -> float:
+        return min(self.times)
+
+    @property
+    def mean(self) -> float:
+        return statistics.mean(self.times)
+
+
+class Benchmark:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.measurements: list[Measurement] = []
+
+    @contextmanager
+    def measure(self, name: str, items: int | None = None) -> Iterator[None]:
+        """
+        Measure a single run of the code inside the context
+        """
+        measurement = Measurement(self.name, name, items=items)
+        start = time.perf_counter()
+        yield
+        measurement.times.append(time.perf_counter() - start)
+        self.measurements.append(measurement)
+
+    def run(
+        self,
+        name: str,
+        func: Callable[[], object],
+        repeat: int = 5,
+        items: int | None = None,
+    ) -> Measurement:
+        """
+        Measure func repeat times
+        """
+        measurement = Measurement(self.name, name, items=items)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            measurement.times.append(time.perf_counter() - start)
+        self.measurements.append(measurement)
+        return measurement
+
+    def report(self) -> None:
+        print(f"======== {self.name} ========")
+        for m in self.measurements:
+            line = f"{m.name:<40} best {m.best * 1000:10.2f}ms  mean {m.mean * 1000:10.2f}ms"
+            if m.items:
+                line += f"  {m.items / m.best:10.1f} items/s"
+            print(line)
+        if results := os.environ.get("BENCH_RESULTS"):
+            with open(results, "a") as f:
+                for m in self.measurements:
+                    f.write(json.dumps({**asdict(m), "time": time.time()}) + "\n")
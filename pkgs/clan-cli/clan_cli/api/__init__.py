@@ -1,5 +1,8 @@
+import contextvars
+import logging
 from collections.abc import Callable
-from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from functools import wraps
 from inspect import Parameter, Signature, signature
 from typing import (
@@ -9,14 +12,24 @@ from typing import (
     Literal,
     TypeVar,
     get_type_hints,
+    overload,
 )
 
-from .serde import dataclass_to_dict, from_dict, sanitize_string
+from .cache import ReadCache
+from .serde import dataclass_to_dict, dataclass_to_json, from_dict, sanitize_string
 
-__all__ = ["from_dict", "dataclass_to_dict", "sanitize_string"]
+__all__ = [
+    "ReadCache",
+    "dataclass_to_dict",
+    "dataclass_to_json",
+    "from_dict",
+    "sanitize_string",
+]
 
 from clan_cli.errors import ClanError
 
+log = logging.getLogger(__name__)
+
 T = TypeVar("T")
 
 ResponseDataType = TypeVar("ResponseDataType")
@@ -46,6 +59,13 @@ class ErrorDataClass:
 ApiResponse = SuccessDataClass[ResponseDataType] | ErrorDataClass
 
 
+@dataclass
+class BatchCall:
+    method: str
+    # keyword arguments of the method, as json
+    args: dict[str, Any] = field(default_factory=dict)
+
+
 def update_wrapper_signature(wrapper: Callable, wrapped: Callable) -> None:
     sig = signature(wrapped)
     params = list(sig.parameters.values())
@@ -65,6 +85,9 @@ class MethodRegistry:
     def __init__(self) -> None:
         self._orig_signature: dict[str, Signature] = {}
         self._registry: dict[str, Callable[..., Any]] = {}
+        # methods that do not modify anything, batch runs them concurrently
+        self._read_only: set[str] = set()
+        self._caches: dict[str, ReadCache] = {}
 
     @property
     def orig_signatures(self) -> dict[str, Signature]:
@@ -78,9 +101,15 @@ class MethodRegistry:
     def functions(self) -> dict[str, Callable[..., Any]]:
         return self._registry
 
+    @property
+    def read_only(self) -> set[str]:
+        return self._read_only
+
     def reset(self) -> None:
         self._orig_signature.clear()
         self._registry.clear()
+        self._read_only.clear()
+        self._caches.clear()
 
     def register_abstract(self, fn: Callable[..., T]) -> Callable[..., T]:
         @wraps(fn)
@@ -108,7 +137,46 @@ API.register(open_file)
         self.register(wrapper)
         return fn
 
-    def register(self, fn: Callable[..., T]) -> Callable[..., T]:
+    @overload
+    def register(self, fn: Callable[..., T]) -> Callable[..., T]: ...
+
+    @overload
+    def register(
+        self, *, read_only: bool = False, cache: ReadCache | None = None
+    ) -> Callable[[Callable[..., T]], Callable[..., T]]: ...
+
+    def register(
+        self,
+        fn: Callable[..., T] | None = None,
+        *,
+        read_only: bool = False,
+        cache: ReadCache | None = None,
+    ) -> Callable[..., T] | Callable[[Callable[..., T]], Callable[..., T]]:
+        """
+        Registers fn as API method, used as @API.register or @API.register(read_only=True).
+        Read only methods must not modify anything, batch runs them concurrently.
+        Methods with a cache are read only, API calls of them are memoized.
+        """
+        if fn is None:
+
+            def decorator(fn: Callable[..., T]) -> Callable[..., T]:
+                return self._register(fn, read_only=read_only, cache=cache)
+
+            return decorator
+        return self._register(fn, read_only=read_only, cache=cache)
+
+    def invalidate(self, method_name: str) -> None:
+        """
+        Drops the cached results of every method invalidated by method_name.
+        """
+        for name, cache in self._caches.items():
+            if method_name in cache.invalidate_on:
+                log.debug(f"{method_name} invalidates the cache of {name}")
+                cache.clear()
+
+    def _register(
+        self, fn: Callable[..., T], *, read_only: bool, cache: ReadCache | None
+    ) -> Callable[..., T]:
         if fn.__name__ in self._registry:
             raise ValueError(f"Function {fn.__name__} already registered")
         if fn.__name__ in self._orig_signature:
@@ -119,7 +187,11 @@ API.register(open_file)
         @wraps(fn)
         def wrapper(*args: Any, op_key: str, **kwargs: Any) -> ApiResponse[T]:
             try:
-                data: T = fn(*args, **kwargs)
+                data: T = (
+                    fn(*args, **kwargs)
+                    if cache is None
+                    else cache.call(fn, *args, **kwargs)
+                )
                 return SuccessDataClass(status="success", data=data, op_key=op_key)
             except ClanError as e:
                 return ErrorDataClass(
@@ -133,6 +205,9 @@ API.register(open_file)
                         )
                     ],
                 )
+            finally:
+                # a failed call may have written something as well
+                self.invalidate(fn.__name__)
 
         # @wraps preserves all metadata of fn
         # we need to update the annotation, because our wrapper changes the return type
@@ -146,9 +221,84 @@ API.register(open_file)
         update_wrapper_signature(wrapper, fn)
 
         self._registry[fn.__name__] = wrapper
+        if read_only or cache is not None:
+            self._read_only.add(fn.__name__)
+        if cache is not None:
+            self._caches[fn.__name__] = cache
 
         return fn
 
+    def call(
+        self, method_name: str, args: dict[str, Any], op_key: str
+    ) -> ApiResponse[Any]:
+        """
+        Calls a method with json arguments, they are converted to the argument types first.
+        Every error is returned as ErrorDataClass.
+        """
+        try:
+            if method_name == "batch":
+                raise ClanError("batch cannot be nested")
+            func = self._registry.get(method_name)
+            if func is None:
+                raise ClanError(f"Method '{method_name}' not found in API")
+            kwargs = {}
+            for name, value in args.items():
+                arg_type = self.get_method_argtype(method_name, name)
+                if arg_type is None:
+                    raise ClanError(f"Method '{method_name}' has no argument '{name}'")
+                kwargs[name] = from_dict(arg_type, value)
+            return func(**kwargs, op_key=op_key)
+        except ClanError as e:
+            error = e
+        except Exception as e:
+            log.exception(f"API method {method_name} failed")
+            error = ClanError(str(e), description=type(e).__name__)
+        return ErrorDataClass(
+            op_key=op_key,
+            status="error",
+            errors=[
+                ApiError(
+                    message=error.msg,
+                    description=error.description,
+                    location=[method_name, error.location],
+                )
+            ],
+        )
+
+    def batch(
+        self, calls: list[BatchCall], op_key: str, max_workers: int = 8
+    ) -> list[ApiResponse[Any]]:
+        """
+        Runs the calls and returns their results in the same order,
+        a failing call does not affect the others.
+
+        Consecutive read only calls run concurrently in up to max_workers threads.
+        Any other call waits for the calls before it and runs alone,
+        so every call sees the changes of the calls before it.
+        """
+        results: list[ApiResponse[Any] | None] = [None] * len(calls)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running: list[tuple[int, Future]] = []
+
+            def wait_running() -> None:
+                for index, future in running:
+                    results[index] = future.result()
+                running.clear()
+
+            for index, call in enumerate(calls):
+                if call.method in self._read_only:
+                    # run in the context of the caller, i.e. its git transaction
+                    context = contextvars.copy_context()
+                    future = executor.submit(
+                        context.run, self.call, call.method, call.args, op_key
+                    )
+                    running.append((index, future))
+                    continue
+                wait_running()
+                results[index] = self.call(call.method, call.args, op_key)
+            wait_running()
+        return [result for result in results if result is not None]
+
     def to_json_schema(self) -> dict[str, Any]:
         from typing import get_type_hints
 
@@ -212,3 +362,14 @@ API.register(open_file)
 
 
 API = MethodRegistry()
+
+
+@API.register
+def batch(calls: list[BatchCall]) -> list[dict[str, Any]]:
+    """
+    Calls several API methods at once, see MethodRegistry.batch.
+    Returns the response of every call in the same order.
+    """
+    return [
+        dataclass_to_dict(response) for response in API.batch(calls, op_key="batch")
+    ]
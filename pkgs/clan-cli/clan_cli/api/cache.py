@@ -0,0 +1,104 @@
+import json
+import logging
+import time
+from collections.abc import Callable
+from inspect import Signature, signature
+from threading import Lock
+from typing import Any
+
+from .serde import dataclass_to_dict
+
+log = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("result", "stored", "token")
+
+    def __init__(self, token: str, stored: float, result: Any) -> None:
+        self.token = token
+        self.stored = stored
+        self.result = result
+
+
+class ReadCache:
+    """
+    Memoizes a read only API method, registered with @API.register(cache=ReadCache(...)).
+
+    Results are keyed by the serialized arguments of the call. With flake_arg,
+    the state of the flake passed in that argument is part of the key, any change
+    to the flake misses the cache. Flakes that are no local git repositories
+    are not cached then.
+
+    :param ttl: Seconds a result is valid, forever if None.
+    :param invalidate_on: Names of API methods that drop all cached results when called.
+    :param flake_arg: Name of the argument holding the flake directory.
+    :param max_entries: Number of results to keep, the oldest ones are dropped first.
+    """
+
+    def __init__(
+        self,
+        ttl: float | None = None,
+        invalidate_on: list[str] | None = None,
+        flake_arg: str | None = None,
+        max_entries: int = 64,
+    ) -> None:
+        self.ttl = ttl
+        self.invalidate_on = set(invalidate_on or [])
+        self.flake_arg = flake_arg
+        self.max_entries = max_entries
+        self._entries: dict[str, _Entry] = {}
+        self._lock = Lock()
+        self._signature: Signature | None = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _arguments(self, fn: Callable[..., Any], args: Any, kwargs: Any) -> Any:
+        if self._signature is None:
+            self._signature = signature(fn)
+        bound = self._signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return bound.arguments
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Returns the cached result of fn for the arguments or calls it.
+        Cached results are shared between callers and must not be modified.
+        """
+        arguments = self._arguments(fn, args, kwargs)
+        try:
+            key = json.dumps(dataclass_to_dict(arguments), sort_keys=True)
+        except TypeError:
+            return fn(*args, **kwargs)
+
+        token = ""
+        if self.flake_arg is not None:
+            # avoid the import cycle, the inventory registers API methods
+            from clan_cli.inventory import flake_state
+
+            state = flake_state(arguments[self.flake_arg])
+            if state is None:
+                return fn(*args, **kwargs)
+            token = state[1]
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if (
+            entry is not None
+            and entry.token == token
+            and (self.ttl is None or now - entry.stored < self.ttl)
+        ):
+            log.debug(f"Using cached result of {fn.__name__}")
+            return entry.result
+
+        # the token is taken before the call, a change during the call
+        # does not match the stored result afterwards
+        result = fn(*args, **kwargs)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = _Entry(token, now, result)
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+        return result
@@ -2,12 +2,22 @@
 
 import argparse
 import json
+from pathlib import Path
 
+# some unused imports are needed to trigger registrations of api functions
+import clan_cli.config.schema  # noqa: F401
 from clan_cli.api import API
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Debug the API.")
+    parser.add_argument(
+        "--output", type=Path, help="write the json schema to this file"
+    )
     args = parser.parse_args()
 
     schema = API.to_json_schema()
-    print(json.dumps(schema, indent=4))
+    if args.output is None:
+        print(json.dumps(schema, indent=4))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(schema, f, indent=2)
@@ -7,7 +7,7 @@ from typing import Any, Literal
 from clan_cli.errors import ClanError
 from clan_cli.nix import nix_shell, run_no_stdout
 
-from . import API
+from . import API, ReadCache
 
 
 @dataclass
@@ -51,7 +51,7 @@ class Directory:
     files: list[File] = field(default_factory=list)
 
 
-@API.register
+@API.register(read_only=True)
 def get_directory(current_path: str) -> Directory:
     curr_dir = Path(current_path)
     directory = Directory(path=str(curr_dir))
@@ -123,7 +123,8 @@ class BlockDeviceOptions:
     keyfile: str | None = None
 
 
-@API.register
+# devices are plugged in and out, they are only cached for a moment
+@API.register(cache=ReadCache(ttl=5))
 def show_block_devices(options: BlockDeviceOptions) -> Blockdevices:
     """
     Abstract api method to show block devices.
@@ -46,7 +46,7 @@ def set_single_disk_uuid(
     )
 
 
-@API.register
+@API.register(read_only=True)
 def get_single_disk_uuid(
     base_path: str,
     machine_name: str,
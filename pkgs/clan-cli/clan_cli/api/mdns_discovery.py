@@ -87,7 +87,7 @@ def parse_avahi_output(output: str) -> DNSInfo:
     return dns_info
 
 
-@API.register
+@API.register(read_only=True)
 def show_mdns() -> DNSInfo:
     cmd = nix_shell(
         ["nixpkgs#avahi"],
@@ -7,11 +7,16 @@ from typing import Any, get_args, get_type_hints
 
 from clan_cli.cmd import run_no_stdout
 from clan_cli.errors import ClanCmdError, ClanError
-from clan_cli.inventory import Inventory, load_inventory_json, save_inventory
+from clan_cli.inventory import (
+    INVENTORY_WRITES,
+    Inventory,
+    load_inventory_json,
+    save_inventory,
+)
 from clan_cli.inventory.classes import Service
 from clan_cli.nix import nix_eval
 
-from . import API
+from . import API, ReadCache
 from .serde import from_dict
 
 
@@ -107,7 +112,7 @@ def get_modules(base_path: str) -> dict[str, str]:
     return modules
 
 
-@API.register
+@API.register(cache=ReadCache(flake_arg="base_path"))
 def list_modules(base_path: str) -> dict[str, ModuleInfo]:
     """
     Show information about a module
@@ -153,7 +158,7 @@ def get_module_info(
     )
 
 
-@API.register
+@API.register(cache=ReadCache(invalidate_on=INVENTORY_WRITES, flake_arg="base_path"))
 def get_inventory(base_path: str) -> Inventory:
     return load_inventory_json(base_path)
 
@@ -4,6 +4,7 @@ This module provides utility functions for serialization and deserialization of
 Functions:
 - sanitize_string(s: str) -> str: Ensures a string is properly escaped for json serializing.
 - dataclass_to_dict(obj: Any) -> Any: Converts a data class and its nested data classes, lists, tuples, and dictionaries to dictionaries.
+- dataclass_to_json(obj: Any) -> str: Encodes a data class and its nested values as json.
 - from_dict(t: type[T], data: Any) -> T: Dynamically instantiates a data class from a dictionary, constructing nested data classes, validates all required fields exist and have the expected type.
 
 Classes:
@@ -31,8 +32,10 @@ Note: This module assumes the presence of other modules and classes such as `Cla
 
 import dataclasses
 import json
+from collections.abc import Callable
 from dataclasses import dataclass, fields, is_dataclass
 from pathlib import Path
+from threading import RLock
 from types import UnionType
 from typing import (
     Annotated,
@@ -53,36 +56,119 @@ def sanitize_string(s: str) -> str:
     return json.dumps(s)[1:-1]
 
 
+_PLAIN_TYPES = frozenset({str, int, float, bool, type(None)})
+
+# (dataclass type, use_alias) -> [(attribute name, key)]
+_field_keys: dict[tuple[type, bool], list[tuple[str, str]]] = {}
+# (type, use_alias) -> serializer for values of exactly that type
+_serializers: dict[tuple[type, bool], Callable[[Any], Any]] = {}
+
+
+def _dataclass_keys(t: type, use_alias: bool) -> list[tuple[str, str]]:
+    keys = _field_keys.get((t, use_alias))
+    if keys is None:
+        keys = [
+            # Use either the original name or name
+            (
+                field.name,
+                field.metadata.get("alias", field.name) if use_alias else field.name,
+            )
+            for field in fields(t)
+            if not field.name.startswith("_")
+        ]
+        _field_keys[(t, use_alias)] = keys
+    return keys
+
+
+def _compile_serializer(t: type, use_alias: bool) -> Callable[[Any], Any]:
+    if is_dataclass(t):
+        keys = _dataclass_keys(t, use_alias)
+
+        def serialize_dataclass(obj: Any) -> dict[str, Any]:
+            result = {}
+            for name, key in keys:
+                value = getattr(obj, name)
+                if value is not None:
+                    result[key] = _to_dict(value, use_alias)
+            return result
+
+        return serialize_dataclass
+    if issubclass(t, list | tuple):
+        return lambda obj: [_to_dict(item, use_alias) for item in obj]
+    if issubclass(t, dict):
+        return lambda obj: {k: _to_dict(v, use_alias) for k, v in obj.items()}
+    if issubclass(t, Path):
+        return str
+    return lambda obj: obj
+
+
+def _to_dict(obj: Any, use_alias: bool) -> Any:
+    t = type(obj)
+    if t in _PLAIN_TYPES:
+        return obj
+    serializer = _serializers.get((t, use_alias))
+    if serializer is None:
+        serializer = _compile_serializer(t, use_alias)
+        _serializers[(t, use_alias)] = serializer
+    return serializer(obj)
+
+
 def dataclass_to_dict(obj: Any, *, use_alias: bool = True) -> Any:
-    def _to_dict(obj: Any) -> Any:
-        """
-        Utility function to convert dataclasses to dictionaries
-        It converts all nested dataclasses, lists, tuples, and dictionaries to dictionaries
-
-        It does NOT convert member functions.
-        """
-        if is_dataclass(obj):
+    """
+    Utility function to convert dataclasses to dictionaries
+    It converts all nested dataclasses, lists, tuples, and dictionaries to dictionaries
+
+    It does NOT convert member functions.
+
+    Strings are returned as they are, escaping happens when the result is encoded as json.
+    The conversion of every type is compiled once and cached.
+    """
+    return _to_dict(obj, use_alias)
+
+
+class _DataclassEncoder(json.JSONEncoder):
+    """
+    Lets the json encoder walk the object graph itself.
+    It only calls back for dataclasses, which are converted one level deep, and paths.
+    """
+
+    def __init__(self, *, use_alias: bool, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.use_alias = use_alias
+
+    # FIXME: add this when we switch to python3.12
+    # @override
+    def default(self, o: Any) -> Any:
+        t = type(o)
+        if is_dataclass(t):
             return {
-                # Use either the original name or name
-                sanitize_string(
-                    field.metadata.get("alias", field.name) if use_alias else field.name
-                ): _to_dict(getattr(obj, field.name))
-                for field in fields(obj)
-                if not field.name.startswith("_")
-                and getattr(obj, field.name) is not None  # type: ignore
+                key: value
+                for name, key in _dataclass_keys(t, self.use_alias)
+                if (value := getattr(o, name)) is not None
             }
-        elif isinstance(obj, list | tuple):
-            return [_to_dict(item) for item in obj]
-        elif isinstance(obj, dict):
-            return {sanitize_string(k): _to_dict(v) for k, v in obj.items()}
-        elif isinstance(obj, Path):
-            return sanitize_string(str(obj))
-        elif isinstance(obj, str):
-            return sanitize_string(obj)
-        else:
-            return obj
+        if isinstance(o, Path):
+            return str(o)
+        return super().default(o)
 
-    return _to_dict(obj)
+
+_encoders: dict[bool, _DataclassEncoder] = {}
+
+
+def dataclass_to_json(
+    obj: Any, *, use_alias: bool = True, indent: int | None = None
+) -> str:
+    """
+    Encodes dataclasses as json, equivalent to json.dumps(dataclass_to_dict(obj)).
+    Without indentation the C accelerated encoder of the json module is used directly,
+    no intermediate dictionaries are built for anything but dataclasses.
+    """
+    if indent is None and json.encoder.c_make_encoder is not None:  # type: ignore
+        encoder = _encoders.get(use_alias)
+        if encoder is None:
+            encoder = _DataclassEncoder(use_alias=use_alias)
+            _encoders[use_alias] = encoder
+        return encoder.encode(obj)
+    return json.dumps(dataclass_to_dict(obj, use_alias=use_alias), indent=indent)
 
 
 T = TypeVar("T", bound=dataclass)  # type: ignore
@@ -128,6 +214,10 @@ def construct_value(t: type, field_value: JsonValue, loc: list[str] = []) -> Any
     if t is None and field_value:
         raise ClanError(f"Expected None but got: {field_value}", location=f"{loc}")
 
+    # Arbitrary json, i.e. the values of dict[str, Any]
+    if t is Any:
+        return field_value
+
     if is_type_in_union(t, type(None)) and field_value is None:
         # Sometimes the field value is None, which is valid if the type hint allows None
         return None
@@ -250,10 +340,322 @@ def construct_dataclass(t: type[T], data: dict[str, Any], path: list[str] = [])
     return t(**field_values)  # type: ignore
 
 
+# A compiled conversion of a json value to a type hint: (value, location) -> value
+Plan = Callable[[Any, list[str]], Any]
+
+
+class _CompiledPlan:
+    """
+    Holder of a compiled plan, created before compiling nested types
+    so that recursive dataclasses refer to their own plan.
+    """
+
+    __slots__ = ("convert",)
+
+    def __init__(self) -> None:
+        self.convert: Plan = _unset_plan
+
+
+def _unset_plan(value: Any, loc: list[str]) -> Any:
+    raise RuntimeError("plan used before it was compiled")
+
+
+_value_plans: dict[Any, _CompiledPlan] = {}
+_dataclass_plans: dict[Any, _CompiledPlan] = {}
+
+# Plans are compiled by one thread at a time. Plans being compiled are only
+# visible to the compiling thread, they are published to the caches
+# once the outermost plan is complete, so other threads never see a plan
+# before it is compiled.
+_compile_lock = RLock()
+# (id of the cache, type) -> (cache, type, plan), in the order compiling started
+_pending: dict[
+    tuple[int, Any], tuple[dict[Any, _CompiledPlan], Any, _CompiledPlan]
+] = {}
+
+
+def _cached_plan(
+    cache: dict[Any, _CompiledPlan], t: Any, compile_plan: Callable[[Any], Plan]
+) -> _CompiledPlan:
+    try:
+        plan = cache.get(t)
+    except TypeError:
+        # unhashable type hint, compile it every time
+        plan = _CompiledPlan()
+        plan.convert = compile_plan(t)
+        return plan
+    if plan is not None:
+        return plan
+    with _compile_lock:
+        # compiled by another thread in the meantime
+        plan = cache.get(t)
+        if plan is not None:
+            return plan
+        key = (id(cache), t)
+        pending = _pending.get(key)
+        if pending is not None:
+            # a recursive reference to a plan compiled further up
+            return pending[2]
+        outermost = not _pending
+        started = len(_pending)
+        plan = _CompiledPlan()
+        _pending[key] = (cache, t, plan)
+        try:
+            plan.convert = compile_plan(t)
+        except BaseException:
+            # drop the plan and the nested ones, which may refer to it
+            for nested in list(_pending)[started:]:
+                del _pending[nested]
+            raise
+        if outermost:
+            for pending_cache, pending_type, pending_plan in _pending.values():
+                pending_cache[pending_type] = pending_plan
+            _pending.clear()
+    return plan
+
+
+def value_plan(t: Any) -> _CompiledPlan:
+    """
+    Returns the cached plan to construct a value of type t,
+    equivalent to construct_value(t, value, loc).
+    """
+    return _cached_plan(_value_plans, t, _compile_value)
+
+
+def dataclass_plan(t: Any) -> _CompiledPlan:
+    """
+    Returns the cached plan to construct the dataclass t,
+    equivalent to construct_dataclass(t, data, path).
+    """
+    return _cached_plan(_dataclass_plans, t, _compile_dataclass)
+
+
+def _compile_value(t: Any) -> Plan:
+    """
+    Resolve all checks of construct_value that only depend on the type once.
+    The remaining checks run in the same order with the same errors.
+    Types whose checks fail are handled by construct_value itself.
+    """
+    if t is Any:
+        return lambda value, loc: value
+
+    try:
+        allows_none = is_type_in_union(t, type(None))
+        is_dc = is_dataclass(t)
+        is_path = is_type_in_union(t, Path)
+        is_union = is_union_type(t)
+        origin = get_origin(t)
+    except Exception:
+        return lambda value, loc: construct_value(t, value, loc)
+
+    def unhandled(value: Any, loc: list[str]) -> Any:
+        raise ClanError(f"Unhandled field type {t} with value {value}")
+
+    # the branches of construct_value from the first one that can match,
+    # a branch whose guard fails falls through to the next one
+    convert: Plan = unhandled
+    if is_path:
+
+        def convert(value: Any, loc: list[str]) -> Any:
+            if not isinstance(value, str):
+                raise ClanError(
+                    f"Expected string, cannot construct pathlib.Path() from: {value} ",
+                    location=f"{loc}",
+                )
+            return Path(value)
+
+    elif t is str:
+
+        def convert(value: Any, loc: list[str]) -> Any:
+            if not isinstance(value, str):
+                raise ClanError(f"Expected string, got {value}", location=f"{loc}")
+            return value
+
+    elif t is int or t is float:
+        number = t
+
+        def convert(value: Any, loc: list[str]) -> Any:
+            if isinstance(value, str):
+                return unhandled(value, loc)
+            return number(value)
+
+    elif t is bool:
+
+        def convert(value: Any, loc: list[str]) -> Any:
+            if isinstance(value, bool):
+                return value
+            return unhandled(value, loc)
+
+    elif is_union:
+        try:
+            inner = value_plan(unwrap_none_type(t))
+        except Exception:
+            return lambda value, loc: construct_value(t, value, loc)
+
+        def convert(value: Any, loc: list[str]) -> Any:
+            return inner.convert(value, [])
+
+    elif origin is list:
+        item = value_plan(get_args(t)[0])
+
+        def convert(value: Any, loc: list[str]) -> Any:
+            if not isinstance(value, list):
+                raise ClanError(f"Expected list, got {value}", location=f"{loc}")
+            item_convert = item.convert
+            return [item_convert(v, []) for v in value]
+
+    elif origin is dict:
+        dict_value = value_plan(get_args(t)[1])
+
+        def convert(value: Any, loc: list[str]) -> Any:
+            if not isinstance(value, dict):
+                return unhandled(value, loc)
+            value_convert = dict_value.convert
+            return {k: value_convert(v, []) for k, v in value.items()}
+
+    elif origin is Literal:
+        valid_values = get_args(t)
+
+        def convert(value: Any, loc: list[str]) -> Any:
+            if value not in valid_values:
+                raise ClanError(
+                    f"Expected one of {valid_values}, got {value}", location=f"{loc}"
+                )
+            return value
+
+    elif origin is Annotated:
+
+        def convert(value: Any, loc: list[str]) -> Any:
+            (base_type,) = get_args(t)
+            return value_plan(base_type).convert(value, [])
+
+    if is_dc:
+        fallback = convert
+        dc = dataclass_plan(t)
+
+        def convert(value: Any, loc: list[str]) -> Any:
+            if isinstance(value, dict):
+                return dc.convert(value, [])
+            return fallback(value, loc)
+
+    if allows_none:
+        not_none = convert
+
+        def convert(value: Any, loc: list[str]) -> Any:
+            if value is None:
+                return None
+            return not_none(value, loc)
+
+    if t is None:
+        not_falsy = convert
+
+        def convert(value: Any, loc: list[str]) -> Any:
+            if value:
+                raise ClanError(f"Expected None but got: {value}", location=f"{loc}")
+            return not_falsy(value, loc)
+
+    return convert
+
+
+class _FieldPlan:
+    __slots__ = ("alias", "name", "none_allowed", "plan", "type")
+
+    def __init__(
+        self,
+        name: str,
+        alias: str,
+        plan: _CompiledPlan,
+        none_allowed: bool | None,
+        field_type: Any,
+    ) -> None:
+        self.name = name
+        self.alias = alias
+        self.plan = plan
+        # None if it has to be checked like construct_dataclass does for every value
+        self.none_allowed = none_allowed
+        self.type = field_type
+
+
+def _compile_dataclass(t: Any) -> Plan:
+    """
+    Resolve the fields, aliases and types of the dataclass once.
+    Dataclasses whose fields cannot be resolved are handled by construct_dataclass itself.
+    """
+    if not is_dataclass(t):
+
+        def not_a_dataclass(data: Any, path: list[str]) -> Any:
+            raise ClanError(f"{t.__name__} is not a dataclass")
+
+        return not_a_dataclass
+
+    cls: Any = t
+    try:
+        field_plans = []
+        required = []
+        for field in fields(cls):
+            if field.name.startswith("_"):
+                continue
+            field_type = unwrap_none_type(field.type)  # type: ignore
+            if (
+                field.default is dataclasses.MISSING
+                and field.default_factory is dataclasses.MISSING
+            ):
+                required.append(field.name)
+            try:
+                none_allowed: bool | None = field.type is None or is_type_in_union(
+                    field.type,  # type: ignore
+                    type(None),
+                )
+            except Exception:
+                none_allowed = None
+            field_plans.append(
+                _FieldPlan(
+                    field.name,
+                    field.metadata.get("alias", field.name),
+                    value_plan(field_type),
+                    none_allowed,
+                    field.type,
+                )
+            )
+    except Exception:
+        return lambda data, path: construct_dataclass(cls, data, path)
+
+    def convert(data: dict[str, Any], path: list[str]) -> Any:
+        field_values: dict[str, Any] = {}
+        for field_plan in field_plans:
+            if field_plan.alias not in data:
+                continue
+            field_value = data[field_plan.alias]
+            if field_value is None:
+                none_allowed = field_plan.none_allowed
+                if none_allowed is None:
+                    none_allowed = is_type_in_union(field_plan.type, type(None))
+                if none_allowed:
+                    field_values[field_plan.name] = None
+                    continue
+            field_values[field_plan.name] = field_plan.plan.convert(field_value, [])
+
+        # Check that all required field are present.
+        for field_name in required:
+            if field_name not in field_values:
+                formatted_path = " ".join(path)
+                raise ClanError(
+                    f"Default value missing for: '{field_name}' in {cls} {formatted_path}, got Value: {data}"
+                )
+
+        return cls(**field_values)
+
+    return convert
+
+
 def from_dict(t: type[G], data: dict[str, Any] | Any, path: list[str] = []) -> G:
+    """
+    Construct t from json data, validating types and required fields.
+    The conversion of each type is compiled on first use and cached.
+    """
     if is_dataclass(t):
         if not isinstance(data, dict):
             raise ClanError(f"{data} is not a dict. Expected {t}")
-        return construct_dataclass(t, data, path)  # type: ignore
+        return dataclass_plan(t).convert(data, path)
     else:
-        return construct_value(t, data, path)
+        return value_plan(t).convert(data, path)
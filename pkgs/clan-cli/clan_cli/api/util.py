@@ -103,7 +103,8 @@ def type_to_dict(t: Any, scope: str = "", type_map: dict[TypeVar, type] = {}) ->
         return {
             "type": "object",
             "properties": properties,
-            "required": list(intersection),
+            # in the order of the fields, the generated schema is reproducible
+            "required": [pn for pn in properties if pn in intersection],
             # Dataclasses can only have the specified properties
             "additionalProperties": False,
         }
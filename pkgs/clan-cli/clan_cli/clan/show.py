@@ -4,9 +4,9 @@ import logging
 from pathlib import Path
 from urllib.parse import urlparse
 
-from clan_cli.api import API
+from clan_cli.api import API, ReadCache
 from clan_cli.errors import ClanCmdError, ClanError
-from clan_cli.inventory import Meta
+from clan_cli.inventory import INVENTORY_WRITES, Meta
 
 from ..cmd import run_no_stdout
 from ..nix import nix_eval
@@ -14,7 +14,7 @@ from ..nix import nix_eval
 log = logging.getLogger(__name__)
 
 
-@API.register
+@API.register(cache=ReadCache(invalidate_on=INVENTORY_WRITES, flake_arg="uri"))
 def show_clan_meta(uri: str | Path) -> Meta:
     cmd = nix_eval(
         [
@@ -55,6 +55,17 @@ def clan_templates() -> Path:
         return template_path
 
 
+def secrets_staging_dir() -> Path | None:
+    """
+    A memory backed directory to stage decrypted secrets in before they are
+    uploaded, so that they never hit the disk. None if there is no such directory.
+    """
+    for candidate in [os.environ.get("XDG_RUNTIME_DIR"), "/dev/shm"]:
+        if candidate and os.path.isdir(candidate) and os.access(candidate, os.W_OK):
+            return Path(candidate)
+    return None
+
+
 def user_config_dir() -> Path:
     if sys.platform == "win32":
         return Path(os.getenv("APPDATA", os.path.expanduser("~\\AppData\\Roaming\\")))
@@ -8,11 +8,25 @@ from ..machines.machines import Machine
 log = logging.getLogger(__name__)
 
 
-def check_secrets(machine: Machine, service: None | str = None) -> bool:
-    secret_facts_module = importlib.import_module(machine.secret_facts_module)
-    secret_facts_store = secret_facts_module.SecretStore(machine=machine)
-    public_facts_module = importlib.import_module(machine.public_facts_module)
-    public_facts_store = public_facts_module.FactStore(machine=machine)
+def check_secrets(
+    machine: Machine,
+    service: None | str = None,
+    existing_secret_facts: set[tuple[str, str]] | None = None,
+    existing_public_facts: set[tuple[str, str]] | None = None,
+) -> bool:
+    """
+    Check that all facts of the services exist.
+    The existing facts are listed once per store,
+    callers checking many services can pass them in.
+    """
+    if existing_secret_facts is None:
+        secret_facts_module = importlib.import_module(machine.secret_facts_module)
+        secret_facts_store = secret_facts_module.SecretStore(machine=machine)
+        existing_secret_facts = secret_facts_store.list_existing()
+    if existing_public_facts is None:
+        public_facts_module = importlib.import_module(machine.public_facts_module)
+        public_facts_store = public_facts_module.FactStore(machine=machine)
+        existing_public_facts = public_facts_store.list_existing()
 
     missing_secret_facts = []
     missing_public_facts = []
@@ -26,14 +40,14 @@ def check_secrets(machine: Machine, service: None | str = None) -> bool:
                 secret_name = secret_fact
             else:
                 secret_name = secret_fact["name"]
-            if not secret_facts_store.exists(service, secret_name):
+            if (service, secret_name) not in existing_secret_facts:
                 log.info(
                     f"Secret fact '{secret_fact}' for service '{service}' in machine {machine.name} is missing."
                 )
                 missing_secret_facts.append((service, secret_name))
 
         for public_fact in machine.facts_data[service]["public"]:
-            if not public_facts_store.exists(service, public_fact):
+            if (service, public_fact) not in existing_public_facts:
                 log.info(
                     f"Public fact '{public_fact}' for service '{service}' in machine {machine.name} is missing."
                 )
@@ -16,10 +16,11 @@ from ..completions import (
     complete_services_for_machine,
 )
 from ..errors import ClanError
-from ..git import commit_files
+from ..git import commit_files, transaction
 from ..machines.inventory import get_all_machines, get_selected_machines
 from ..machines.machines import Machine
 from ..nix import nix_shell
+from ..vars.scheduler import run_in_dependency_order
 from .check import check_secrets
 from .public_modules import FactStoreBase
 from .secret_modules import SecretStoreBase
@@ -69,10 +70,17 @@ def generate_service_facts(
     public_facts_store: FactStoreBase,
     tmpdir: Path,
     prompt: Callable[[str], str],
+    existing_secret_facts: set[tuple[str, str]] | None = None,
+    existing_public_facts: set[tuple[str, str]] | None = None,
 ) -> bool:
     service_dir = tmpdir / service
     # check if all secrets exist and generate them if at least one is missing
-    needs_regeneration = not check_secrets(machine, service=service)
+    needs_regeneration = not check_secrets(
+        machine,
+        service=service,
+        existing_secret_facts=existing_secret_facts,
+        existing_public_facts=existing_public_facts,
+    )
     log.debug(f"{service} needs_regeneration: {needs_regeneration}")
     if not (needs_regeneration or regenerate):
         return False
@@ -142,48 +150,32 @@ def prompt_func(text: str) -> str:
     return read_multiline_input()
 
 
-def _generate_facts_for_machine(
-    machine: Machine,
-    service: str | None,
-    regenerate: bool,
-    tmpdir: Path,
-    prompt: Callable[[str], str] = prompt_func,
-) -> bool:
-    local_temp = tmpdir / machine.name
-    local_temp.mkdir()
-    secret_facts_module = importlib.import_module(machine.secret_facts_module)
-    secret_facts_store = secret_facts_module.SecretStore(machine=machine)
-
-    public_facts_module = importlib.import_module(machine.public_facts_module)
-    public_facts_store = public_facts_module.FactStore(machine=machine)
-
-    machine_updated = False
-
+def _machine_services(machine: Machine, service: str | None) -> list[str]:
     if service and service not in machine.facts_data:
         services = list(machine.facts_data.keys())
         raise ClanError(
             f"Could not find service with name: {service}. The following services are available: {services}"
         )
-
     if service:
-        machine_service_facts = {service: machine.facts_data[service]}
-    else:
-        machine_service_facts = machine.facts_data
-
-    for service in machine_service_facts:
-        machine_updated |= generate_service_facts(
-            machine=machine,
-            service=service,
-            regenerate=regenerate,
-            secret_facts_store=secret_facts_store,
-            public_facts_store=public_facts_store,
-            tmpdir=local_temp,
-            prompt=prompt,
-        )
-    if machine_updated:
-        # flush caches to make sure the new secrets are available in evaluation
-        machine.flush_caches()
-    return machine_updated
+        return [service]
+    return list(machine.facts_data)
+
+
+def _needs_prompt(
+    machine: Machine,
+    service: str,
+    regenerate: bool,
+    existing: tuple[set[tuple[str, str]], set[tuple[str, str]]],
+) -> bool:
+    generator = machine.facts_data[service]["generator"]
+    if isinstance(generator, str) or not generator["prompt"]:
+        return False
+    return regenerate or not check_secrets(
+        machine,
+        service=service,
+        existing_secret_facts=existing[0],
+        existing_public_facts=existing[1],
+    )
 
 
 def generate_facts(
@@ -191,29 +183,94 @@ def generate_facts(
     service: str | None,
     regenerate: bool,
     prompt: Callable[[str], str] = prompt_func,
+    max_workers: int | None = None,
 ) -> bool:
-    was_regenerated = False
+    """
+    Run the fact generators of all machines and services in a pool of
+    max_workers threads. Prompts are asked before any generator runs and
+    the generated files are committed once at the end.
+    """
+    tasks: dict[tuple[str, str], set[tuple[str, str]]] = {}
+    by_name: dict[str, Machine] = {}
+    stores: dict[str, tuple[SecretStoreBase, FactStoreBase]] = {}
+    # facts that exist before any generator runs, listed once per machine
+    existing: dict[str, tuple[set[tuple[str, str]], set[tuple[str, str]]]] = {}
+    prompt_values: dict[tuple[str, str], str] = {}
+    errors: list[BaseException] = []
+    for machine in machines:
+        try:
+            services = _machine_services(machine, service)
+            # creating the stores may add the machine key, do it before running
+            # generators concurrently
+            secret_facts_module = importlib.import_module(machine.secret_facts_module)
+            public_facts_module = importlib.import_module(machine.public_facts_module)
+            secret_facts_store = secret_facts_module.SecretStore(machine=machine)
+            public_facts_store = public_facts_module.FactStore(machine=machine)
+            stores[machine.name] = (secret_facts_store, public_facts_store)
+            existing[machine.name] = (
+                secret_facts_store.list_existing(),
+                public_facts_store.list_existing(),
+            )
+            for machine_service in services:
+                if _needs_prompt(
+                    machine, machine_service, regenerate, existing[machine.name]
+                ):
+                    prompt_values[(machine.name, machine_service)] = prompt(
+                        machine.facts_data[machine_service]["generator"]["prompt"]
+                    )
+        except Exception as exc:
+            log.error(f"Failed to generate facts for {machine.name}: {exc}")
+            errors.append(exc)
+            continue
+        by_name[machine.name] = machine
+        for machine_service in services:
+            tasks[(machine.name, machine_service)] = set()
+
+    updated_machines: set[str] = set()
+
     with TemporaryDirectory() as tmp:
         tmpdir = Path(tmp)
 
-        for machine in machines:
-            errors = 0
-            try:
-                was_regenerated |= _generate_facts_for_machine(
-                    machine, service, regenerate, tmpdir, prompt
-                )
-            except (OSError, ClanError) as exc:
-                log.error(f"Failed to generate facts for {machine.name}: {exc}")
-                errors += 1
-            if errors > 0:
-                msg = (
-                    f"Failed to generate facts for {errors} hosts. Check the logs above"
-                )
-                raise ClanError(msg)
-
-    if not was_regenerated:
+        def execute(task: tuple[str, str]) -> None:
+            machine_name, machine_service = task
+            secret_facts_store, public_facts_store = stores[machine_name]
+            local_temp = tmpdir / machine_name
+            local_temp.mkdir(exist_ok=True)
+
+            def prompt_once(text: str) -> str:
+                if task in prompt_values:
+                    return prompt_values[task]
+                return prompt(text)
+
+            if generate_service_facts(
+                machine=by_name[machine_name],
+                service=machine_service,
+                regenerate=regenerate,
+                secret_facts_store=secret_facts_store,
+                public_facts_store=public_facts_store,
+                tmpdir=local_temp,
+                prompt=prompt_once,
+                existing_secret_facts=existing[machine_name][0],
+                existing_public_facts=existing[machine_name][1],
+            ):
+                updated_machines.add(machine_name)
+
+        with transaction("Update facts"):
+            failed = run_in_dependency_order(tasks, execute, max_workers)
+        errors.extend(failed.values())
+
+    for machine_name in updated_machines:
+        # flush caches to make sure the new secrets are available in evaluation
+        by_name[machine_name].flush_caches()
+
+    if len(errors) > 0:
+        raise ClanError(
+            f"Failed to generate facts for {len(errors)} services. Check the logs above"
+        ) from errors[0]
+
+    if not updated_machines:
         print("All secrets and facts are already up to date")
-    return was_regenerated
+    return len(updated_machines) > 0
 
 
 def generate_command(args: argparse.Namespace) -> None:
@@ -221,7 +278,7 @@ def generate_command(args: argparse.Namespace) -> None:
         machines = get_all_machines(args.flake, args.option)
     else:
         machines = get_selected_machines(args.flake, args.option, args.machines)
-    generate_facts(machines, args.service, args.regenerate)
+    generate_facts(machines, args.service, args.regenerate, max_workers=args.jobs)
 
 
 def register_generate_parser(parser: argparse.ArgumentParser) -> None:
@@ -249,4 +306,11 @@ def register_generate_parser(parser: argparse.ArgumentParser) -> None:
         help="whether to regenerate facts for the specified machine",
         default=None,
     )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=None,
+        help="the number of generators to run in parallel, defaults to the number of cpus",
+    )
     parser.set_defaults(func=generate_command)
@@ -1,10 +1,13 @@
 from abc import ABC, abstractmethod
+from collections.abc import Iterator
 from pathlib import Path
 
 from clan_cli.machines.machines import Machine
 
 
 class FactStoreBase(ABC):
+    machine: Machine
+
     @abstractmethod
     def __init__(self, machine: Machine) -> None:
         pass
@@ -13,6 +16,25 @@ class FactStoreBase(ABC):
     def exists(self, service: str, name: str) -> bool:
         pass
 
+    def declared_facts(self) -> Iterator[tuple[str, str]]:
+        """
+        (service, name) of all public facts of the machine
+        """
+        for service, service_data in self.machine.facts_data.items():
+            for public_fact in service_data["public"]:
+                yield service, public_fact
+
+    def list_existing(self) -> set[tuple[str, str]]:
+        """
+        (service, name) of all public facts of the machine that exist.
+        Stores should override this to look them up at once.
+        """
+        return {
+            (service, name)
+            for service, name in self.declared_facts()
+            if self.exists(service, name)
+        }
+
     @abstractmethod
     def set(self, service: str, name: str, value: bytes) -> Path | None:
         pass
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 from clan_cli.errors import ClanError
@@ -11,6 +12,16 @@ class FactStore(FactStoreBase):
         self.machine = machine
         self.works_remotely = False
 
+    def list_existing(self) -> set[tuple[str, str]]:
+        facts_folder = self.machine.flake_dir / "machines" / self.machine.name / "facts"
+        try:
+            names = set(os.listdir(facts_folder))
+        except FileNotFoundError:
+            names = set()
+        return {
+            (service, name) for service, name in self.declared_facts() if name in names
+        }
+
     def set(self, service: str, name: str, value: bytes) -> Path | None:
         if self.machine.flake.is_local():
             fact_path = (
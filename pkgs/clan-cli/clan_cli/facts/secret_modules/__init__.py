@@ -1,14 +1,39 @@
 from abc import ABC, abstractmethod
+from collections.abc import Iterator
 from pathlib import Path
 
 from clan_cli.machines.machines import Machine
 
 
 class SecretStoreBase(ABC):
+    machine: Machine
+
     @abstractmethod
     def __init__(self, machine: Machine) -> None:
         pass
 
+    def declared_facts(self) -> Iterator[tuple[str, str]]:
+        """
+        (service, name) of all secret facts of the machine
+        """
+        for service, service_data in self.machine.facts_data.items():
+            for secret_fact in service_data["secret"]:
+                if isinstance(secret_fact, str):
+                    yield service, secret_fact
+                else:
+                    yield service, secret_fact["name"]
+
+    def list_existing(self) -> set[tuple[str, str]]:
+        """
+        (service, name) of all secret facts of the machine that exist.
+        Stores should override this to look them up at once.
+        """
+        return {
+            (service, name)
+            for service, name in self.declared_facts()
+            if self.exists(service, name)
+        }
+
     @abstractmethod
     def set(
         self, service: str, name: str, value: bytes, groups: list[str]
@@ -1,17 +1,53 @@
+import logging
 import os
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from clan_cli.git import last_commits, worktree_files
 from clan_cli.machines.machines import Machine
 from clan_cli.nix import nix_shell
+from clan_cli.secrets.secret_cache import cached_decrypt
 
 from . import SecretStoreBase
 
+log = logging.getLogger(__name__)
+
 
 class SecretStore(SecretStoreBase):
+    # number of secrets decrypted concurrently on upload
+    max_workers = 8
+    # decrypt one secret before the others to unlock gpg-agent
+    preheat_agent = True
+
     def __init__(self, machine: Machine) -> None:
         self.machine = machine
 
+    def list_existing(self) -> set[tuple[str, str]]:
+        """
+        Lists the secrets of the machine with git ls-files,
+        walks the folder if the password store is no git repo.
+        """
+        password_store = Path(
+            os.environ.get(
+                "PASSWORD_STORE_DIR", f"{os.environ['HOME']}/.password-store"
+            )
+        )
+        machine_folder = f"machines/{self.machine.name}"
+        present = worktree_files(password_store, machine_folder)
+        if present is None:
+            present = set()
+            for root, _, files in os.walk(password_store / machine_folder):
+                present.update(
+                    Path(root, file).relative_to(password_store) for file in files
+                )
+        return {
+            (service, name)
+            for service, name in self.declared_facts()
+            if Path(f"{machine_folder}/{name}.gpg") in present
+        }
+
     def set(
         self, service: str, name: str, value: bytes, groups: list[str]
     ) -> Path | None:
@@ -26,14 +62,24 @@ class SecretStore(SecretStoreBase):
         return None  # we manage the files outside of the git repo
 
     def get(self, service: str, name: str) -> bytes:
-        return subprocess.run(
-            nix_shell(
-                ["nixpkgs#pass"],
-                ["pass", "show", f"machines/{self.machine.name}/{name}"],
-            ),
-            check=True,
-            stdout=subprocess.PIPE,
-        ).stdout
+        def decrypt() -> bytes:
+            return subprocess.run(
+                nix_shell(
+                    ["nixpkgs#pass"],
+                    ["pass", "show", f"machines/{self.machine.name}/{name}"],
+                ),
+                check=True,
+                stdout=subprocess.PIPE,
+            ).stdout
+
+        password_store = os.environ.get(
+            "PASSWORD_STORE_DIR", f"{os.environ['HOME']}/.password-store"
+        )
+        return cached_decrypt(
+            Path(password_store) / f"machines/{self.machine.name}/{name}.gpg",
+            decrypt,
+            os.environ.get("GNUPGHOME", ""),
+        )
 
     def exists(self, service: str, name: str) -> bool:
         password_store = os.environ.get(
@@ -46,43 +92,13 @@ class SecretStore(SecretStoreBase):
         password_store = os.environ.get(
             "PASSWORD_STORE_DIR", f"{os.environ['HOME']}/.password-store"
         )
-        hashes = []
-        hashes.append(
-            subprocess.run(
-                nix_shell(
-                    ["nixpkgs#git"],
-                    [
-                        "git",
-                        "-C",
-                        password_store,
-                        "log",
-                        "-1",
-                        "--format=%H",
-                        f"machines/{self.machine.name}",
-                    ],
-                ),
-                stdout=subprocess.PIPE,
-            ).stdout.strip()
-        )
-        for symlink in Path(password_store).glob(f"machines/{self.machine.name}/**/*"):
+        machine_folder = f"machines/{self.machine.name}"
+        last_commit, file_commits = last_commits(Path(password_store), machine_folder)
+        hashes = [last_commit.encode()]
+        for symlink in Path(password_store).glob(f"{machine_folder}/**/*"):
             if symlink.is_symlink():
-                hashes.append(
-                    subprocess.run(
-                        nix_shell(
-                            ["nixpkgs#git"],
-                            [
-                                "git",
-                                "-C",
-                                password_store,
-                                "log",
-                                "-1",
-                                "--format=%H",
-                                str(symlink),
-                            ],
-                        ),
-                        stdout=subprocess.PIPE,
-                    ).stdout.strip()
-                )
+                path = str(symlink.relative_to(password_store))
+                hashes.append(file_commits.get(path, "").encode())
 
         # we sort the hashes to make sure that the order is always the same
         hashes.sort()
@@ -106,6 +122,7 @@ class SecretStore(SecretStoreBase):
         return local_hash.decode() == remote_hash
 
     def upload(self, output_dir: Path) -> None:
+        secrets = []
         for service in self.machine.facts_data:
             for secret in self.machine.facts_data[service]["secret"]:
                 if isinstance(secret, dict):
@@ -113,5 +130,31 @@ class SecretStore(SecretStoreBase):
                 else:
                     # TODO: drop old format soon
                     secret_name = secret
-                (output_dir / secret_name).write_bytes(self.get(service, secret_name))
+                secrets.append((service, secret_name))
+
+        def decrypt(service: str, secret_name: str) -> None:
+            start = time.monotonic()
+            value = self.get(service, secret_name)
+            fd = os.open(
+                output_dir / secret_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600
+            )
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            log.debug(
+                f"Decrypted {secret_name} in {(time.monotonic() - start) * 1000:.0f}ms"
+            )
+
+        count = len(secrets)
+        start = time.monotonic()
+        if secrets and self.preheat_agent:
+            # the first decryption asks for the passphrase, gpg-agent caches it
+            # for the concurrent ones, so that their pinentry prompts do not race
+            decrypt(*secrets.pop(0))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(decrypt, *secret) for secret in secrets]
+            for future in futures:
+                future.result()
+        log.info(
+            f"Decrypted {count} secrets of {self.machine.name} in {time.monotonic() - start:.1f}s"
+        )
         (output_dir / ".pass_info").write_bytes(self.generate_hash())
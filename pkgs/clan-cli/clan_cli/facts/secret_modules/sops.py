@@ -2,9 +2,15 @@ from pathlib import Path
 
 from clan_cli.machines.machines import Machine
 from clan_cli.secrets.folders import sops_secrets_folder
+from clan_cli.secrets.key_index import get_key_index
 from clan_cli.secrets.machines import add_machine, has_machine
 from clan_cli.secrets.secrets import decrypt_secret, encrypt_secret, has_secret
 from clan_cli.secrets.sops import generate_private_key
+from clan_cli.secrets.upload_manifest import (
+    remote_manifest_matches,
+    upload_manifest,
+    write_manifest,
+)
 
 from . import SecretStoreBase
 
@@ -31,6 +37,15 @@ class SecretStore(SecretStoreBase):
         )
         add_machine(self.machine.flake_dir, self.machine.name, pub_key, False)
 
+    def list_existing(self) -> set[tuple[str, str]]:
+        # the secrets of all machines are listed once with the shared key index
+        index = get_key_index(self.machine.flake_dir)
+        return {
+            (service, name)
+            for service, name in self.declared_facts()
+            if index.has_secret(f"{self.machine.name}-{name}")
+        }
+
     def set(
         self, service: str, name: str, value: bytes, groups: list[str]
     ) -> Path | None:
@@ -57,6 +72,13 @@ class SecretStore(SecretStoreBase):
             sops_secrets_folder(self.machine.flake_dir) / f"{self.machine.name}-{name}",
         )
 
+    # FIXME: add this when we switch to python3.12
+    # @override
+    def update_check(self) -> bool:
+        return remote_manifest_matches(
+            self.machine, upload_manifest(self.machine.flake_dir, self.machine.name)
+        )
+
     def upload(self, output_dir: Path) -> None:
         key_name = f"{self.machine.name}-age.key"
         if not has_secret(sops_secrets_folder(self.machine.flake_dir) / key_name):
@@ -67,3 +89,6 @@ class SecretStore(SecretStoreBase):
             sops_secrets_folder(self.machine.flake_dir) / key_name,
         )
         (output_dir / "key.txt").write_text(key)
+        write_manifest(
+            output_dir, upload_manifest(self.machine.flake_dir, self.machine.name)
+        )
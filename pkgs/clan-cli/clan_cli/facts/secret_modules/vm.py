@@ -14,6 +14,16 @@ class SecretStore(SecretStoreBase):
         self.dir = vm_state_dir(str(machine.flake), machine.name) / "secrets"
         self.dir.mkdir(parents=True, exist_ok=True)
 
+    def list_existing(self) -> set[tuple[str, str]]:
+        present: set[Path] = set()
+        for root, _, files in os.walk(self.dir):
+            present.update(Path(root, file) for file in files)
+        return {
+            (service, name)
+            for service, name in self.declared_facts()
+            if self.dir / service / name in present
+        }
+
     def set(
         self, service: str, name: str, value: bytes, groups: list[str]
     ) -> Path | None:
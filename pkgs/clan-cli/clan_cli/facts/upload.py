@@ -6,6 +6,7 @@ from tempfile import TemporaryDirectory
 
 from ..cmd import Log, run
 from ..completions import add_dynamic_completer, complete_machines
+from ..dirs import secrets_staging_dir
 from ..machines.machines import Machine
 from ..nix import nix_shell
 
@@ -19,7 +20,7 @@ def upload_secrets(machine: Machine) -> None:
     if secret_facts_store.update_check():
         log.info("Secrets already up to date")
         return
-    with TemporaryDirectory() as tempdir:
+    with TemporaryDirectory(dir=secrets_staging_dir()) as tempdir:
         secret_facts_store.upload(Path(tempdir))
         host = machine.target_host
 
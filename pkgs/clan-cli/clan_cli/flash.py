@@ -11,7 +11,7 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 from typing import Any
 
-from clan_cli.api import API
+from clan_cli.api import API, ReadCache
 
 from .clan_uri import FlakeId
 from .cmd import Log, run
@@ -38,7 +38,7 @@ class SystemConfig:
     wifi_settings: list[WifiConfig] | None = field(default=None)
 
 
-@API.register
+@API.register(cache=ReadCache())
 def list_possible_keymaps() -> list[str]:
     cmd = nix_build(["nixpkgs#kbd"])
     result = run(cmd, log=Log.STDERR, error_msg="Failed to find kbdinfo")
@@ -59,7 +59,7 @@ def list_possible_keymaps() -> list[str]:
     return keymap_files
 
 
-@API.register
+@API.register(cache=ReadCache())
 def list_possible_languages() -> list[str]:
     cmd = nix_build(["nixpkgs#glibcLocales"])
     result = run(cmd, log=Log.STDERR, error_msg="Failed to find glibc locales")
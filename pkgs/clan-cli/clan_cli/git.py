@@ -1,4 +1,14 @@
+import contextlib
+import hashlib
+import logging
+import os
+import shutil
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
 
 # from clan_cli.dirs import find_git_repo_root
 from clan_cli.errors import ClanError
@@ -7,6 +17,241 @@ from clan_cli.nix import run_cmd
 from .cmd import Log, run
 from .locked_open import locked_open
 
+log = logging.getLogger(__name__)
+
+
+def git_command(repo_dir: Path, *args: str) -> list[str]:
+    """
+    Returns a git command for the repository.
+    git from PATH is used when available instead of spawning it through nix.
+    """
+    cmd = ["git", "-C", str(repo_dir), *args]
+    if shutil.which("git"):
+        return cmd
+    return run_cmd(["git"], cmd)
+
+
+def last_commits(repo_dir: Path, path: str) -> tuple[str, dict[str, str]]:
+    """
+    Returns the last commit that changed path and the last commit of every
+    file below it, relative to repo_dir, like git log -1 --full-history
+    does for each of them. A single git log is used instead of one per file.
+    Both are empty if repo_dir is no git repository.
+    """
+    cmd = git_command(
+        repo_dir,
+        "-c",
+        "core.quotePath=false",
+        "log",
+        "--format=%x00%H",
+        "--name-only",
+        # without history simplification every commit is walked, in the same
+        # order for the folder as for a single file. Otherwise a merge that
+        # matches one parent for the folder may follow another parent for a
+        # file, e.g. if both branches made the same change
+        "--full-history",
+        # list the files of merges that differ from any parent
+        "-m",
+        "--",
+        path,
+    )
+    result = run(cmd, check=False, log=Log.NONE)
+    if result.returncode != 0:
+        return "", {}
+    last_commit = ""
+    files: dict[str, str] = {}
+    commit = ""
+    # newest commits come first
+    for line in result.stdout.splitlines():
+        if line.startswith("\0"):
+            commit = line[1:]
+            last_commit = last_commit or commit
+        elif line:
+            files.setdefault(line, commit)
+    return last_commit, files
+
+
+def tree_state(repo_dir: Path) -> str | None:
+    """
+    Returns a token that changes whenever the tracked content of the working tree
+    changes, i.e. whatever nix sees when evaluating the flake in repo_dir.
+    None if repo_dir is no git repository.
+    """
+    # the paths of the status are relative to the top level of the repository,
+    # which is above repo_dir if the flake is in a subdirectory
+    result = run(
+        git_command(repo_dir, "rev-parse", "--show-toplevel"),
+        check=False,
+        log=Log.NONE,
+    )
+    if result.returncode != 0:
+        return None
+    toplevel = Path(result.stdout.strip())
+    cmd = git_command(
+        repo_dir,
+        "status",
+        "--porcelain=v2",
+        "-z",
+        "--branch",
+        "--untracked-files=no",
+    )
+    result = run(cmd, check=False, log=Log.NONE)
+    if result.returncode != 0:
+        return None
+    h = hashlib.sha256(result.stdout.encode())
+    # the status of a modified file does not change when it is edited again
+    entries = iter(result.stdout.split("\0"))
+    for entry in entries:
+        if entry.startswith("1 "):
+            path = entry.split(" ", 8)[8]
+        elif entry.startswith("2 "):
+            path = entry.split(" ", 9)[9]
+            # the original path of a rename
+            next(entries, None)
+        elif entry.startswith("u "):
+            path = entry.split(" ", 10)[10]
+        else:
+            continue
+        try:
+            stat = (toplevel / path).lstat()
+        except FileNotFoundError:
+            continue
+        h.update(f"\0{path}\0{stat.st_mtime_ns}\0{stat.st_size}".encode())
+    return h.hexdigest()
+
+
+def worktree_files(repo_dir: Path, *paths: str) -> set[Path] | None:
+    """
+    Returns the files below paths that exist in the working tree, tracked or
+    not, relative to repo_dir. Two git ls-files are used instead of a stat
+    per file. None if repo_dir is no git repository.
+    """
+    listed = run(
+        git_command(repo_dir, "ls-files", "-z", "--cached", "--others", "--", *paths),
+        check=False,
+        log=Log.NONE,
+    )
+    if listed.returncode != 0:
+        return None
+    # tracked files removed from the working tree are still in the index
+    deleted = run(
+        git_command(repo_dir, "ls-files", "-z", "--deleted", "--", *paths),
+        check=False,
+        log=Log.NONE,
+    )
+    files = set(listed.stdout.split("\0")) - set(deleted.stdout.split("\0"))
+    return {Path(f) for f in files if f}
+
+
+def _uncommitted_files(repo_dir: Path) -> set[str] | None:
+    """
+    Returns the files of the working tree that differ from HEAD,
+    modified, staged or untracked, relative to repo_dir.
+    None if repo_dir is no git repository.
+    """
+    cmd = git_command(
+        repo_dir, "status", "--porcelain=v2", "-z", "--untracked-files=all"
+    )
+    result = run(cmd, check=False, log=Log.NONE)
+    if result.returncode != 0:
+        return None
+    files = set()
+    entries = iter(result.stdout.split("\0"))
+    for entry in entries:
+        if entry.startswith("1 "):
+            files.add(entry.split(" ", 8)[8])
+        elif entry.startswith("2 "):
+            files.add(entry.split(" ", 9)[9])
+            # the original path of a rename
+            files.add(next(entries, ""))
+        elif entry.startswith("u "):
+            files.add(entry.split(" ", 10)[10])
+        elif entry.startswith("? "):
+            files.add(entry[2:])
+    files.discard("")
+    return files
+
+
+class _Transaction:
+    def __init__(self, message: str | None) -> None:
+        self.message = message
+        self.messages: list[str] = []
+        # repo -> files to commit, in the order they were added
+        self.paths: dict[Path, dict[Path, None]] = {}
+        # repo -> files with uncommitted changes when the transaction started
+        self.uncommitted: dict[Path, set[str]] = {}
+
+    def add(self, repo_dir: Path, file_paths: list[Path], message: str) -> None:
+        paths = self.paths.setdefault(repo_dir, {})
+        for file_path in file_paths:
+            paths[Path(file_path)] = None
+        if message not in self.messages:
+            self.messages.append(message)
+
+    def commit_message(self) -> str:
+        if self.message is None:
+            subject, *body = self.messages
+        else:
+            subject, body = self.message, self.messages
+        if not body:
+            return subject
+        return subject + "\n\n" + "\n".join(body)
+
+
+# the transaction of the current thread, worker threads join it by running
+# in a copy of the context (contextvars.copy_context().run)
+_transaction: ContextVar[_Transaction | None] = ContextVar(
+    "clan_git_transaction", default=None
+)
+_transaction_lock = Lock()
+
+
+@contextmanager
+def transaction(
+    message: str | None = None, repo_dir: Path | None = None
+) -> Iterator[None]:
+    """
+    Collect the files of all commit_files calls in this context
+    and commit them once when the outermost transaction exits.
+
+    If an exception is raised, the collected files of repo_dir are restored
+    to the state of HEAD and the ones that did not exist are removed.
+    Files that had uncommitted changes when the transaction started are kept,
+    as their previous content is unknown. On KeyboardInterrupt and in other
+    repositories the files are left as they are, uncommitted.
+
+    :param message: The commit message, defaults to the messages of the
+        collected commits.
+    :param repo_dir: The repository to restore on errors.
+    """
+    if _transaction.get() is not None:
+        # nested transactions are part of the outermost one
+        yield
+        return
+    outermost = _Transaction(message)
+    if repo_dir is not None and (repo_dir / ".git").exists():
+        uncommitted = _uncommitted_files(repo_dir)
+        if uncommitted is not None:
+            outermost.uncommitted[repo_dir] = uncommitted
+    token = _transaction.set(outermost)
+    try:
+        yield
+    except Exception:
+        _transaction.reset(token)
+        for repo_dir, paths in outermost.paths.items():
+            uncommitted = outermost.uncommitted.get(repo_dir)
+            if uncommitted is None:
+                log.warning(f"Leaving the uncommitted changes in {repo_dir}")
+                continue
+            _rollback_files(repo_dir, list(paths), uncommitted)
+        raise
+    except BaseException:
+        _transaction.reset(token)
+        raise
+    _transaction.reset(token)
+    for repo_dir, paths in outermost.paths.items():
+        _commit_file_to_git(repo_dir, list(paths), outermost.commit_message())
+
 
 def commit_file(
     file_path: Path,
@@ -43,11 +288,110 @@ def commit_files(
             commit_message += f"Add {file_path.relative_to(repo_dir)}"
     # check if the repo is a git repo and commit
     if (repo_dir / ".git").exists():
+        current = _transaction.get()
+        if current is not None:
+            with _transaction_lock:
+                current.add(repo_dir, file_paths, commit_message)
+            return
         _commit_file_to_git(repo_dir, file_paths, commit_message)
     else:
         return
 
 
+@contextmanager
+def _pathspec_file(paths: list[str]) -> Iterator[list[str]]:
+    """
+    Passes paths in a file instead of the command line, which is limited in size.
+    """
+    with NamedTemporaryFile("wb", prefix="clan-pathspec-") as pathspec_file:
+        pathspec_file.write(b"".join(path.encode() + b"\0" for path in paths))
+        pathspec_file.flush()
+        yield [f"--pathspec-from-file={pathspec_file.name}", "--pathspec-file-nul"]
+
+
+def _rollback_files(
+    repo_dir: Path, file_paths: list[Path], uncommitted: set[str]
+) -> None:
+    """
+    Restore the files below file_paths to the state of HEAD and remove new ones.
+    Files in uncommitted, which had changes before, and ignored files are kept.
+    """
+    # not resolved, as the paths may be symlinks themselves
+    roots = [
+        Path(os.path.abspath(file_path)).relative_to(os.path.abspath(repo_dir))
+        for file_path in file_paths
+    ]
+    with locked_open(repo_dir / ".git" / "clan.lock", "w+"):
+        # listed without paths, there may be more than fit on the command line
+        cmd = git_command(repo_dir, "ls-tree", "-r", "-z", "--name-only", "HEAD")
+        result = run(cmd, check=False, log=Log.NONE)
+        tracked = {p for p in result.stdout.split("\0") if p}
+
+        files: set[str] = set()
+        directories: list[Path] = []
+        for root in roots:
+            path = repo_dir / root
+            if path.is_dir() and not path.is_symlink():
+                directories.append(path)
+                for dirpath, dirnames, filenames in os.walk(path):
+                    relative = Path(dirpath).relative_to(repo_dir)
+                    files.update(str(relative / name) for name in filenames)
+                    # symlinks to directories, e.g. the machines of a secret
+                    files.update(
+                        str(relative / name)
+                        for name in dirnames
+                        if os.path.islink(os.path.join(dirpath, name))
+                    )
+            elif path.is_symlink() or path.exists():
+                files.add(str(root))
+        # tracked files the transaction removed
+        names = {str(root) for root in roots}
+        prefixes = tuple(f"{name}/" for name in names)
+        files.update(f for f in tracked if f in names or f.startswith(prefixes))
+
+        kept = sorted(files & uncommitted)
+        if kept:
+            log.warning(
+                f"Not restoring {len(kept)} files with changes from before the transaction: {', '.join(kept[:10])}{', ...' if len(kept) > 10 else ''}"
+            )
+        files -= uncommitted
+        restore = sorted(files & tracked)
+        new = sorted(files - tracked)
+
+        if restore:
+            with _pathspec_file(restore) as pathspec:
+                cmd = git_command(
+                    repo_dir,
+                    "--literal-pathspecs",
+                    "restore",
+                    "--source=HEAD",
+                    "--staged",
+                    "--worktree",
+                    *pathspec,
+                )
+                run(
+                    cmd,
+                    error_msg=f"Failed to restore {len(restore)} files in {repo_dir}",
+                )
+        if new:
+            cmd = git_command(repo_dir, "check-ignore", "-z", "--stdin")
+            result = run(
+                cmd,
+                input="".join(f"{f}\0" for f in new).encode(),
+                check=False,
+                log=Log.NONE,
+            )
+            ignored = {p for p in result.stdout.split("\0") if p}
+            for f in new:
+                if f not in ignored:
+                    (repo_dir / f).unlink()
+        # remove the directories that are empty now, deepest first
+        for directory in directories:
+            for dirpath, _, _ in sorted(os.walk(directory), reverse=True):
+                with contextlib.suppress(OSError):
+                    os.rmdir(dirpath)
+
+
 def _commit_file_to_git(
     repo_dir: Path, file_paths: list[Path], commit_message: str
 ) -> None:
@@ -58,46 +402,44 @@ def _commit_file_to_git(
     :param commit_message: The commit message.
     :raises ClanError: If the file is not in the git repository.
     """
-    with locked_open(repo_dir / ".git" / "clan.lock", "w+"):
-        for file_path in file_paths:
-            cmd = run_cmd(
-                ["git"],
-                ["git", "-C", str(repo_dir), "add", "--", str(file_path)],
-            )
-            # add the file to the git index
-
-            run(
-                cmd,
-                log=Log.BOTH,
-                error_msg=f"Failed to add {file_path} file to git index",
-            )
+    paths = [str(file_path) for file_path in file_paths]
+    with (
+        locked_open(repo_dir / ".git" / "clan.lock", "w+"),
+        # pass all paths at once, so that each git command is spawned only once
+        _pathspec_file(paths) as pathspec,
+    ):
+        # add the files to the git index
+        cmd = git_command(repo_dir, "add", *pathspec)
+        run(
+            cmd,
+            log=Log.BOTH,
+            error_msg=f"Failed to add {paths} to git index",
+        )
 
-        # check if there is a diff
-        cmd = run_cmd(
-            ["git"],
-            ["git", "-C", str(repo_dir), "diff", "--cached", "--exit-code", "--"]
-            + [str(file_path) for file_path in file_paths],
+        # check if there is a diff, git diff takes no pathspec file
+        cmd = git_command(
+            repo_dir, "diff", "--cached", "--name-only", "--relative", "-z"
         )
-        result = run(cmd, check=False, cwd=repo_dir)
+        result = run(cmd, cwd=repo_dir, log=Log.NONE)
+        staged = {Path(p) for p in result.stdout.split("\0") if p}
+        roots = {
+            Path(os.path.abspath(file_path)).relative_to(os.path.abspath(repo_dir))
+            for file_path in file_paths
+        }
         # if there is no diff, return
-        if result.returncode == 0:
+        if not any(f in roots or not roots.isdisjoint(f.parents) for f in staged):
             return
 
-        # commit only that file
-        cmd = run_cmd(
-            ["git"],
-            [
-                "git",
-                "-C",
-                str(repo_dir),
-                "commit",
-                "-m",
-                commit_message,
-                "--no-verify",  # dont run pre-commit hooks
-            ]
-            + [str(file_path) for file_path in file_paths],
+        # commit only these files
+        cmd = git_command(
+            repo_dir,
+            "commit",
+            "-m",
+            commit_message,
+            "--no-verify",  # dont run pre-commit hooks
+            *pathspec,
         )
-
         run(
-            cmd, error_msg=f"Failed to commit {file_paths} to git repository {repo_dir}"
+            cmd,
+            error_msg=f"Failed to commit {file_paths} to git repository {repo_dir}",
         )
@@ -13,11 +13,16 @@ Operate on the returned inventory to make changes
 """
 
 import json
+import logging
+from contextlib import nullcontext
 from pathlib import Path
+from threading import Lock
+from typing import Any
 
 from clan_cli.api import API, dataclass_to_dict, from_dict
 from clan_cli.errors import ClanCmdError, ClanError
-from clan_cli.git import commit_file
+from clan_cli.git import commit_file, tree_state
+from clan_cli.locked_open import locked_open
 
 from ..cmd import run_no_stdout
 from ..nix import nix_eval
@@ -37,6 +42,7 @@ from .classes import (
     ServiceSingleDiskRoleDefault,
     SingleDiskConfig,
 )
+from .json_patch import apply_patch
 
 # Re export classes here
 # This allows to rename classes in the generated code
@@ -60,6 +66,21 @@ __all__ = [
     "SingleDiskConfig",
 ]
 
+log = logging.getLogger(__name__)
+
+# API methods writing the inventory, they invalidate the cached reads of it
+INVENTORY_WRITES = [
+    "create_clan",
+    "create_machine",
+    "delete_machine",
+    "init_inventory",
+    "patch_inventory",
+    "set_machine",
+    "set_service_instance",
+    "set_single_disk_uuid",
+    "update_clan_meta",
+]
+
 
 def get_path(flake_dir: str | Path) -> Path:
     """
@@ -74,34 +95,81 @@ default_inventory = Inventory(
 )
 
 
+# flake directory -> (flake state, evaluated inventory json)
+_inventory_cache: dict[Path, tuple[str, str]] = {}
+_inventory_cache_lock = Lock()
+
+
+def flake_state(flake_dir: str | Path) -> tuple[Path, str] | None:
+    """
+    Returns the directory of a local flake and a token of its state:
+    its git tree state and the mtime of inventory.json.
+    None if the flake is not a local git repository, its results are not cached.
+    """
+    path = Path(flake_dir)
+    if not path.is_dir():
+        return None
+    state = tree_state(path)
+    if state is None:
+        return None
+    try:
+        mtime = get_path(path).stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    return path.resolve(), f"{state}:{mtime}"
+
+
+def invalidate_inventory_cache(flake_dir: str | Path) -> None:
+    with _inventory_cache_lock:
+        _inventory_cache.pop(Path(flake_dir).resolve(), None)
+
+
 def load_inventory_eval(flake_dir: str | Path) -> Inventory:
     """
     Loads the actual inventory.
     After all merge operations with eventual nix code in buildClan.
 
     Evaluates clanInternals.inventory with nix. Which is performant.
+    The result is cached until the flake or its inventory.json changes.
 
     - Contains all clan metadata
     - Contains all machines
     - and more
     """
-    cmd = nix_eval(
-        [
-            f"{flake_dir}#clanInternals.inventory",
-            "--json",
-        ]
-    )
+    # the state is taken before evaluating, a change during the evaluation
+    # does not match the cached entry afterwards
+    key = flake_state(flake_dir)
+    cached = None
+    if key is not None:
+        with _inventory_cache_lock:
+            cached = _inventory_cache.get(key[0])
 
-    proc = run_no_stdout(cmd)
+    if key is not None and cached is not None and cached[0] == key[1]:
+        log.debug(f"Using cached inventory of {flake_dir}")
+        res = cached[1]
+    else:
+        cmd = nix_eval(
+            [
+                f"{flake_dir}#clanInternals.inventory",
+                "--json",
+            ]
+        )
 
-    try:
+        proc = run_no_stdout(cmd)
         res = proc.stdout.strip()
+
+    try:
         data = json.loads(res)
+        # every caller gets its own instance to modify
         inventory = from_dict(Inventory, data)
-        return inventory
     except json.JSONDecodeError as e:
         raise ClanError(f"Error decoding inventory from flake: {e}")
 
+    if key is not None:
+        with _inventory_cache_lock:
+            _inventory_cache[key[0]] = (key[1], res)
+    return inventory
+
 
 def load_inventory_json(
     flake_dir: str | Path, default: Inventory = default_inventory
@@ -139,9 +207,54 @@ def save_inventory(inventory: Inventory, flake_dir: str | Path, message: str) ->
     with open(inventory_file, "w") as f:
         json.dump(dataclass_to_dict(inventory), f, indent=2)
 
+    # the evaluated inventory merges nix declarations into the written one
+    invalidate_inventory_cache(flake_dir)
     commit_file(inventory_file, Path(flake_dir), commit_message=message)
 
 
+@API.register
+def patch_inventory(
+    base_path: str, ops: list[dict[str, Any]], message: str | None = None
+) -> None:
+    """
+    Applies JSON patch (RFC 6902) operations to the inventory file
+    and commits it once, however many operations there are.
+
+    Keys keep their order in the file, so the diff only contains the change.
+    Inside a git transaction the commit is combined with the other changes.
+    If any operation fails or the result is no valid inventory, nothing is written.
+    """
+    if not ops:
+        return
+    flake_dir = Path(base_path)
+    inventory_file = get_path(flake_dir)
+    git_dir = flake_dir / ".git"
+    lock = (
+        locked_open(git_dir / "clan.lock", "w+") if git_dir.is_dir() else nullcontext()
+    )
+    # the clan lock is released before committing, which takes it again
+    with lock:
+        if inventory_file.exists():
+            try:
+                data = json.loads(inventory_file.read_text())
+            except json.JSONDecodeError as e:
+                raise ClanError(f"Error decoding inventory file: {e}")
+        else:
+            data = dataclass_to_dict(load_inventory_json(flake_dir))
+
+        patched = apply_patch(data, ops)
+        # raises if the patched inventory is not valid
+        from_dict(Inventory, patched)
+
+        with open(inventory_file, "w") as f:
+            json.dump(patched, f, indent=2)
+
+    invalidate_inventory_cache(flake_dir)
+    if message is None:
+        message = f"Patch inventory: {len(ops)} operation{'s' if len(ops) != 1 else ''}"
+    commit_file(inventory_file, flake_dir, commit_message=message)
+
+
 @API.register
 def init_inventory(directory: str, init: Inventory | None = None) -> None:
     inventory = None
@@ -0,0 +1,163 @@
+"""
+JSON patch (RFC 6902) for the json representation of the inventory.
+
+apply_patch(document, operations) applies the operations in order to a copy
+of the document. If any operation fails, a ClanError is raised and the
+document is left untouched. Objects keep the order of their keys,
+added keys are appended.
+"""
+
+import copy
+from typing import Any
+
+from clan_cli.errors import ClanError
+
+OPERATIONS = ("add", "remove", "replace", "move", "copy", "test")
+
+
+def parse_pointer(pointer: str) -> list[str]:
+    """
+    Splits a JSON pointer (RFC 6901) into its unescaped reference tokens.
+    """
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise ClanError(f"Invalid JSON pointer '{pointer}', must start with '/'")
+    return [
+        token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")
+    ]
+
+
+def _array_index(array: list[Any], token: str, pointer: str, *, add: bool) -> int:
+    if add and token == "-":
+        return len(array)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise ClanError(f"Invalid array index '{token}' in '{pointer}'")
+    index = int(token)
+    if index > len(array) or (index == len(array) and not add):
+        raise ClanError(f"Array index {index} out of range in '{pointer}'")
+    return index
+
+
+def _parent(document: Any, tokens: list[str], pointer: str) -> Any:
+    """
+    Returns the container holding the value the pointer refers to.
+    """
+    target = document
+    for token in tokens[:-1]:
+        if isinstance(target, dict):
+            if token not in target:
+                raise ClanError(f"Path '{pointer}' does not exist")
+            target = target[token]
+        elif isinstance(target, list):
+            target = target[_array_index(target, token, pointer, add=False)]
+        else:
+            raise ClanError(f"Path '{pointer}' does not exist")
+    if not isinstance(target, dict | list):
+        raise ClanError(f"Path '{pointer}' does not exist")
+    return target
+
+
+def _get(document: Any, pointer: str) -> Any:
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        return document
+    parent = _parent(document, tokens, pointer)
+    if isinstance(parent, list):
+        return parent[_array_index(parent, tokens[-1], pointer, add=False)]
+    if tokens[-1] not in parent:
+        raise ClanError(f"Path '{pointer}' does not exist")
+    return parent[tokens[-1]]
+
+
+def _add(document: Any, pointer: str, value: Any) -> Any:
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        return value
+    parent = _parent(document, tokens, pointer)
+    if isinstance(parent, list):
+        parent.insert(_array_index(parent, tokens[-1], pointer, add=True), value)
+    else:
+        parent[tokens[-1]] = value
+    return document
+
+
+def _remove(document: Any, pointer: str) -> Any:
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        raise ClanError("Cannot remove the whole document")
+    parent = _parent(document, tokens, pointer)
+    if isinstance(parent, list):
+        del parent[_array_index(parent, tokens[-1], pointer, add=False)]
+    elif tokens[-1] in parent:
+        del parent[tokens[-1]]
+    else:
+        raise ClanError(f"Path '{pointer}' does not exist")
+    return document
+
+
+def _replace(document: Any, pointer: str, value: Any) -> Any:
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        return value
+    parent = _parent(document, tokens, pointer)
+    if isinstance(parent, list):
+        parent[_array_index(parent, tokens[-1], pointer, add=False)] = value
+    elif tokens[-1] in parent:
+        # keeps the position of the key
+        parent[tokens[-1]] = value
+    else:
+        raise ClanError(f"Path '{pointer}' does not exist")
+    return document
+
+
+def _json_equal(a: Any, b: Any) -> bool:
+    # unlike in python, true is not equal to 1 in json
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_json_equal(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(map(_json_equal, a, b))
+    return a == b
+
+
+def _member(operation: dict[str, Any], name: str, index: int) -> Any:
+    if name not in operation:
+        raise ClanError(f"Patch operation {index} is missing '{name}'")
+    return operation[name]
+
+
+def apply_patch(document: Any, operations: list[dict[str, Any]]) -> Any:
+    """
+    Returns a patched copy of the document.
+    """
+    result = copy.deepcopy(document)
+    for index, operation in enumerate(operations):
+        op = _member(operation, "op", index)
+        path = _member(operation, "path", index)
+        if op not in OPERATIONS:
+            raise ClanError(
+                f"Unknown patch operation '{op}', expected one of {', '.join(OPERATIONS)}"
+            )
+        if op == "add":
+            value = copy.deepcopy(_member(operation, "value", index))
+            result = _add(result, path, value)
+        elif op == "remove":
+            result = _remove(result, path)
+        elif op == "replace":
+            value = copy.deepcopy(_member(operation, "value", index))
+            result = _replace(result, path, value)
+        elif op == "move":
+            from_path = _member(operation, "from", index)
+            if path != from_path and path.startswith(from_path + "/"):
+                raise ClanError(f"Cannot move '{from_path}' into itself at '{path}'")
+            value = _get(result, from_path)
+            result = _add(_remove(result, from_path), path, value)
+        elif op == "copy":
+            value = copy.deepcopy(_get(result, _member(operation, "from", index)))
+            result = _add(result, path, value)
+        elif op == "test":
+            if not _json_equal(_get(result, path), _member(operation, "value", index)):
+                raise ClanError(f"Test of '{path}' failed")
+    return result
@@ -2,6 +2,14 @@ import dataclasses
 import json
 from typing import Any
 
+from clan_cli.api import (
+    ApiResponse,
+    BatchCall,
+    ErrorDataClass,
+    MethodRegistry,
+    dataclass_to_dict,
+)
+
 
 class ClanJSONEncoder(json.JSONEncoder):
     def default(self, o: Any) -> Any:
@@ -13,3 +21,91 @@ class ClanJSONEncoder(json.JSONEncoder):
             return dataclasses.asdict(o)
         # Otherwise, use the default serialization
         return super().default(o)
+
+
+# JSON-RPC 2.0 error codes
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+
+def _error(request_id: Any, code: int, message: str, data: Any = None) -> dict:
+    error: dict[str, Any] = {"code": code, "message": message}
+    if data is not None:
+        error["data"] = data
+    return {"jsonrpc": "2.0", "id": request_id, "error": error}
+
+
+def _response(request_id: Any, response: ApiResponse[Any]) -> dict:
+    if isinstance(response, ErrorDataClass):
+        return _error(
+            request_id,
+            SERVER_ERROR,
+            "; ".join(error.message for error in response.errors),
+            dataclass_to_dict(response.errors),
+        )
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "result": dataclass_to_dict(response.data),
+    }
+
+
+def _parse(registry: MethodRegistry, request: Any) -> BatchCall | dict:
+    """
+    Returns the call of a request or the error response for it.
+    """
+    request_id = request.get("id") if isinstance(request, dict) else None
+    if (
+        not isinstance(request, dict)
+        or request.get("jsonrpc") != "2.0"
+        or not isinstance(request.get("method"), str)
+    ):
+        return _error(request_id, INVALID_REQUEST, "Invalid request")
+    params = request.get("params", {})
+    if not isinstance(params, dict):
+        return _error(request_id, INVALID_PARAMS, "params must be an object")
+    if request["method"] not in registry.functions or request["method"] == "batch":
+        return _error(request_id, METHOD_NOT_FOUND, f"{request['method']} not found")
+    return BatchCall(method=request["method"], args=params)
+
+
+def handle_request(registry: MethodRegistry, request: Any) -> Any:
+    """
+    Handles a decoded JSON-RPC 2.0 request with the methods of the registry,
+    returns the response to encode or None if there is nothing to respond.
+
+    A batch request is run with MethodRegistry.batch,
+    its read only methods are called concurrently.
+    """
+    requests = request if isinstance(request, list) else [request]
+    if not requests:
+        return _error(None, INVALID_REQUEST, "Empty batch")
+    responses: list[dict | None] = []
+    calls: list[BatchCall] = []
+    # index of every call in responses
+    positions: list[int] = []
+    for item in requests:
+        parsed = _parse(registry, item)
+        if isinstance(parsed, BatchCall):
+            positions.append(len(responses))
+            calls.append(parsed)
+            responses.append(None)
+        else:
+            responses.append(parsed)
+    for position, call_response in zip(
+        positions, registry.batch(calls, op_key="jsonrpc"), strict=True
+    ):
+        responses[position] = _response(requests[position].get("id"), call_response)
+    # notifications, valid requests without id, are not answered
+    called = set(positions)
+    answered = [
+        response
+        for position, response in enumerate(responses)
+        if response is not None
+        and not (position in called and "id" not in requests[position])
+    ]
+    if not isinstance(request, list):
+        return answered[0] if answered else None
+    return answered or None
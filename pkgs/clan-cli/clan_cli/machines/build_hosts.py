@@ -0,0 +1,236 @@
+import json
+import logging
+import math
+import subprocess
+import time
+import urllib.parse
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+
+from ..dirs import user_cache_dir
+from ..errors import ClanError
+from ..ssh import Host, parse_deployment_address
+from .machines import Machine
+
+log = logging.getLogger(__name__)
+
+# seconds after which the load of a build host is read again
+LOAD_TTL = 30.0
+# how much worse (in jobs per unit of weight) a builder that built the machine
+# before or builds machines of the same platform may score before we pick
+# a less loaded one
+LOCALITY_SLACK = 1.0
+
+
+def default_state_file() -> Path:
+    return user_cache_dir() / "clan" / "build-hosts.json"
+
+
+def split_weight(address: str) -> tuple[str, float]:
+    """
+    Split the `weight` option from a build host address.
+    root@builder?weight=4&IdentityFile=... -> (root@builder?IdentityFile=..., 4.0)
+    """
+    base, sep, query = address.partition("?")
+    if not sep:
+        return address, 1.0
+    weight = 1.0
+    options = []
+    for option in query.split("&"):
+        k, _, v = option.partition("=")
+        if k != "weight":
+            options.append(option)
+            continue
+        try:
+            weight = float(v)
+        except ValueError:
+            raise ClanError(f"Invalid weight '{v}' for build host {base}")
+        if weight <= 0:
+            raise ClanError(f"Weight of build host {base} must be positive")
+    if options:
+        return f"{base}?{'&'.join(options)}", weight
+    return base, weight
+
+
+def parse_loadavg(output: str) -> float:
+    """
+    Parse the output of `cat /proc/loadavg; nproc` into the 1 minute load per core.
+    """
+    lines = output.split()
+    try:
+        load1 = float(lines[0])
+        nproc = int(lines[-1])
+    except (IndexError, ValueError):
+        raise ClanError(f"Cannot parse load of build host: {output!r}")
+    return load1 / max(nproc, 1)
+
+
+@dataclass
+class BuildHostEntry:
+    address: str
+    weight: float = 1.0
+    # number of machines currently built on this host by us
+    jobs: int = 0
+    # 1 minute load average per core, math.inf if the host is unreachable
+    load: float = 0.0
+    load_checked: float = -math.inf
+    # affinity keys of the machines that were assigned to this host in this run
+    affinities: set[str] = field(default_factory=set)
+
+    @property
+    def name(self) -> str:
+        return urllib.parse.urlsplit("//" + self.address.split("@")[-1]).hostname or ""
+
+    def score(self) -> float:
+        return (self.jobs + self.load) / self.weight
+
+
+def machine_affinity(machine: Machine) -> str | None:
+    """
+    The platform of the machine (hostPlatform.system). Closures are not compared,
+    machines of the same platform are only likely to share store paths
+    like stdenv or the kernel.
+    """
+    return machine.deployment.get("system")
+
+
+class BuildHostPool:
+    """
+    A pool of build hosts with capacity weights.
+
+    Machines are assigned to the builder with the lowest (jobs + load) / weight.
+    A builder that already built the machine or builds a machine of the same
+    platform is preferred as long as it is not much busier, to reuse its nix store.
+    """
+
+    def __init__(
+        self,
+        addresses: list[str],
+        state_file: Path | None = None,
+    ) -> None:
+        if not addresses:
+            raise ClanError("The build host pool needs at least one build host")
+        self.entries: list[BuildHostEntry] = []
+        for address in addresses:
+            address, weight = split_weight(address)
+            self.entries.append(BuildHostEntry(address=address, weight=weight))
+        self.state_file = state_file
+        self._lock = Lock()
+        # held while the loads are read, without blocking select and release
+        self._refresh_lock = Lock()
+        self._last_builder: dict[str, str] = self._load_state()
+
+    def _load_state(self) -> dict[str, str]:
+        if self.state_file is None or not self.state_file.exists():
+            return {}
+        try:
+            return json.loads(self.state_file.read_text())
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f"Ignoring build host state {self.state_file}: {e}")
+            return {}
+
+    def _save_state(self) -> None:
+        if self.state_file is None:
+            return
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._last_builder, indent=2))
+        tmp.rename(self.state_file)
+
+    def read_load(self, entry: BuildHostEntry) -> float:
+        """
+        Returns the load per core of the build host, math.inf if it cannot be read.
+        """
+        host = parse_deployment_address(entry.name, entry.address)
+        try:
+            proc = host.run(
+                "cat /proc/loadavg && nproc",
+                stdout=subprocess.PIPE,
+                check=False,
+                timeout=10,
+            )
+            if proc.returncode != 0:
+                raise ClanError(f"exit code {proc.returncode}")
+            return parse_loadavg(proc.stdout)
+        except subprocess.TimeoutExpired:
+            log.warning(f"Reading the load of build host {entry.name} timed out")
+        except ClanError as e:
+            log.warning(f"Cannot read load of build host {entry.name}: {e}")
+        return math.inf
+
+    def _refresh_load(self) -> None:
+        """
+        Reads the outdated loads of all build hosts in parallel.
+        """
+        with self._refresh_lock:
+            now = time.monotonic()
+            with self._lock:
+                outdated = [
+                    entry
+                    for entry in self.entries
+                    if now - entry.load_checked > LOAD_TTL
+                ]
+            if not outdated:
+                return
+            with ThreadPoolExecutor(max_workers=len(outdated)) as executor:
+                loads = list(executor.map(self.read_load, outdated))
+            with self._lock:
+                for entry, load in zip(outdated, loads, strict=True):
+                    entry.load = load
+                    entry.load_checked = now
+
+    def select(self, machine: Machine) -> BuildHostEntry:
+        """
+        Pick the build host for a machine and account a job for it.
+        """
+        affinity = machine_affinity(machine)
+        self._refresh_load()
+        with self._lock:
+            available = [e for e in self.entries if e.load != math.inf]
+            if not available:
+                raise ClanError("None of the build hosts in the pool are reachable")
+            best = min(available, key=BuildHostEntry.score)
+
+            last = self._last_builder.get(machine.get_id())
+            local = [
+                e
+                for e in available
+                if e.address == last or (affinity and affinity in e.affinities)
+            ]
+            if local:
+                candidate = min(local, key=BuildHostEntry.score)
+                if candidate.score() <= best.score() + LOCALITY_SLACK:
+                    best = candidate
+
+            best.jobs += 1
+            if affinity:
+                best.affinities.add(affinity)
+            self._last_builder[machine.get_id()] = best.address
+            self._save_state()
+        log.info(f"Building {machine.name} on {best.name}")
+        return best
+
+    def release(self, entry: BuildHostEntry) -> None:
+        with self._lock:
+            entry.jobs -= 1
+
+    @contextmanager
+    def lease(self, machine: Machine) -> Iterator[Host]:
+        """
+        Returns the build host for the machine while it is being built
+        """
+        entry = self.select(machine)
+        try:
+            # enable ssh agent forwarding to allow the build host to access the target host
+            yield parse_deployment_address(
+                machine.name,
+                entry.address,
+                forward_agent=True,
+                meta={"machine": machine, "target_host": machine.target_host},
+            )
+        finally:
+            self.release(entry)
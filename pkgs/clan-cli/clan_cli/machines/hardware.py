@@ -23,7 +23,7 @@ class HardwareInfo:
     system: str | None
 
 
-@API.register
+@API.register(read_only=True)
 def show_machine_hardware_info(
     clan_dir: str | Path, machine_name: str
 ) -> HardwareInfo | None:
@@ -41,7 +41,7 @@ def show_machine_hardware_info(
     return HardwareInfo(system)
 
 
-@API.register
+@API.register(read_only=True)
 def show_machine_deployment_target(
     clan_dir: str | Path, machine_name: str
 ) -> str | None:
@@ -65,7 +65,7 @@ def show_machine_deployment_target(
     return target_host.get("targetHost", None)
 
 
-@API.register
+@API.register(read_only=True)
 def show_machine_hardware_platform(
     clan_dir: str | Path, machine_name: str
 ) -> str | None:
@@ -5,10 +5,15 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Literal
 
-from clan_cli.api import API
+from clan_cli.api import API, ReadCache
 from clan_cli.cmd import run_no_stdout
 from clan_cli.errors import ClanCmdError, ClanError
-from clan_cli.inventory import Machine, load_inventory_eval, save_inventory
+from clan_cli.inventory import (
+    INVENTORY_WRITES,
+    Machine,
+    load_inventory_eval,
+    save_inventory,
+)
 from clan_cli.nix import nix_eval, nix_shell
 
 log = logging.getLogger(__name__)
@@ -23,7 +28,7 @@ def set_machine(flake_url: str | Path, machine_name: str, machine: Machine) -> N
     save_inventory(inventory, flake_url, "machines: edit '{machine_name}'")
 
 
-@API.register
+@API.register(cache=ReadCache(invalidate_on=INVENTORY_WRITES, flake_arg="flake_url"))
 def list_inventory_machines(flake_url: str | Path) -> dict[str, Machine]:
     inventory = load_inventory_eval(flake_url)
     return inventory.machines
@@ -37,7 +42,12 @@ class MachineDetails:
     # has_disk_specs: bool = False
 
 
-@API.register
+@API.register(
+    cache=ReadCache(
+        invalidate_on=[*INVENTORY_WRITES, "generate_machine_hardware_info"],
+        flake_arg="flake_url",
+    )
+)
 def get_inventory_machine_details(
     flake_url: str | Path, machine_name: str
 ) -> MachineDetails:
@@ -56,7 +66,7 @@ def get_inventory_machine_details(
     )
 
 
-@API.register
+@API.register(read_only=True)
 def list_nixos_machines(flake_url: str | Path) -> list[str]:
     cmd = nix_eval(
         [
@@ -82,7 +92,7 @@ class ConnectionOptions:
     timeout: int = 2
 
 
-@API.register
+@API.register(read_only=True)
 def check_machine_online(
     flake_url: str | Path, machine_name: str, opts: ConnectionOptions | None
 ) -> Literal["Online", "Offline"]:
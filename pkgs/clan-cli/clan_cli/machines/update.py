@@ -16,8 +16,9 @@ from ..facts.upload import upload_secrets
 from ..inventory import Machine as InventoryMachine
 from ..machines.machines import Machine
 from ..nix import nix_command, nix_metadata
-from ..ssh import HostKeyCheck
+from ..ssh import Host, HostKeyCheck
 from ..vars.generate import generate_vars
+from .build_hosts import BuildHostPool, default_state_file
 from .inventory import get_all_machines, get_selected_machines
 from .machine_group import MachineGroup
 
@@ -104,22 +105,21 @@ def update_machines(base_path: str, machines: list[InventoryMachine]) -> None:
     deploy_machine(MachineGroup(group_machines))
 
 
-def deploy_machine(machines: MachineGroup) -> None:
+def deploy_machine(
+    machines: MachineGroup, build_hosts: BuildHostPool | None = None
+) -> None:
     """
     Deploy to all hosts in parallel
+    If a build host pool is given, machines without an explicit build host
+    are built on the least loaded host of the pool.
     """
 
-    def deploy(machine: Machine) -> None:
-        host = machine.build_host
+    def build(machine: Machine, host: Host) -> None:
         target = f"{host.user or 'root'}@{host.host}"
         ssh_arg = f"-p {host.port}" if host.port else ""
         env = os.environ.copy()
         env["NIX_SSHOPTS"] = ssh_arg
 
-        generate_facts([machine], None, False)
-        generate_vars([machine], None, False)
-        upload_secrets(machine)
-
         path = upload_sources(
             str(machine.flake.path) if machine.flake.is_local() else machine.flake.url,
             target,
@@ -156,6 +156,17 @@ def deploy_machine(machines: MachineGroup) -> None:
         if ret.returncode != 0:
             ret = host.run(cmd)
 
+    def deploy(machine: Machine) -> None:
+        generate_facts([machine], None, False)
+        generate_vars([machine], None, False)
+        upload_secrets(machine)
+
+        if build_hosts is None or machine.deployment.get("buildHost") is not None:
+            build(machine, machine.build_host)
+            return
+        with build_hosts.lease(machine) as host:
+            build(machine, host)
+
     machines.run_function(deploy)
 
 
@@ -198,7 +209,10 @@ def update(args: argparse.Namespace) -> None:
         else:
             machines = get_selected_machines(args.flake, args.option, args.machines)
 
-    deploy_machine(MachineGroup(machines))
+    build_hosts = None
+    if args.build_host:
+        build_hosts = BuildHostPool(args.build_host, state_file=default_state_file())
+    deploy_machine(MachineGroup(machines), build_hosts)
 
 
 def register_update_parser(parser: argparse.ArgumentParser) -> None:
@@ -218,6 +232,14 @@ def register_update_parser(parser: argparse.ArgumentParser) -> None:
         type=str,
         help="address of the machine to update, in the format of user@host:1234",
     )
+    parser.add_argument(
+        "--build-host",
+        type=str,
+        action="append",
+        default=[],
+        metavar="ADDRESS",
+        help="add a build host to the build host pool (can be repeated). Machines without a buildHost are built on the least loaded host of the pool. Use user@host?weight=N to set the capacity of a host",
+    )
     parser.add_argument(
         "--darwin",
         type=str,
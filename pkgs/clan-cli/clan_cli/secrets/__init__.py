@@ -6,6 +6,7 @@ from .import_sops import register_import_sops_parser
 from .key import register_key_parser
 from .machines import register_machines_parser
 from .secrets import register_secrets_parser
+from .set_many import register_set_many_parser
 from .users import register_users_parser
 
 
@@ -30,6 +31,11 @@ def register_parser(parser: argparse.ArgumentParser) -> None:
     import_sops_parser = subparser.add_parser("import-sops", help="import a sops file")
     register_import_sops_parser(import_sops_parser)
 
+    set_many_parser = subparser.add_parser(
+        "set-many", help="set many secrets at once from a json, yaml or dotenv file"
+    )
+    register_set_many_parser(set_many_parser)
+
     parser_key = subparser.add_parser("key", help="create and show age keys")
     register_key_parser(parser_key)
 
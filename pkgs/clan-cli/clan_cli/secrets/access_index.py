@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Any
+
+from ..dirs import clan_key_safe, user_cache_dir
+from .folders import sops_groups_folder, sops_secrets_folder
+from .types import VALID_SECRET_NAME
+
+log = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+KINDS = ["machines", "users", "groups"]
+
+
+def index_file(flake_dir: Path) -> Path:
+    return (
+        user_cache_dir()
+        / "clan"
+        / "secrets-index"
+        / f"{clan_key_safe(str(flake_dir.resolve()))}.json"
+    )
+
+
+def _mtime(path: Path) -> int:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _list_names(folder: Path) -> list[str]:
+    try:
+        return sorted(os.listdir(folder))
+    except FileNotFoundError:
+        return []
+
+
+def _load(flake_dir: Path) -> dict[str, Any]:
+    path = index_file(flake_dir)
+    try:
+        data = json.loads(path.read_text())
+    except FileNotFoundError:
+        return {}
+    except (OSError, json.JSONDecodeError) as e:
+        log.debug(f"Ignoring secrets index {path}: {e}")
+        return {}
+    if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+        return {}
+    return data.get("secrets", {})
+
+
+def _save(flake_dir: Path, secrets: dict[str, Any]) -> None:
+    path = index_file(flake_dir)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile("w", dir=path.parent, delete=False) as tmp:
+            json.dump({"version": INDEX_VERSION, "secrets": secrets}, tmp)
+        os.replace(tmp.name, path)
+    except OSError as e:
+        # the index is only a cache, commands still work without it
+        log.debug(f"Cannot write secrets index {path}: {e}")
+
+
+def secret_members(flake_dir: Path) -> dict[str, dict[str, list[str]]]:
+    """
+    Returns the machines, users and groups that each secret is shared with directly.
+
+    The result is cached in the user cache directory. Only secrets whose folders
+    changed their mtime since the last call are read again.
+    """
+    secrets_folder = sops_secrets_folder(flake_dir)
+    cached = _load(flake_dir)
+    secrets: dict[str, Any] = {}
+    changed = False
+    for name in _list_names(secrets_folder):
+        if VALID_SECRET_NAME.match(name) is None:
+            continue
+        path = secrets_folder / name
+        token = [_mtime(path)] + [_mtime(path / kind) for kind in KINDS]
+        entry = cached.get(name)
+        if entry is None or entry.get("token") != token:
+            if not (path / "secret").exists():
+                continue
+            entry = {"token": token}
+            for kind in KINDS:
+                entry[kind] = _list_names(path / kind)
+            changed = True
+        secrets[name] = entry
+    if changed or secrets.keys() != cached.keys():
+        _save(flake_dir, secrets)
+    return {
+        name: {kind: entry[kind] for kind in KINDS} for name, entry in secrets.items()
+    }
+
+
+def group_members(flake_dir: Path) -> dict[str, dict[str, list[str]]]:
+    groups_folder = sops_groups_folder(flake_dir)
+    groups = {}
+    for group in _list_names(groups_folder):
+        if not (groups_folder / group).is_dir():
+            continue
+        groups[group] = {
+            kind: _list_names(groups_folder / group / kind)
+            for kind in ["machines", "users"]
+        }
+    return groups
+
+
+def who_can_read(flake_dir: Path, secret: str) -> dict[str, dict[str, list[str]]]:
+    """
+    Returns the machines and users that can read a secret,
+    each with the groups they have access through ("" for direct access).
+    """
+    members = secret_members(flake_dir).get(secret)
+    if members is None:
+        return {"machines": {}, "users": {}}
+    groups = group_members(flake_dir)
+    readers: dict[str, dict[str, list[str]]] = {"machines": {}, "users": {}}
+    for kind in ["machines", "users"]:
+        for name in members[kind]:
+            readers[kind].setdefault(name, []).append("")
+    for group in members["groups"]:
+        for kind in ["machines", "users"]:
+            for name in groups.get(group, {}).get(kind, []):
+                readers[kind].setdefault(name, []).append(group)
+    return readers
+
+
+def readable_by(flake_dir: Path, kind: str, name: str) -> list[str]:
+    """
+    Returns the secrets a machine, user or group can read,
+    including secrets shared with groups the machine or user is a member of.
+    """
+    via: set[str] = set()
+    if kind != "groups":
+        for group, members in group_members(flake_dir).items():
+            if name in members[kind]:
+                via.add(group)
+    return sorted(
+        secret
+        for secret, members in secret_members(flake_dir).items()
+        if name in members[kind] or via.intersection(members["groups"])
+    )
@@ -0,0 +1,348 @@
+"""
+A minimal implementation of the age file format (https://age-encryption.org/v1)
+for X25519 recipients, sufficient to (re-)encrypt the small data keys that sops
+stores in its metadata.
+
+This avoids spawning sops or age for operations that only touch the key
+material. It is not meant for encrypting large files.
+The primitives come from the cryptography package, without it the
+callers fall back to the sops and age binaries.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import re
+from typing import Any
+
+from ..errors import ClanError
+
+
+class AgeError(ClanError):
+    pass
+
+
+# bech32 (BIP 173) without the 90 characters length limit, as used by age
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+BECH32_GENERATOR = [0x3B6A57B2, 0x26508E6D, 0x1EA119FA, 0x3D4233DD, 0x2A1462B3]
+
+
+def _bech32_polymod(values: list[int]) -> int:
+    chk = 1
+    for value in values:
+        top = chk >> 25
+        chk = (chk & 0x1FFFFFF) << 5 ^ value
+        for i in range(5):
+            chk ^= BECH32_GENERATOR[i] if ((top >> i) & 1) else 0
+    return chk
+
+
+def _bech32_hrp_expand(hrp: str) -> list[int]:
+    return [ord(x) >> 5 for x in hrp] + [0] + [ord(x) & 31 for x in hrp]
+
+
+def _convert_bits(data: bytes | list[int], frombits: int, tobits: int) -> list[int]:
+    acc = 0
+    bits = 0
+    ret = []
+    maxv = (1 << tobits) - 1
+    for value in data:
+        acc = (acc << frombits) | value
+        bits += frombits
+        while bits >= tobits:
+            bits -= tobits
+            ret.append((acc >> bits) & maxv)
+    if frombits == 8:
+        if bits:
+            ret.append((acc << (tobits - bits)) & maxv)
+    elif bits >= frombits or ((acc << (tobits - bits)) & maxv):
+        raise AgeError("Invalid padding in bech32 data")
+    return ret
+
+
+def bech32_encode(hrp: str, data: bytes) -> str:
+    values = _convert_bits(data, 8, 5)
+    polymod = _bech32_polymod(_bech32_hrp_expand(hrp) + values + [0] * 6) ^ 1
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + "1" + "".join(BECH32_CHARSET[d] for d in values + checksum)
+
+
+def bech32_decode(s: str) -> tuple[str, bytes]:
+    if s.lower() != s and s.upper() != s:
+        raise AgeError("Mixed case in bech32 string")
+    s = s.lower()
+    pos = s.rfind("1")
+    if pos < 1 or pos + 7 > len(s):
+        raise AgeError("Invalid bech32 string")
+    hrp = s[:pos]
+    try:
+        values = [BECH32_CHARSET.index(c) for c in s[pos + 1 :]]
+    except ValueError:
+        raise AgeError("Invalid character in bech32 string")
+    if _bech32_polymod(_bech32_hrp_expand(hrp) + values) != 1:
+        raise AgeError("Invalid bech32 checksum")
+    return hrp, bytes(_convert_bits(values[:-6], 5, 8))
+
+
+# X25519 (RFC 7748) and ChaCha20-Poly1305 (RFC 8439) are taken from the
+# constant-time implementations of the cryptography package
+X25519PrivateKey: Any = None
+X25519PublicKey: Any = None
+ChaCha20Poly1305: Any = None
+InvalidTag: Any = None
+try:
+    from cryptography.exceptions import InvalidTag  # type: ignore[no-redef]
+    from cryptography.hazmat.primitives.asymmetric.x25519 import (  # type: ignore[no-redef]
+        X25519PrivateKey,
+        X25519PublicKey,
+    )
+    from cryptography.hazmat.primitives.ciphers.aead import (  # type: ignore[no-redef]
+        ChaCha20Poly1305,
+    )
+except ImportError:
+    pass
+
+
+def available() -> bool:
+    """
+    Returns False if the cryptography package is missing,
+    callers fall back to sops and age then.
+    """
+    return ChaCha20Poly1305 is not None
+
+
+def _require() -> None:
+    if not available():
+        raise AgeError("The cryptography package is required for age encryption")
+
+
+def x25519(scalar: bytes, u: bytes) -> bytes:
+    _require()
+    try:
+        shared: bytes = X25519PrivateKey.from_private_bytes(scalar).exchange(
+            X25519PublicKey.from_public_bytes(u)
+        )
+    except ValueError as e:
+        # raised for low order points, whose shared secret is all zeros
+        raise AgeError(f"Invalid X25519 share: {e}") from e
+    return shared
+
+
+def x25519_public(scalar: bytes) -> bytes:
+    _require()
+    public: bytes = (
+        X25519PrivateKey.from_private_bytes(scalar).public_key().public_bytes_raw()
+    )
+    return public
+
+
+def chacha20poly1305_encrypt(
+    key: bytes, nonce: bytes, plaintext: bytes, aad: bytes = b""
+) -> bytes:
+    _require()
+    ciphertext: bytes = ChaCha20Poly1305(key).encrypt(nonce, plaintext, aad)
+    return ciphertext
+
+
+def chacha20poly1305_decrypt(
+    key: bytes, nonce: bytes, data: bytes, aad: bytes = b""
+) -> bytes:
+    _require()
+    if len(data) < 16:
+        raise AgeError("Ciphertext too short")
+    try:
+        plaintext: bytes = ChaCha20Poly1305(key).decrypt(nonce, data, aad)
+    except InvalidTag:
+        raise AgeError("Failed to authenticate ciphertext") from None
+    return plaintext
+
+
+def hkdf_sha256(ikm: bytes, salt: bytes, info: bytes, length: int = 32) -> bytes:
+    prk = hmac.new(salt, ikm, hashlib.sha256).digest()
+    okm = b""
+    block = b""
+    counter = 1
+    while len(okm) < length:
+        block = hmac.new(prk, block + info + bytes([counter]), hashlib.sha256).digest()
+        okm += block
+        counter += 1
+    return okm[:length]
+
+
+# age keys
+IDENTITY_HRP = "age-secret-key-"
+RECIPIENT_HRP = "age"
+X25519_LABEL = b"age-encryption.org/v1/X25519"
+AGE_VERSION_LINE = b"age-encryption.org/v1"
+ARMOR_BEGIN = "-----BEGIN AGE ENCRYPTED FILE-----"
+ARMOR_END = "-----END AGE ENCRYPTED FILE-----"
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_identity(identity: str) -> bytes:
+    hrp, data = bech32_decode(identity.strip())
+    if hrp != IDENTITY_HRP or len(data) != 32:
+        raise AgeError("Invalid age identity")
+    return data
+
+
+def parse_recipient(recipient: str) -> bytes:
+    hrp, data = bech32_decode(recipient.strip())
+    if hrp != RECIPIENT_HRP or len(data) != 32:
+        raise AgeError(f"Invalid age recipient: {recipient}")
+    return data
+
+
+def identity_to_recipient(identity: str) -> str:
+    return bech32_encode(RECIPIENT_HRP, x25519_public(parse_identity(identity)))
+
+
+def parse_identities(text: str) -> list[str]:
+    """
+    Parse an age identity file, which may contain multiple keys and comments.
+    """
+    return [
+        line.strip()
+        for line in text.splitlines()
+        if line.strip().startswith("AGE-SECRET-KEY-1")
+    ]
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    if data.endswith(b"=") or re.search(rb"[^A-Za-z0-9+/]", data):
+        raise AgeError("Invalid base64 in age header")
+    return base64.b64decode(data + b"=" * (-len(data) % 4))
+
+
+def _wrap_x25519(file_key: bytes, recipient: str) -> bytes:
+    their_public = parse_recipient(recipient)
+    ephemeral = os.urandom(32)
+    share = x25519_public(ephemeral)
+    try:
+        shared_secret = x25519(ephemeral, their_public)
+    except AgeError:
+        raise AgeError(f"Invalid age recipient: {recipient}") from None
+    wrap_key = hkdf_sha256(shared_secret, share + their_public, X25519_LABEL)
+    body = chacha20poly1305_encrypt(wrap_key, bytes(12), file_key)
+    return b"-> X25519 " + _b64encode(share) + b"\n" + _b64encode(body) + b"\n"
+
+
+def _unwrap_x25519(args: list[bytes], body: bytes, identity: bytes) -> bytes | None:
+    if len(args) != 1:
+        raise AgeError("Invalid X25519 stanza")
+    share = _b64decode(args[0])
+    if len(share) != 32:
+        raise AgeError("Invalid X25519 share")
+    our_public = x25519_public(identity)
+    # rejects shares that lead to an all zero shared secret
+    shared_secret = x25519(identity, share)
+    wrap_key = hkdf_sha256(shared_secret, share + our_public, X25519_LABEL)
+    try:
+        return chacha20poly1305_decrypt(wrap_key, bytes(12), body)
+    except AgeError:
+        # not encrypted to this identity
+        return None
+
+
+def _stream(key: bytes, data: bytes, encrypt: bool) -> bytes:
+    size = CHUNK_SIZE if encrypt else CHUNK_SIZE + 16
+    chunks = [data[i : i + size] for i in range(0, len(data), size)] or [b""]
+    out = b""
+    for counter, chunk in enumerate(chunks):
+        last = counter == len(chunks) - 1
+        nonce = counter.to_bytes(11, "big") + (b"\x01" if last else b"\x00")
+        if encrypt:
+            out += chacha20poly1305_encrypt(key, nonce, chunk)
+        else:
+            out += chacha20poly1305_decrypt(key, nonce, chunk)
+    return out
+
+
+def armor(data: bytes) -> str:
+    encoded = base64.b64encode(data).decode()
+    lines = [encoded[i : i + 64] for i in range(0, len(encoded), 64)]
+    return "\n".join([ARMOR_BEGIN, *lines, ARMOR_END]) + "\n"
+
+
+def dearmor(text: str) -> bytes:
+    lines = [line.strip() for line in text.strip().splitlines()]
+    if not lines or lines[0] != ARMOR_BEGIN or lines[-1] != ARMOR_END:
+        raise AgeError("Invalid armored age file")
+    return base64.b64decode("".join(lines[1:-1]), validate=True)
+
+
+def encrypt(plaintext: bytes, recipients: list[str]) -> bytes:
+    """
+    Encrypt plaintext to the given X25519 recipients (age1...)
+    """
+    file_key = os.urandom(16)
+    header = AGE_VERSION_LINE + b"\n"
+    for recipient in recipients:
+        header += _wrap_x25519(file_key, recipient)
+    header += b"---"
+    mac_key = hkdf_sha256(file_key, b"", b"header")
+    mac = hmac.new(mac_key, header, hashlib.sha256).digest()
+    nonce = os.urandom(16)
+    payload_key = hkdf_sha256(file_key, nonce, b"payload")
+    return (
+        header
+        + b" "
+        + _b64encode(mac)
+        + b"\n"
+        + nonce
+        + _stream(payload_key, plaintext, encrypt=True)
+    )
+
+
+def decrypt(data: bytes, identities: list[str]) -> bytes:
+    """
+    Decrypt an age file with one of the given X25519 identities (AGE-SECRET-KEY-1...)
+    """
+    lines = data.split(b"\n")
+    if not lines or lines[0] != AGE_VERSION_LINE:
+        raise AgeError("Unsupported age file version")
+    keys = [parse_identity(identity) for identity in identities]
+    file_key = None
+    header_len = len(lines[0]) + 1
+    i = 1
+    while i < len(lines) and lines[i].startswith(b"-> "):
+        args = lines[i][3:].split(b" ")
+        header_len += len(lines[i]) + 1
+        i += 1
+        body = b""
+        while i < len(lines):
+            body_line = lines[i]
+            header_len += len(body_line) + 1
+            i += 1
+            body += body_line
+            if len(body_line) < 64:
+                break
+        if args[0] != b"X25519" or file_key is not None:
+            continue
+        body = _b64decode(body)
+        for key in keys:
+            file_key = _unwrap_x25519(args[1:], body, key)
+            if file_key is not None:
+                break
+    if i >= len(lines) or not lines[i].startswith(b"--- "):
+        raise AgeError("Invalid age header")
+    if file_key is None:
+        raise AgeError("No matching age identity found")
+
+    header = data[: header_len + 3]
+    mac_key = hkdf_sha256(file_key, b"", b"header")
+    expected_mac = hmac.new(mac_key, header, hashlib.sha256).digest()
+    if not hmac.compare_digest(_b64decode(lines[i][4:]), expected_mac):
+        raise AgeError("Age header MAC mismatch")
+
+    payload = data[header_len + len(lines[i]) + 1 :]
+    nonce, payload = payload[:16], payload[16:]
+    if len(nonce) != 16:
+        raise AgeError("Age payload too short")
+    payload_key = hkdf_sha256(file_key, nonce, b"payload")
+    return _stream(payload_key, payload, encrypt=False)
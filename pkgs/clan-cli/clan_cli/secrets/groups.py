@@ -20,7 +20,7 @@ from .folders import (
     sops_secrets_folder,
     sops_users_folder,
 )
-from .sops import update_keys
+from .sops import UpdateKeysError, update_keys_many
 from .types import (
     VALID_USER_NAME,
     group_name_type,
@@ -97,15 +97,14 @@ def list_directory(directory: Path) -> str:
 
 
 def update_group_keys(flake_dir: Path, group: str) -> list[Path]:
-    updated_paths = []
+    secrets_to_update = []
     for secret_ in secrets.list_secrets(flake_dir):
         secret = sops_secrets_folder(flake_dir) / secret_
         if (secret / "groups" / group).is_symlink():
-            updated_paths += update_keys(
-                secret,
-                list(sorted(secrets.collect_keys_for_path(secret))),
+            secrets_to_update.append(
+                (secret, list(sorted(secrets.collect_keys_for_path(secret))))
             )
-    return updated_paths
+    return update_keys_many(secrets_to_update)
 
 
 def add_member(
@@ -128,33 +127,41 @@ def add_member(
     return update_group_keys(flake_dir, group_folder.parent.name)
 
 
-def remove_member(flake_dir: Path, group_folder: Path, name: str) -> None:
+def remove_member(flake_dir: Path, group_folder: Path, name: str) -> list[Path]:
     target = group_folder / name
     if not target.exists():
         msg = f"{name} does not exist in group in {group_folder}: "
         msg += list_directory(group_folder)
         raise ClanError(msg)
     os.remove(target)
+    updated_paths = [target]
 
     if len(os.listdir(group_folder)) > 0:
-        update_group_keys(flake_dir, group_folder.parent.name)
+        try:
+            updated_paths += update_group_keys(flake_dir, group_folder.parent.name)
+        except UpdateKeysError as e:
+            e.changed_files.insert(0, target)
+            raise
 
     if len(os.listdir(group_folder)) == 0:
         os.rmdir(group_folder)
 
     if len(os.listdir(group_folder.parent)) == 0:
         os.rmdir(group_folder.parent)
+    return updated_paths
 
 
 def add_user(flake_dir: Path, group: str, name: str) -> None:
-    updated_files = add_member(
-        flake_dir, users_folder(flake_dir, group), sops_users_folder(flake_dir), name
-    )
-    commit_files(
-        updated_files,
-        flake_dir,
-        f"Add user {name} to group {group}",
-    )
+    updated_files: list[Path] = []
+    with secrets.commit_updated_keys(
+        updated_files, flake_dir, f"Add user {name} to group {group}"
+    ):
+        updated_files += add_member(
+            flake_dir,
+            users_folder(flake_dir, group),
+            sops_users_folder(flake_dir),
+            name,
+        )
 
 
 def add_user_command(args: argparse.Namespace) -> None:
@@ -162,7 +169,11 @@ def add_user_command(args: argparse.Namespace) -> None:
 
 
 def remove_user(flake_dir: Path, group: str, name: str) -> None:
-    remove_member(flake_dir, users_folder(flake_dir, group), name)
+    updated_files: list[Path] = []
+    with secrets.commit_updated_keys(
+        updated_files, flake_dir, f"Remove user {name} from group {group}"
+    ):
+        updated_files += remove_member(flake_dir, users_folder(flake_dir, group), name)
 
 
 def remove_user_command(args: argparse.Namespace) -> None:
@@ -170,17 +181,16 @@ def remove_user_command(args: argparse.Namespace) -> None:
 
 
 def add_machine(flake_dir: Path, group: str, name: str) -> None:
-    updated_files = add_member(
-        flake_dir,
-        machines_folder(flake_dir, group),
-        sops_machines_folder(flake_dir),
-        name,
-    )
-    commit_files(
-        updated_files,
-        flake_dir,
-        f"Add machine {name} to group {group}",
-    )
+    updated_files: list[Path] = []
+    with secrets.commit_updated_keys(
+        updated_files, flake_dir, f"Add machine {name} to group {group}"
+    ):
+        updated_files += add_member(
+            flake_dir,
+            machines_folder(flake_dir, group),
+            sops_machines_folder(flake_dir),
+            name,
+        )
 
 
 def add_machine_command(args: argparse.Namespace) -> None:
@@ -188,7 +198,13 @@ def add_machine_command(args: argparse.Namespace) -> None:
 
 
 def remove_machine(flake_dir: Path, group: str, name: str) -> None:
-    remove_member(flake_dir, machines_folder(flake_dir, group), name)
+    updated_files: list[Path] = []
+    with secrets.commit_updated_keys(
+        updated_files, flake_dir, f"Remove machine {name} from group {group}"
+    ):
+        updated_files += remove_member(
+            flake_dir, machines_folder(flake_dir, group), name
+        )
 
 
 def remove_machine_command(args: argparse.Namespace) -> None:
@@ -11,6 +11,7 @@ from ..completions import (
     complete_users,
 )
 from ..errors import ClanError
+from ..git import transaction
 from ..nix import nix_shell
 from .secrets import encrypt_secret, sops_secrets_folder
 
@@ -32,28 +33,30 @@ def import_sops(args: argparse.Namespace) -> None:
 
         res = run(cmd, error_msg=f"Could not import sops file {file}")
         secrets = json.loads(res.stdout)
-        for k, v in secrets.items():
-            k = args.prefix + k
-            if not isinstance(v, str):
-                print(
-                    f"WARNING: {k} is not a string but {type(v)}, skipping",
-                    file=sys.stderr,
+        # one commit for all imported secrets
+        with transaction(f"Import secrets from {file.name}", args.flake.path):
+            for k, v in secrets.items():
+                k = args.prefix + k
+                if not isinstance(v, str):
+                    print(
+                        f"WARNING: {k} is not a string but {type(v)}, skipping",
+                        file=sys.stderr,
+                    )
+                    continue
+                if (sops_secrets_folder(args.flake.path) / k / "secret").exists():
+                    print(
+                        f"WARNING: {k} already exists, skipping",
+                        file=sys.stderr,
+                    )
+                    continue
+                encrypt_secret(
+                    args.flake.path,
+                    sops_secrets_folder(args.flake.path) / k,
+                    v,
+                    add_groups=args.group,
+                    add_machines=args.machine,
+                    add_users=args.user,
                 )
-                continue
-            if (sops_secrets_folder(args.flake.path) / k / "secret").exists():
-                print(
-                    f"WARNING: {k} already exists, skipping",
-                    file=sys.stderr,
-                )
-                continue
-            encrypt_secret(
-                args.flake.path,
-                sops_secrets_folder(args.flake.path) / k,
-                v,
-                add_groups=args.group,
-                add_machines=args.machine,
-                add_users=args.user,
-            )
 
 
 def register_import_sops_parser(parser: argparse.ArgumentParser) -> None:
@@ -2,11 +2,13 @@ import argparse
 import logging
 from pathlib import Path
 
-from clan_cli.git import commit_files
-
 from ..errors import ClanError
-from .secrets import update_secrets
-from .sops import default_sops_key_path, generate_private_key, get_public_key
+from .secrets import commit_updated_keys, update_secrets
+from .sops import (
+    default_sops_key_path,
+    generate_private_key,
+    get_public_key_from_file,
+)
 
 log = logging.getLogger(__name__)
 
@@ -43,7 +45,7 @@ def generate_key() -> str:
 
 
 def show_key() -> str:
-    return get_public_key(default_sops_key_path().read_text())
+    return get_public_key_from_file(default_sops_key_path())
 
 
 def generate_command(args: argparse.Namespace) -> None:
@@ -59,7 +61,9 @@ def show_command(args: argparse.Namespace) -> None:
 
 def update_command(args: argparse.Namespace) -> None:
     flake_dir = args.flake.path
-    commit_files(update_secrets(flake_dir), flake_dir, "Updated secrets with new keys.")
+    paths: list[Path] = []
+    with commit_updated_keys(paths, flake_dir, "Updated secrets with new keys."):
+        paths.extend(update_secrets(flake_dir))
 
 
 def register_key_parser(parser: argparse.ArgumentParser) -> None:
@@ -0,0 +1,226 @@
+import logging
+import os
+from pathlib import Path
+from threading import Lock
+
+from ..errors import ClanError
+from .folders import (
+    sops_groups_folder,
+    sops_machines_folder,
+    sops_secrets_folder,
+    sops_users_folder,
+)
+
+log = logging.getLogger(__name__)
+
+
+def _mtime(path: Path) -> int:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _key_state(folder: Path) -> tuple[int, int]:
+    # a key.json replaced by a rename changes the folder, one edited in place the file
+    return _mtime(folder), _mtime(folder / "key.json")
+
+
+def _group_state(group: Path) -> tuple[int, int, int]:
+    return _mtime(group), _mtime(group / "machines"), _mtime(group / "users")
+
+
+class KeyIndex:
+    """
+    Public keys of all users and machines of a sops folder,
+    so that key.json files are read once per command and not once per secret.
+    Every entry is checked against the mtimes of its own files when it is
+    looked up, so a lookup costs a few stat calls however many users and
+    machines there are.
+    """
+
+    def __init__(self, token: tuple[int, ...]) -> None:
+        # mtimes of the users, machines, groups and secrets folders
+        self.token = token
+        # resolved user or machine folder -> state of its files, public key
+        self.entries: dict[Path, tuple[tuple[int, int], str]] = {}
+        # resolved group folder -> state of its folders, resolved member folders
+        self.members: dict[Path, tuple[tuple[int, int, int], list[Path]]] = {}
+        # secret name -> whether its folder has a secret file
+        self.secrets: dict[str, bool] = {}
+        self.secrets_folder: Path | None = None
+
+    @property
+    def keys(self) -> dict[Path, str]:
+        """
+        All public keys, checked against the key.json files
+        """
+        for folder in list(self.entries):
+            self.key(folder)
+        return {folder: key for folder, (_, key) in self.entries.items()}
+
+    @property
+    def owners(self) -> dict[str, Path]:
+        """
+        Public key -> user or machine folder, users take precedence over machines
+        """
+        owners: dict[str, Path] = {}
+        for folder, key in self.keys.items():
+            owners.setdefault(key, folder)
+        return owners
+
+    def key(self, folder: Path) -> str | None:
+        entry = self.entries.get(folder)
+        if entry is None:
+            return None
+        state = _key_state(folder)
+        if entry[0] == state:
+            return entry[1]
+        from .sops import read_key
+
+        with _lock:
+            try:
+                key = read_key(folder)
+            except (ClanError, OSError) as e:
+                # reported by the caller reading the key itself
+                log.debug(f"Dropping {folder} from key index: {e}")
+                self.entries.pop(folder, None)
+                return None
+            self.entries[folder] = (state, key)
+        return key
+
+    def group(self, group: Path) -> set[str] | None:
+        entry = self.members.get(group)
+        if entry is None:
+            return None
+        state = _group_state(group)
+        if entry[0] != state:
+            members = _group_members(group)
+            with _lock:
+                self.members[group] = (state, members)
+        else:
+            members = entry[1]
+        keys = set()
+        for member in members:
+            key = self.key(member)
+            if key is None:
+                # not a user or machine of this flake
+                return None
+            keys.add(key)
+        return keys
+
+    def has_secret(self, name: str) -> bool:
+        if self.secrets.get(name):
+            # removing a secret removes its folder, which changes the token
+            return True
+        if self.secrets_folder is None:
+            return False
+        exists = (self.secrets_folder / name / "secret").exists()
+        if name in self.secrets:
+            with _lock:
+                self.secrets[name] = exists
+        return exists
+
+    def list_secrets(self) -> list[str]:
+        return [name for name in list(self.secrets) if self.has_secret(name)]
+
+
+_indexes: dict[Path, KeyIndex] = {}
+_lock = Lock()
+
+
+def _state_token(flake_dir: Path) -> tuple[int, ...]:
+    """
+    Adding or removing users, machines, groups or secrets changes
+    the mtime of one of these folders.
+    """
+    return (
+        _mtime(sops_users_folder(flake_dir)),
+        _mtime(sops_machines_folder(flake_dir)),
+        _mtime(sops_groups_folder(flake_dir)),
+        _mtime(sops_secrets_folder(flake_dir)),
+    )
+
+
+def _group_members(group: Path) -> list[Path]:
+    members = []
+    for kind in ["machines", "users"]:
+        if not (group / kind).is_dir():
+            continue
+        for member in (group / kind).iterdir():
+            members.append(member.resolve())
+    return members
+
+
+def _build_index(flake_dir: Path, token: tuple[int, ...]) -> KeyIndex:
+    from .sops import read_key
+
+    index = KeyIndex(token=token)
+    for folder in [sops_users_folder(flake_dir), sops_machines_folder(flake_dir)]:
+        if not folder.is_dir():
+            continue
+        for entry in folder.iterdir():
+            if not (entry / "key.json").exists():
+                continue
+            state = _key_state(entry)
+            try:
+                key = read_key(entry)
+            except ClanError as e:
+                # reported when the key is actually used
+                log.debug(f"Skipping {entry} in key index: {e}")
+                continue
+            index.entries[entry.resolve()] = (state, key)
+
+    groups_folder = sops_groups_folder(flake_dir)
+    if groups_folder.is_dir():
+        for group in groups_folder.iterdir():
+            index.members[group.resolve()] = (
+                _group_state(group),
+                _group_members(group),
+            )
+
+    secrets_folder = sops_secrets_folder(flake_dir)
+    if secrets_folder.is_dir():
+        index.secrets_folder = secrets_folder
+        for name in os.listdir(secrets_folder):
+            index.secrets[name] = (secrets_folder / name / "secret").exists()
+    return index
+
+
+def get_key_index(flake_dir: Path) -> KeyIndex:
+    """
+    Returns the key index of the flake, rebuilding it if the sops folder changed.
+    """
+    flake_dir = flake_dir.resolve()
+    token = _state_token(flake_dir)
+    with _lock:
+        index = _indexes.get(flake_dir)
+        if index is None or index.token != token:
+            index = _build_index(flake_dir, token)
+            _indexes[flake_dir] = index
+        return index
+
+
+def invalidate_key_index() -> None:
+    """
+    Drops all indexes, for changes the file mtimes do not reflect,
+    e.g. a key.json rewritten within the timestamp granularity.
+    """
+    with _lock:
+        _indexes.clear()
+
+
+def lookup_key(target: Path) -> str | None:
+    """
+    Returns the public key of a resolved user or machine folder
+    """
+    # <flake>/sops/{users,machines}/<name>
+    return get_key_index(target.parent.parent.parent).key(target)
+
+
+def lookup_group(target: Path) -> set[str] | None:
+    """
+    Returns the public keys of all members of a resolved group folder
+    """
+    # <flake>/sops/groups/<name>
+    return get_key_index(target.parent.parent.parent).group(target)
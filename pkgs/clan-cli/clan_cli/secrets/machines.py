@@ -6,13 +6,14 @@ from ..errors import ClanError
 from ..git import commit_files
 from ..machines.types import machine_name_type, validate_hostname
 from . import secrets
+from .access_index import readable_by
 from .folders import (
     list_objects,
     remove_object,
     sops_machines_folder,
     sops_secrets_folder,
 )
-from .secrets import update_secrets
+from .secrets import commit_updated_keys, update_secrets
 from .sops import read_key, write_key
 from .types import public_or_private_age_key_type, secret_name_type
 
@@ -21,16 +22,10 @@ def add_machine(flake_dir: Path, name: str, key: str, force: bool) -> None:
     path = sops_machines_folder(flake_dir) / name
     write_key(path, key, force)
     paths = [path]
-
-    def filter_machine_secrets(secret: Path) -> bool:
-        return secret.joinpath("machines", name).exists()
-
-    paths.extend(update_secrets(flake_dir, filter_secrets=filter_machine_secrets))
-    commit_files(
-        paths,
-        flake_dir,
-        f"Add machine {name} to secrets",
-    )
+    with commit_updated_keys(paths, flake_dir, f"Add machine {name} to secrets"):
+        paths.extend(
+            update_secrets(flake_dir, names=readable_by(flake_dir, "machines", name))
+        )
 
 
 def remove_machine(flake_dir: Path, name: str) -> None:
@@ -0,0 +1,105 @@
+"""
+Process-local cache of decrypted secrets.
+
+A run of the vars or facts generators reads the same secrets many times,
+each read spawns sops or pass. The decrypted values are kept in memory,
+keyed by the path and the hash of the encrypted file, so that a changed
+file is decrypted again. The cache never writes values to disk and drops
+them after a TTL, so that long running processes do not hold them forever.
+Values are plain bytes, copies handed to callers and freed memory are not
+wiped, so this is no protection against reading the process memory.
+"""
+
+import hashlib
+import logging
+import time
+from collections.abc import Callable
+from pathlib import Path
+from threading import Lock, Timer
+
+log = logging.getLogger(__name__)
+
+# seconds after which a decrypted secret is dropped from the cache
+SECRET_CACHE_TTL = 600.0
+
+
+class _Entry:
+    def __init__(self, digest: bytes, value: bytes, expires: float) -> None:
+        self.digest = digest
+        self.value = value
+        self.expires = expires
+
+
+class SecretCache:
+    def __init__(self, ttl: float = SECRET_CACHE_TTL) -> None:
+        self.ttl = ttl
+        self._entries: dict[Path, _Entry] = {}
+        self._lock = Lock()
+        self._timer: Timer | None = None
+
+    def get(self, path: Path, digest: bytes) -> bytes | None:
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(path)
+            if entry is None or entry.digest != digest:
+                return None
+            return entry.value
+
+    def put(self, path: Path, digest: bytes, value: bytes) -> None:
+        with self._lock:
+            self._entries[path] = _Entry(digest, value, time.monotonic() + self.ttl)
+            if self._timer is None:
+                self._timer = Timer(self.ttl, self._expire_later)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for path, entry in list(self._entries.items()):
+            if entry.expires <= now:
+                del self._entries[path]
+
+    def _expire_later(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._expire()
+            if self._entries:
+                delay = (
+                    min(e.expires for e in self._entries.values()) - time.monotonic()
+                )
+                self._timer = Timer(max(delay, 0.0), self._expire_later)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+secret_cache = SecretCache()
+
+
+def cached_decrypt(
+    path: Path, decrypt: Callable[[], bytes], identity: str = ""
+) -> bytes:
+    """
+    Returns the decrypted content of the encrypted file at path,
+    calling decrypt only if the file was not decrypted before in this process.
+
+    :param identity: The key material used by decrypt, so that a secret is
+        not served to a caller with a different key that cannot decrypt it.
+    """
+    try:
+        digest = hashlib.sha256(path.read_bytes() + b"\0" + identity.encode()).digest()
+    except OSError:
+        # let decrypt report the error
+        return decrypt()
+    path = path.resolve()
+    value = secret_cache.get(path, digest)
+    if value is None:
+        value = decrypt()
+        secret_cache.put(path, digest, value)
+    return value
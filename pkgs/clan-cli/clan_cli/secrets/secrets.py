@@ -3,7 +3,8 @@ import getpass
 import os
 import shutil
 import sys
-from collections.abc import Callable
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
 from typing import IO
@@ -19,32 +20,54 @@ from ..completions import (
 )
 from ..errors import ClanError
 from ..git import commit_files
+from .access_index import readable_by, who_can_read
 from .folders import (
-    list_objects,
     sops_groups_folder,
     sops_machines_folder,
     sops_secrets_folder,
     sops_users_folder,
 )
-from .sops import decrypt_file, encrypt_file, ensure_sops_key, read_key, update_keys
+from .key_index import get_key_index, lookup_group, lookup_key
+from .sops import (
+    UpdateKeysError,
+    decrypt_file,
+    encrypt_file,
+    ensure_sops_key,
+    read_key,
+    update_keys,
+    update_keys_many,
+)
 from .types import VALID_SECRET_NAME, secret_name_type
 
 
+@contextmanager
+def commit_updated_keys(
+    paths: list[Path], flake_dir: Path, commit_message: str
+) -> Iterator[None]:
+    """
+    Commits the paths collected in the block. If some secrets could not be
+    rekeyed, the ones that were are committed before the error is raised.
+    """
+    try:
+        yield
+    except UpdateKeysError as e:
+        commit_files([*paths, *e.changed_files], flake_dir, commit_message)
+        raise
+    commit_files(paths, flake_dir, commit_message)
+
+
 def update_secrets(
-    flake_dir: Path, filter_secrets: Callable[[Path], bool] = lambda _: True
+    flake_dir: Path,
+    filter_secrets: Callable[[Path], bool] = lambda _: True,
+    names: list[str] | None = None,
 ) -> list[Path]:
-    changed_files = []
-    for name in list_secrets(flake_dir):
+    secrets = []
+    for name in list_secrets(flake_dir) if names is None else names:
         secret_path = sops_secrets_folder(flake_dir) / name
         if not filter_secrets(secret_path):
             continue
-        changed_files.extend(
-            update_keys(
-                secret_path,
-                list(sorted(collect_keys_for_path(secret_path))),
-            )
-        )
-    return changed_files
+        secrets.append((secret_path, list(sorted(collect_keys_for_path(secret_path)))))
+    return update_keys_many(secrets)
 
 
 def collect_keys_for_type(folder: Path) -> set[str]:
@@ -63,7 +86,10 @@ def collect_keys_for_type(folder: Path) -> set[str]:
         if folder.name != kind:
             tty.warn(f"Expected {p} to point to {folder} but points to {target.parent}")
             continue
-        keys.add(read_key(target))
+        key = lookup_key(target)
+        if key is None:
+            key = read_key(target)
+        keys.add(key)
     return keys
 
 
@@ -75,6 +101,10 @@ def collect_keys_for_path(path: Path) -> set[str]:
     if not groups.is_dir():
         return keys
     for group in groups.iterdir():
+        group_keys = lookup_group(group.resolve())
+        if group_keys is not None:
+            keys.update(group_keys)
+            continue
         keys.update(collect_keys_for_type(group / "machines"))
         keys.update(collect_keys_for_type(group / "users"))
     return keys
@@ -249,20 +279,33 @@ def disallow_member(group_folder: Path, name: str) -> list[Path]:
 
 
 def has_secret(secret_path: Path) -> bool:
+    flake_dir = secret_path.parent.parent.parent
+    if secret_path.parent == sops_secrets_folder(flake_dir):
+        return get_key_index(flake_dir).has_secret(secret_path.name)
     return (secret_path / "secret").exists()
 
 
-def list_secrets(flake_dir: Path, pattern: str | None = None) -> list[str]:
-    path = sops_secrets_folder(flake_dir)
+def list_secret_paths(folder: Path) -> set[Path]:
+    """
+    Returns all secrets below folder, walking the folder once
+    instead of calling has_secret for each of them
+    """
+    secrets = set()
+    for root, dirs, files in os.walk(folder):
+        if "secret" in files:
+            secrets.add(Path(root))
+            # do not descend into the machines, users and groups of the secret
+            dirs.clear()
+    return secrets
 
-    def validate(name: str) -> bool:
-        return (
-            VALID_SECRET_NAME.match(name) is not None
-            and has_secret(sops_secrets_folder(flake_dir) / name)
-            and (pattern is None or pattern in name)
-        )
 
-    return list_objects(path, validate)
+def list_secrets(flake_dir: Path, pattern: str | None = None) -> list[str]:
+    return [
+        name
+        for name in get_key_index(flake_dir).list_secrets()
+        if VALID_SECRET_NAME.match(name) is not None
+        and (pattern is None or pattern in name)
+    ]
 
 
 @dataclass
@@ -317,6 +360,35 @@ def set_command(args: argparse.Namespace) -> None:
     )
 
 
+def who_can_read_command(args: argparse.Namespace) -> None:
+    flake_dir = args.flake.path
+    if not has_secret(sops_secrets_folder(flake_dir) / args.secret):
+        raise ClanError(f"Secret '{args.secret}' does not exist")
+    readers = who_can_read(flake_dir, args.secret)
+    for kind in ["users", "machines"]:
+        if not readers[kind]:
+            continue
+        print(f"{kind}:")
+        for name, via in sorted(readers[kind].items()):
+            groups = [group for group in via if group]
+            if groups:
+                print(f"  {name} (via {', '.join(groups)})")
+            else:
+                print(f"  {name}")
+
+
+def readable_by_command(args: argparse.Namespace) -> None:
+    if args.user:
+        kind, name = "users", args.user
+    elif args.machine:
+        kind, name = "machines", args.machine
+    else:
+        kind, name = "groups", args.group
+    lst = readable_by(args.flake.path, kind, name)
+    if len(lst) > 0:
+        print("\n".join(lst))
+
+
 def rename_command(args: argparse.Namespace) -> None:
     flake_dir = args.flake.path
     old_path = sops_secrets_folder(flake_dir) / args.secret
@@ -381,6 +453,30 @@ def register_secrets_parser(subparser: argparse._SubParsersAction) -> None:
     )
     parser_set.set_defaults(func=set_command)
 
+    parser_who_can_read = subparser.add_parser(
+        "who-can-read", help="list the users and machines that can read a secret"
+    )
+    add_secret_argument(parser_who_can_read, True)
+    parser_who_can_read.set_defaults(func=who_can_read_command)
+
+    parser_readable_by = subparser.add_parser(
+        "readable-by", help="list the secrets a user, machine or group can read"
+    )
+    readable_by_group = parser_readable_by.add_mutually_exclusive_group(required=True)
+    readable_by_user_action = readable_by_group.add_argument(
+        "--user", type=str, help="the user to list the secrets of"
+    )
+    add_dynamic_completer(readable_by_user_action, complete_users)
+    readable_by_machine_action = readable_by_group.add_argument(
+        "--machine", type=str, help="the machine to list the secrets of"
+    )
+    add_dynamic_completer(readable_by_machine_action, complete_machines)
+    readable_by_group_action = readable_by_group.add_argument(
+        "--group", type=str, help="the group to list the secrets of"
+    )
+    add_dynamic_completer(readable_by_group_action, complete_groups)
+    parser_readable_by.set_defaults(func=readable_by_command)
+
     parser_rename = subparser.add_parser("rename", help="rename a secret")
     add_secret_argument(parser_rename, True)
     parser_rename.add_argument("new_name", type=str, help="the new name of the secret")
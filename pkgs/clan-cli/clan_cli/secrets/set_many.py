@@ -0,0 +1,284 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+from ..completions import (
+    add_dynamic_completer,
+    complete_groups,
+    complete_machines,
+    complete_users,
+)
+from ..errors import ClanError
+from ..git import commit_files, transaction
+from .folders import (
+    sops_groups_folder,
+    sops_machines_folder,
+    sops_secrets_folder,
+    sops_users_folder,
+)
+from .secrets import (
+    allow_member,
+    collect_keys_for_path,
+    groups_folder,
+    machines_folder,
+    users_folder,
+)
+from .sops import encrypt_file, ensure_sops_key
+from .types import VALID_SECRET_NAME
+
+yaml: ModuleType | None = None
+try:
+    import yaml  # type: ignore[no-redef]
+except ImportError:
+    pass
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class SecretEntry:
+    name: str
+    value: str
+    users: list[str] = field(default_factory=list)
+    machines: list[str] = field(default_factory=list)
+    groups: list[str] = field(default_factory=list)
+
+
+DOTENV_ESCAPES = {"n": "\n", "r": "\r", "t": "\t"}
+
+
+def parse_dotenv(text: str) -> dict[str, str]:
+    values = {}
+    for lineno, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        line = line.removeprefix("export ")
+        name, sep, value = line.partition("=")
+        if not sep:
+            raise ClanError(f"Invalid line {lineno} in dotenv input: missing '='")
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+            quote, value = value[0], value[1:-1]
+            if quote == '"':
+                value = re.sub(
+                    r"\\(.)", lambda m: DOTENV_ESCAPES.get(m[1], m[1]), value
+                )
+        values[name.strip()] = value
+    return values
+
+
+def parse_entries(text: str, input_type: str) -> list[SecretEntry]:
+    """
+    Parse a mapping of secret names to either the value or an object of the form
+    {"value": ..., "users": [...], "machines": [...], "groups": [...]}
+    """
+    data: Any
+    if input_type == "json":
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ClanError(f"Invalid json input: {e}") from e
+    elif input_type == "yaml":
+        if yaml is None:
+            raise ClanError("Reading yaml requires PyYAML, use json or dotenv input")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ClanError(f"Invalid yaml input: {e}") from e
+    elif input_type == "dotenv":
+        data = parse_dotenv(text)
+    else:
+        raise ClanError(f"Unknown input type: {input_type}")
+    if not isinstance(data, dict):
+        raise ClanError("Expected a mapping of secret names to values")
+
+    entries = []
+    for name, value in data.items():
+        if isinstance(value, dict):
+            if not isinstance(value.get("value"), str):
+                raise ClanError(f"Secret {name} has no string 'value'")
+            recipients = {}
+            for kind in ["users", "machines", "groups"]:
+                members = value.get(kind, [])
+                if not isinstance(members, list) or not all(
+                    isinstance(member, str) for member in members
+                ):
+                    raise ClanError(
+                        f"Secret {name} has invalid '{kind}', expected a list of names"
+                    )
+                recipients[kind] = members
+            entry = SecretEntry(str(name), value["value"], **recipients)
+        elif isinstance(value, str):
+            entry = SecretEntry(str(name), value)
+        else:
+            raise ClanError(f"Secret {name} is not a string but {type(value)}")
+        entries.append(entry)
+    return entries
+
+
+def set_many(
+    flake_dir: Path,
+    entries: list[SecretEntry],
+    add_users: list[str] = [],
+    add_machines: list[str] = [],
+    add_groups: list[str] = [],
+    max_workers: int | None = None,
+) -> list[str]:
+    """
+    Encrypt many new secrets at once. All symlinks are written first, the
+    secrets are encrypted by concurrent sops processes and committed together.
+    Returns the names of the secrets that were written.
+    """
+    for entry in entries:
+        if VALID_SECRET_NAME.match(entry.name) is None:
+            raise ClanError(f"Invalid secret name: {entry.name}")
+    key = ensure_sops_key(flake_dir)
+    pending: list[tuple[SecretEntry, Path, list[str]]] = []
+    with transaction(f"Set {len(entries)} secrets", flake_dir):
+        for entry in entries:
+            secret_path = sops_secrets_folder(flake_dir) / entry.name
+            if (secret_path / "secret").exists():
+                log.warning(f"{entry.name} already exists, skipping")
+                continue
+            if not entry.value:
+                log.warning(f"{entry.name} is empty, skipping")
+                continue
+            files_to_commit = []
+            members = [
+                (users_folder, sops_users_folder, [*add_users, *entry.users]),
+                (
+                    machines_folder,
+                    sops_machines_folder,
+                    [*add_machines, *entry.machines],
+                ),
+                (groups_folder, sops_groups_folder, [*add_groups, *entry.groups]),
+            ]
+            for secret_folder, source_folder, names in members:
+                for name in dict.fromkeys(names):
+                    files_to_commit.extend(
+                        allow_member(
+                            secret_folder(secret_path),
+                            source_folder(flake_dir),
+                            name,
+                            False,
+                        )
+                    )
+            # the public keys are resolved through the shared key index
+            keys = collect_keys_for_path(secret_path)
+            if key.pubkey not in keys:
+                keys.add(key.pubkey)
+                files_to_commit.extend(
+                    allow_member(
+                        users_folder(secret_path),
+                        sops_users_folder(flake_dir),
+                        key.username,
+                        False,
+                    )
+                )
+            files_to_commit.append(secret_path / "secret")
+            commit_files(files_to_commit, flake_dir, f"Set secret {entry.name}")
+            pending.append((entry, secret_path / "secret", sorted(keys)))
+
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            futures = [
+                executor.submit(encrypt_file, path, entry.value, keys)
+                for entry, path, keys in pending
+            ]
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                log.info(f"Encrypted {done}/{len(pending)} secrets")
+    return [entry.name for entry, _, _ in pending]
+
+
+def set_many_command(args: argparse.Namespace) -> None:
+    input_type = args.input_type
+    if input_type is None:
+        suffix = Path(args.input).suffix
+        input_type = {".yaml": "yaml", ".yml": "yaml", ".env": "dotenv"}.get(
+            suffix, "json"
+        )
+    if args.input == "-":
+        text = sys.stdin.read()
+    else:
+        try:
+            text = Path(args.input).read_text()
+        except OSError as e:
+            raise ClanError(f"Could not read file {args.input}: {e}") from e
+    entries = parse_entries(text, input_type)
+    for entry in entries:
+        entry.name = args.prefix + entry.name
+    start = time.monotonic()
+    names = set_many(
+        args.flake.path,
+        entries,
+        add_users=args.user,
+        add_machines=args.machine,
+        add_groups=args.group,
+        max_workers=args.jobs,
+    )
+    elapsed = max(time.monotonic() - start, 1e-6)
+    print(
+        f"Set {len(names)} of {len(entries)} secrets in {elapsed:.1f}s ({len(names) / elapsed:.1f} secrets/s)"
+    )
+
+
+def register_set_many_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--input-type",
+        choices=["json", "yaml", "dotenv"],
+        default=None,
+        help="the format of the input. If not specified, it will be guessed from the file extension",
+    )
+    group_action = parser.add_argument(
+        "--group",
+        type=str,
+        action="append",
+        default=[],
+        help="the group to share all secrets with (can be repeated)",
+    )
+    add_dynamic_completer(group_action, complete_groups)
+    machine_action = parser.add_argument(
+        "--machine",
+        type=str,
+        action="append",
+        default=[],
+        help="the machine to share all secrets with (can be repeated)",
+    )
+    add_dynamic_completer(machine_action, complete_machines)
+    user_action = parser.add_argument(
+        "--user",
+        type=str,
+        action="append",
+        default=[],
+        help="the user to share all secrets with (can be repeated)",
+    )
+    add_dynamic_completer(user_action, complete_users)
+    parser.add_argument(
+        "--prefix",
+        type=str,
+        default="",
+        help="the prefix to use for the secret names",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="the number of secrets to encrypt in parallel, defaults to the number of cpus",
+    )
+    parser.add_argument(
+        "input",
+        type=str,
+        help="a json, yaml or dotenv file mapping secret names to values "
+        "or to objects with a value and users, machines and groups (- for stdin)",
+    )
+    parser.set_defaults(func=set_many_command)
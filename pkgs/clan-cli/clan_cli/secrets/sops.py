@@ -1,9 +1,11 @@
 import io
 import json
+import logging
 import os
 import shutil
 import subprocess
 from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import contextmanager
 from pathlib import Path
 from tempfile import NamedTemporaryFile
@@ -13,7 +15,11 @@ from ..cmd import Log, run
 from ..dirs import user_config_dir
 from ..errors import ClanError
 from ..nix import nix_shell
-from .folders import sops_machines_folder, sops_users_folder
+from . import age
+from .key_index import get_key_index, invalidate_key_index
+from .secret_cache import cached_decrypt
+
+log = logging.getLogger(__name__)
 
 
 class SopsKey:
@@ -23,16 +29,48 @@ class SopsKey:
 
 
 def get_public_key(privkey: str) -> str:
-    cmd = nix_shell(["nixpkgs#age"], ["age-keygen", "-y"])
+    """
+    Derives the public keys of an age key file like `age-keygen -y` does,
+    but without spawning a process if the cryptography package is available.
+    """
+    if not age.available():
+        cmd = nix_shell(["nixpkgs#age"], ["age-keygen", "-y"])
+        try:
+            res = subprocess.run(
+                cmd, input=privkey, stdout=subprocess.PIPE, text=True, check=True
+            )
+        except subprocess.CalledProcessError as e:
+            raise ClanError(
+                "Failed to get public key for age private key. Is the key malformed?"
+            ) from e
+        return res.stdout.strip()
     try:
-        res = subprocess.run(
-            cmd, input=privkey, stdout=subprocess.PIPE, text=True, check=True
-        )
-    except subprocess.CalledProcessError as e:
+        identities = [
+            line.strip()
+            for line in privkey.splitlines()
+            if line.strip() and not line.strip().startswith("#")
+        ]
+        if not identities:
+            raise age.AgeError("No age identity found")
+        return "\n".join(age.identity_to_recipient(i) for i in identities)
+    except age.AgeError as e:
         raise ClanError(
             "Failed to get public key for age private key. Is the key malformed?"
         ) from e
-    return res.stdout.strip()
+
+
+# (key file, mtime) -> public key
+_public_keys: dict[tuple[Path, int], str] = {}
+
+
+def get_public_key_from_file(path: Path) -> str:
+    mtime = path.stat().st_mtime_ns
+    cache_key = (path.resolve(), mtime)
+    pubkey = _public_keys.get(cache_key)
+    if pubkey is None:
+        pubkey = get_public_key(path.read_text())
+        _public_keys[cache_key] = pubkey
+    return pubkey
 
 
 def generate_private_key(out_file: Path | None = None) -> tuple[str, str]:
@@ -73,17 +111,9 @@ def get_user_name(flake_dir: Path, user: str) -> str:
 
 
 def ensure_user_or_machine(flake_dir: Path, pub_key: str) -> SopsKey:
-    key = SopsKey(pub_key, username="")
-    folders = [sops_users_folder(flake_dir), sops_machines_folder(flake_dir)]
-
-    for folder in folders:
-        if folder.exists():
-            for user in folder.iterdir():
-                if not (user / "key.json").exists():
-                    continue
-                if read_key(user) == pub_key:
-                    key.username = user.name
-                    return key
+    owner = get_key_index(flake_dir).owners.get(pub_key)
+    if owner is not None:
+        return SopsKey(pub_key, username=owner.name)
 
     raise ClanError(
         f"Your sops key is not yet added to the repository. Please add it with 'clan secrets users add youruser {pub_key}' (replace youruser with your user name)"
@@ -104,7 +134,7 @@ def ensure_sops_key(flake_dir: Path) -> SopsKey:
         return ensure_user_or_machine(flake_dir, get_public_key(key))
     path = default_sops_key_path()
     if path.exists():
-        return ensure_user_or_machine(flake_dir, get_public_key(path.read_text()))
+        return ensure_user_or_machine(flake_dir, get_public_key_from_file(path))
     else:
         raise ClanError(
             "No sops key found. Please generate one with 'clan secrets key generate'."
@@ -121,7 +151,99 @@ def sops_manifest(keys: list[str]) -> Iterator[Path]:
         yield Path(manifest.name)
 
 
+def get_recipients(secret_path: Path) -> set[str] | None:
+    """
+    Returns the age recipients of a secret without decrypting it.
+    Returns None if the recipients cannot be determined,
+    i.e. the file is not in the json format or uses other key types than age.
+    """
+    try:
+        with open(secret_path / "secret") as f:
+            metadata = json.load(f)["sops"]
+        for key_type in ["kms", "gcp_kms", "azure_kv", "hc_vault", "pgp", "key_groups"]:
+            if metadata.get(key_type):
+                return None
+        return {entry["recipient"] for entry in metadata.get("age") or []}
+    except (OSError, json.JSONDecodeError, KeyError, TypeError):
+        return None
+
+
+def needs_update(secret_path: Path, keys: list[str]) -> bool:
+    return get_recipients(secret_path) != set(keys)
+
+
+def load_age_identities() -> list[str]:
+    identities = []
+    key = os.environ.get("SOPS_AGE_KEY")
+    if key:
+        identities.extend(age.parse_identities(key))
+    path = default_sops_key_path()
+    if path.exists():
+        identities.extend(age.parse_identities(path.read_text()))
+    return identities
+
+
+def rewrap_age_keys(secret_path: Path, keys: list[str]) -> bool:
+    """
+    Update the age recipients of a secret without spawning sops.
+    Adding or removing a recipient only re-encrypts the sops data key,
+    the encrypted values and the MAC stay the same.
+    Returns False if the secret cannot be updated natively.
+    """
+    if not age.available() or get_recipients(secret_path) is None:
+        return False
+    path = secret_path / "secret"
+    with open(path) as f:
+        content = json.load(f)
+    stanzas = {entry["recipient"]: entry for entry in content["sops"].get("age") or []}
+    for entry in stanzas.values():
+        if not isinstance(entry.get("enc"), str):
+            # left to sops to report
+            log.debug(f"Malformed age stanza for {entry['recipient']} in {path}")
+            return False
+
+    data_key = None
+    identities = load_age_identities()
+    for entry in stanzas.values():
+        try:
+            data_key = age.decrypt(age.dearmor(entry["enc"]), identities)
+            break
+        except (age.AgeError, ValueError):
+            # ValueError: invalid base64 in the armor
+            continue
+    if data_key is None:
+        return False
+
+    age_keys = []
+    for key in dict.fromkeys(keys):
+        if key in stanzas:
+            age_keys.append(stanzas[key])
+        else:
+            enc = age.armor(age.encrypt(data_key, [key]))
+            age_keys.append({"recipient": key, "enc": enc})
+    content["sops"]["age"] = age_keys
+
+    # atomic write, keep the formatting of sops and the file mode
+    mode = path.stat().st_mode & 0o7777
+    with NamedTemporaryFile(mode="w", dir=path.parent, delete=False) as tmp:
+        try:
+            os.fchmod(tmp.fileno(), mode)
+            json.dump(content, tmp, indent="\t")
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+    os.rename(tmp.name, path)
+    return True
+
+
 def update_keys(secret_path: Path, keys: list[str]) -> list[Path]:
+    if not needs_update(secret_path, keys):
+        return []
+    try:
+        if rewrap_age_keys(secret_path, keys):
+            return [secret_path / "secret"]
+    except (OSError, ClanError) as e:
+        log.debug(f"Falling back to sops for {secret_path}: {e}")
     with sops_manifest(keys) as manifest:
         secret_path = secret_path / "secret"
         time_before = secret_path.stat().st_mtime
@@ -142,6 +264,54 @@ def update_keys(secret_path: Path, keys: list[str]) -> list[Path]:
         return [secret_path]
 
 
+class UpdateKeysError(ClanError):
+    """
+    Raised when the keys of some secrets could not be updated.
+    changed_files are the secrets that were updated nonetheless.
+    """
+
+    def __init__(self, msg: str, changed_files: list[Path]) -> None:
+        super().__init__(msg)
+        self.changed_files = changed_files
+
+
+def update_keys_many(
+    secrets: list[tuple[Path, list[str]]], max_workers: int | None = None
+) -> list[Path]:
+    """
+    Update the keys of many secrets at once.
+    Secrets whose recipients already match are skipped,
+    the remaining ones are updated by concurrent sops processes.
+    If some updates fail, all others are still waited for
+    and an UpdateKeysError lists the files they changed.
+    """
+    changed = [(path, keys) for path, keys in secrets if needs_update(path, keys)]
+    if not changed:
+        return []
+
+    changed_files: list[Path] = []
+    failed: list[tuple[Path, Exception]] = []
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = {
+            executor.submit(update_keys, path, keys): path for path, keys in changed
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                changed_files.extend(future.result())
+            except Exception as e:
+                log.error(f"Could not update keys of {futures[future]}: {e}")
+                failed.append((futures[future], e))
+            if len(changed) > 1:
+                log.info(f"Updated keys of {done}/{len(changed)} secrets")
+    if failed:
+        names = ", ".join(sorted(path.name for path, _ in failed))
+        raise UpdateKeysError(
+            f"Could not update keys of {len(failed)}/{len(changed)} secrets: {names}",
+            sorted(changed_files),
+        ) from failed[0][1]
+    return sorted(changed_files)
+
+
 def encrypt_file(
     secret_path: Path, content: IO[str] | str | bytes | None, keys: list[str]
 ) -> None:
@@ -193,14 +363,31 @@ def encrypt_file(
                     pass
 
 
+def sops_identity() -> str:
+    """
+    Identifies the age key sops decrypts with, for the decrypted secret cache
+    """
+    key = os.environ.get("SOPS_AGE_KEY")
+    if key:
+        return key
+    path = default_sops_key_path()
+    try:
+        return f"{path}:{path.stat().st_mtime_ns}"
+    except OSError:
+        return str(path)
+
+
 def decrypt_file(secret_path: Path) -> str:
-    with sops_manifest([]) as manifest:
-        cmd = nix_shell(
-            ["nixpkgs#sops"],
-            ["sops", "--config", str(manifest), "--decrypt", str(secret_path)],
-        )
-    res = run(cmd, error_msg=f"Could not decrypt {secret_path}")
-    return res.stdout
+    def decrypt() -> bytes:
+        with sops_manifest([]) as manifest:
+            cmd = nix_shell(
+                ["nixpkgs#sops"],
+                ["sops", "--config", str(manifest), "--decrypt", str(secret_path)],
+            )
+        res = run(cmd, error_msg=f"Could not decrypt {secret_path}")
+        return res.stdout.encode()
+
+    return cached_decrypt(secret_path, decrypt, sops_identity()).decode()
 
 
 def write_key(path: Path, publickey: str, overwrite: bool) -> None:
@@ -216,6 +403,7 @@ def write_key(path: Path, publickey: str, overwrite: bool) -> None:
         )
     with os.fdopen(fd, "w") as f:
         json.dump({"publickey": publickey, "type": "age"}, f, indent=2)
+    invalidate_key_index()
 
 
 def read_key(path: Path) -> str:
@@ -0,0 +1,61 @@
+import hashlib
+import logging
+import subprocess
+from pathlib import Path
+from shlex import quote
+
+from ..machines.machines import Machine
+from .folders import sops_machines_folder, sops_secrets_folder
+
+log = logging.getLogger(__name__)
+
+MANIFEST_FILE = ".sops_manifest"
+MANIFEST_VERSION = 1
+
+
+def upload_manifest(flake_dir: Path, machine_name: str) -> str | None:
+    """
+    Returns a hash over the encrypted files that are uploaded to a machine
+    and the public key of the machine, or None if the machine key is not
+    managed by clan. The same manifest means the same uploaded secrets,
+    without decrypting anything.
+    """
+    files = [
+        sops_secrets_folder(flake_dir) / f"{machine_name}-age.key" / "secret",
+        sops_machines_folder(flake_dir) / machine_name / "key.json",
+    ]
+    h = hashlib.sha256(f"{MANIFEST_VERSION}\0".encode())
+    for path in files:
+        try:
+            content = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        h.update(path.relative_to(flake_dir).as_posix().encode() + b"\0")
+        h.update(hashlib.sha256(content).digest())
+    return h.hexdigest()
+
+
+def remote_manifest_matches(machine: Machine, manifest: str | None) -> bool:
+    """
+    Compares the manifest with the one uploaded with the secrets,
+    the uploaded key has to be present on the target as well.
+    """
+    if manifest is None:
+        return False
+    upload_directory = quote(machine.secrets_upload_directory)
+    remote_manifest = machine.target_host.run(
+        f"test -s {upload_directory}/key.txt && cat {upload_directory}/{MANIFEST_FILE}",
+        check=False,
+        stdout=subprocess.PIPE,
+        # Host.run only supports capturing stderr, it is discarded
+        stderr=subprocess.PIPE,
+    ).stdout.strip()
+    if not remote_manifest:
+        log.debug(f"No secrets manifest on {machine.name}")
+        return False
+    return remote_manifest == manifest
+
+
+def write_manifest(output_dir: Path, manifest: str | None) -> None:
+    if manifest is not None:
+        (output_dir / MANIFEST_FILE).write_text(manifest + "\n")
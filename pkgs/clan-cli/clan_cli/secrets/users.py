@@ -1,6 +1,8 @@
 import argparse
+import os
 from pathlib import Path
 
+from .. import tty
 from ..completions import (
     add_dynamic_completer,
     complete_secrets,
@@ -9,8 +11,15 @@ from ..completions import (
 from ..errors import ClanError
 from ..git import commit_files
 from . import secrets
-from .folders import list_objects, remove_object, sops_secrets_folder, sops_users_folder
-from .secrets import update_secrets
+from .access_index import group_members, readable_by
+from .folders import (
+    list_objects,
+    remove_object,
+    sops_groups_folder,
+    sops_secrets_folder,
+    sops_users_folder,
+)
+from .secrets import commit_updated_keys, update_secrets
 from .sops import read_key, write_key
 from .types import (
     VALID_USER_NAME,
@@ -28,21 +37,40 @@ def add_user(flake_dir: Path, name: str, key: str, force: bool) -> None:
 
     write_key(path, key, force)
     paths = [path]
-    paths.extend(update_secrets(flake_dir, filter_secrets=filter_user_secrets))
-    commit_files(
-        paths,
-        flake_dir,
-        f"Add user {name} to secrets",
-    )
+    with commit_updated_keys(paths, flake_dir, f"Add user {name} to secrets"):
+        paths.extend(update_secrets(flake_dir, filter_secrets=filter_user_secrets))
 
 
 def remove_user(flake_dir: Path, name: str) -> None:
+    affected_secrets = readable_by(flake_dir, "users", name)
     removed_paths = remove_object(sops_users_folder(flake_dir), name)
-    commit_files(
-        removed_paths,
-        flake_dir,
-        f"Remove user {name}",
-    )
+
+    # drop the links to the removed user and rekey only the secrets it could read
+    links = [
+        sops_secrets_folder(flake_dir) / secret / "users" / name
+        for secret in affected_secrets
+    ]
+    links.extend(
+        sops_groups_folder(flake_dir) / group / "users" / name
+        for group in group_members(flake_dir)
+    )
+    for link in links:
+        if link.is_symlink():
+            os.remove(link)
+            removed_paths.append(link)
+
+    def has_keys_left(secret: Path) -> bool:
+        if secrets.collect_keys_for_path(secret):
+            return True
+        tty.warn(f"No keys left for secret {secret.name}, it is not rekeyed")
+        return False
+
+    with commit_updated_keys(removed_paths, flake_dir, f"Remove user {name}"):
+        removed_paths.extend(
+            update_secrets(
+                flake_dir, filter_secrets=has_keys_left, names=affected_secrets
+            )
+        )
 
 
 def get_user(flake_dir: Path, name: str) -> str:
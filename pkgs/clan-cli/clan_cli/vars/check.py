@@ -8,11 +8,25 @@ from ..machines.machines import Machine
 log = logging.getLogger(__name__)
 
 
-def check_secrets(machine: Machine, generator_name: None | str = None) -> bool:
-    secret_vars_module = importlib.import_module(machine.secret_vars_module)
-    secret_vars_store = secret_vars_module.SecretStore(machine=machine)
-    public_vars_module = importlib.import_module(machine.public_vars_module)
-    public_vars_store = public_vars_module.FactStore(machine=machine)
+def check_secrets(
+    machine: Machine,
+    generator_name: None | str = None,
+    existing_secret_vars: set[tuple[str, str]] | None = None,
+    existing_public_vars: set[tuple[str, str]] | None = None,
+) -> bool:
+    """
+    Check that all files of the generators exist.
+    The existing files are listed once per store,
+    callers checking many generators can pass them in.
+    """
+    if existing_secret_vars is None:
+        secret_vars_module = importlib.import_module(machine.secret_vars_module)
+        secret_vars_store = secret_vars_module.SecretStore(machine=machine)
+        existing_secret_vars = secret_vars_store.list_existing()
+    if existing_public_vars is None:
+        public_vars_module = importlib.import_module(machine.public_vars_module)
+        public_vars_store = public_vars_module.FactStore(machine=machine)
+        existing_public_vars = public_vars_store.list_existing()
 
     missing_secret_vars = []
     missing_public_vars = []
@@ -22,13 +36,14 @@ def check_secrets(machine: Machine, generator_name: None | str = None) -> bool:
         services = list(machine.vars_generators.keys())
     for generator_name in services:
         for name, file in machine.vars_generators[generator_name]["files"].items():
-            if file["secret"] and not secret_vars_store.exists(generator_name, name):
+            if file["secret"] and (generator_name, name) not in existing_secret_vars:
                 log.info(
                     f"Secret fact '{name}' for service '{generator_name}' in machine {machine.name} is missing."
                 )
                 missing_secret_vars.append((generator_name, name))
-            if not file["secret"] and not public_vars_store.exists(
-                generator_name, name
+            if (
+                not file["secret"]
+                and (generator_name, name) not in existing_public_vars
             ):
                 log.info(
                     f"Public fact '{name}' for service '{generator_name}' in machine {machine.name} is missing."
@@ -0,0 +1,142 @@
+"""
+Content addressed fingerprints of vars generators.
+
+The fingerprint of a generator hashes the declarations its outputs are derived
+from: its script as written by the user, the hashes of the values of its
+dependencies, its prompt declarations and its file declarations.
+Hashes of nix store paths are left out, so updating nixpkgs does not rerun
+the generators and rotate their secrets. The fingerprint is stored next to the
+public outputs. A generator only has to run again if its fingerprint changed.
+"""
+
+import hashlib
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Any
+
+from ..machines.machines import Machine
+from .public_modules import FactStoreBase
+from .secret_modules import SecretStoreBase
+
+log = logging.getLogger(__name__)
+
+FINGERPRINT_FILE = ".fingerprint"
+FINGERPRINT_VERSION = 2
+
+# /nix/store/<hash>-<name>, the hash changes with every nixpkgs update
+_STORE_PATH_HASH = re.compile(r"(/nix/store/)[0-9a-z]{32}-")
+
+
+def fingerprint_path(machine: Machine, generator_name: str) -> Path:
+    if machine.vars_generators[generator_name]["share"]:
+        folder = machine.flake_dir / "vars" / "shared"
+    else:
+        folder = machine.flake_dir / "vars" / "per-machine" / machine.name
+    return folder / generator_name / FINGERPRINT_FILE
+
+
+def outputs_hash(values: dict[str, bytes]) -> str:
+    """
+    Hash of the values generated by a generator, independent of how they are stored.
+    Re-encrypting a secret for other keys does not change it.
+    """
+    h = hashlib.sha256()
+    for name in sorted(values):
+        h.update(name.encode())
+        h.update(b"\0")
+        h.update(hashlib.sha256(values[name]).digest())
+    return h.hexdigest()
+
+
+def read_fingerprint(machine: Machine, generator_name: str) -> dict[str, Any] | None:
+    path = fingerprint_path(machine, generator_name)
+    try:
+        data = json.loads(path.read_text())
+    except FileNotFoundError:
+        return None
+    except (OSError, json.JSONDecodeError) as e:
+        log.warning(f"Ignoring invalid fingerprint {path}: {e}")
+        return None
+    if not isinstance(data, dict) or data.get("version") != FINGERPRINT_VERSION:
+        return None
+    return data
+
+
+def write_fingerprint(machine: Machine, generator_name: str, fingerprint: str) -> Path:
+    path = fingerprint_path(machine, generator_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        "version": FINGERPRINT_VERSION,
+        "fingerprint": fingerprint,
+    }
+    path.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n")
+    return path
+
+
+def read_outputs(
+    machine: Machine,
+    generator_name: str,
+    secret_vars_store: SecretStoreBase,
+    public_vars_store: FactStoreBase,
+    shared: bool,
+) -> dict[str, bytes]:
+    values = {}
+    for file_name, file in machine.vars_generators[generator_name]["files"].items():
+        store = secret_vars_store if file["secret"] else public_vars_store
+        values[file_name] = store.get(generator_name, file_name, shared=shared)
+    return values
+
+
+def dependency_hashes(
+    machine: Machine,
+    generator_name: str,
+    secret_vars_store: SecretStoreBase,
+    public_vars_store: FactStoreBase,
+) -> dict[str, str]:
+    """
+    Returns the outputs hash of every dependency, computed from the stored values.
+    """
+    generator = machine.vars_generators[generator_name]
+    hashes = {}
+    for dep_generator in sorted(set(generator["dependencies"])):
+        values = read_outputs(
+            machine,
+            dep_generator,
+            secret_vars_store,
+            public_vars_store,
+            # dependencies are read the same way as in decrypt_dependencies
+            shared=generator["share"],
+        )
+        hashes[dep_generator] = outputs_hash(values)
+    return hashes
+
+
+def user_script(generator: dict[str, Any]) -> str:
+    """
+    The script of the generator without the hashes of the store paths it refers to.
+    finalScript is only used if the machine does not export the script itself,
+    the wrapper around it changes with nixpkgs as well.
+    """
+    script = generator.get("script", generator["finalScript"])
+    return _STORE_PATH_HASH.sub(r"\1", script)
+
+
+def compute_fingerprint(
+    machine: Machine, generator_name: str, dependencies: dict[str, str]
+) -> str:
+    generator = machine.vars_generators[generator_name]
+    inputs = {
+        "script": user_script(generator),
+        "dependencies": dependencies,
+        "prompts": {
+            name: hashlib.sha256(
+                json.dumps(prompt, sort_keys=True).encode()
+            ).hexdigest()
+            for name, prompt in generator["prompts"].items()
+        },
+        "files": generator["files"],
+        "share": generator["share"],
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
@@ -7,6 +7,7 @@ from getpass import getpass
 from graphlib import TopologicalSorter
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from threading import Lock
 from typing import Any
 
 from clan_cli.cmd import run
@@ -17,12 +18,19 @@ from ..completions import (
     complete_services_for_machine,
 )
 from ..errors import ClanError
-from ..git import commit_files
+from ..git import commit_files, transaction
 from ..machines.inventory import get_all_machines, get_selected_machines
 from ..machines.machines import Machine
 from ..nix import nix_shell
 from .check import check_secrets
+from .fingerprint import (
+    compute_fingerprint,
+    dependency_hashes,
+    read_fingerprint,
+    write_fingerprint,
+)
 from .public_modules import FactStoreBase
+from .scheduler import run_in_dependency_order
 from .secret_modules import SecretStoreBase
 
 log = logging.getLogger(__name__)
@@ -51,7 +59,7 @@ def bubblewrap_cmd(generator: str, tmpdir: Path) -> list[str]:
     # fmt: on
 
 
-# TODO: implement caching to not decrypt the same secret multiple times
+# secrets are decrypted once per process, see clan_cli.secrets.secret_cache
 def decrypt_dependencies(
     machine: Machine,
     generator_name: str,
@@ -99,18 +107,48 @@ def execute_generator(
     regenerate: bool,
     secret_vars_store: SecretStoreBase,
     public_vars_store: FactStoreBase,
+    prompt_values: dict[str, str] | None = None,
+    existing_secret_vars: set[tuple[str, str]] | None = None,
+    existing_public_vars: set[tuple[str, str]] | None = None,
 ) -> bool:
     # check if all secrets exist and generate them if at least one is missing
-    needs_regeneration = not check_secrets(machine, generator_name=generator_name)
+    needs_regeneration = not check_secrets(
+        machine,
+        generator_name=generator_name,
+        existing_secret_vars=existing_secret_vars,
+        existing_public_vars=existing_public_vars,
+    )
     log.debug(f"{generator_name} needs_regeneration: {needs_regeneration}")
+    is_shared = machine.vars_generators[generator_name]["share"]
+    # dependencies ran before, so their stored values are up to date
+    fingerprint = compute_fingerprint(
+        machine,
+        generator_name,
+        dependency_hashes(
+            machine, generator_name, secret_vars_store, public_vars_store
+        ),
+    )
     if not (needs_regeneration or regenerate):
-        return False
+        stored = read_fingerprint(machine, generator_name)
+        if stored is None:
+            # adopt outputs generated before fingerprints existed or with an
+            # older version of them instead of rotating all of them at once
+            commit_files(
+                [write_fingerprint(machine, generator_name, fingerprint)],
+                machine.flake_dir,
+                f"Add fingerprint of generator {generator_name} in machine {machine.name}",
+            )
+            return False
+        if stored.get("fingerprint") == fingerprint:
+            return False
+        log.info(
+            f"Inputs of generator {generator_name} in machine {machine.name} changed, regenerating"
+        )
     if not isinstance(machine.flake, Path):
         msg = f"flake is not a Path: {machine.flake}"
         msg += "fact/secret generation is only supported for local flakes"
 
     generator = machine.vars_generators[generator_name]["finalScript"]
-    is_shared = machine.vars_generators[generator_name]["share"]
 
     # build temporary file tree of dependencies
     decrypted_dependencies = decrypt_dependencies(
@@ -137,7 +175,13 @@ def execute_generator(
                 "prompts"
             ].items():
                 prompt_file = tmpdir_prompts / prompt_name
-                value = prompt_func(prompt["description"], prompt["type"])
+                if prompt_values is not None and prompt_name in prompt_values:
+                    value = prompt_values[prompt_name]
+                else:
+                    # prompts are asked before generators run concurrently,
+                    # this only happens if that missed the generator
+                    with _prompt_lock:
+                        value = prompt_func(prompt["description"], prompt["type"])
                 prompt_file.write_text(value)
 
         if sys.platform == "linux":
@@ -176,6 +220,7 @@ def execute_generator(
                 )
             if file_path:
                 files_to_commit.append(file_path)
+        files_to_commit.append(write_fingerprint(machine, generator_name, fingerprint))
     commit_files(
         files_to_commit,
         machine.flake_dir,
@@ -184,6 +229,9 @@ def execute_generator(
     return True
 
 
+_prompt_lock = Lock()
+
+
 def prompt_func(description: str, input_type: str) -> str:
     if input_type == "line":
         result = input(f"Enter the value for {description}: ")
@@ -209,19 +257,7 @@ def _get_subgraph(graph: dict[str, set], vertex: str) -> dict[str, set]:
     return {k: v for k, v in graph.items() if k in visited}
 
 
-def _generate_vars_for_machine(
-    machine: Machine,
-    generator_name: str | None,
-    regenerate: bool,
-) -> bool:
-    secret_vars_module = importlib.import_module(machine.secret_vars_module)
-    secret_vars_store = secret_vars_module.SecretStore(machine=machine)
-
-    public_vars_module = importlib.import_module(machine.public_vars_module)
-    public_vars_store = public_vars_module.FactStore(machine=machine)
-
-    machine_updated = False
-
+def _generator_graph(machine: Machine, generator_name: str | None) -> dict[str, set]:
     if generator_name and generator_name not in machine.vars_generators:
         generators = list(machine.vars_generators.keys())
         raise ClanError(
@@ -244,47 +280,232 @@ def _generate_vars_for_machine(
                 raise ClanError(
                     f"Generator {gen_name} has a dependency on {dep}, which does not exist"
                 )
+    return graph
 
-    # process generators in topological order
-    sorter = TopologicalSorter(graph)
-    for generator_name in sorter.static_order():
-        assert generator_name is not None
-        machine_updated |= execute_generator(
-            machine=machine,
-            generator_name=generator_name,
-            regenerate=regenerate,
-            secret_vars_store=secret_vars_store,
-            public_vars_store=public_vars_store,
-        )
-    if machine_updated:
-        # flush caches to make sure the new secrets are available in evaluation
-        machine.flush_caches()
-    return machine_updated
+
+def _fingerprint_changed(
+    machine: Machine,
+    generator_name: str,
+    secret_vars_store: SecretStoreBase,
+    public_vars_store: FactStoreBase,
+) -> bool:
+    stored = read_fingerprint(machine, generator_name)
+    if stored is None:
+        # adopted by execute_generator without running it
+        return False
+    fingerprint = compute_fingerprint(
+        machine,
+        generator_name,
+        dependency_hashes(
+            machine, generator_name, secret_vars_store, public_vars_store
+        ),
+    )
+    return stored.get("fingerprint") != fingerprint
+
+
+def _planned_generators(
+    machine: Machine,
+    graph: dict[str, set],
+    regenerate: bool,
+    existing: tuple[set[tuple[str, str]], set[tuple[str, str]]],
+    stores: tuple[SecretStoreBase, FactStoreBase],
+) -> set[str]:
+    """
+    Returns the generators that will run: the ones with missing files or
+    a changed fingerprint and the ones depending on them, as their inputs change.
+    """
+    planned: set[str] = set()
+    for generator_name in TopologicalSorter(graph).static_order():
+        if (
+            regenerate
+            or graph[generator_name] & planned
+            or not check_secrets(
+                machine,
+                generator_name=generator_name,
+                existing_secret_vars=existing[0],
+                existing_public_vars=existing[1],
+            )
+            or _fingerprint_changed(machine, generator_name, *stores)
+        ):
+            planned.add(generator_name)
+    return planned
+
+
+def _ask_prompts(
+    machine: Machine,
+    graph: dict[str, set],
+    regenerate: bool,
+    existing: tuple[set[tuple[str, str]], set[tuple[str, str]]],
+    stores: tuple[SecretStoreBase, FactStoreBase],
+    skip: set[str] = set(),
+) -> dict[str, dict[str, str]]:
+    """
+    Ask for the prompts of all generators that will run,
+    as generators run concurrently later on.
+    """
+    prompt_values: dict[str, dict[str, str]] = {}
+    if not any(
+        machine.vars_generators[generator_name]["prompts"]
+        for generator_name in graph
+        if generator_name not in skip
+    ):
+        # planning computes fingerprints, skip it if there is nothing to ask
+        return prompt_values
+    planned = _planned_generators(machine, graph, regenerate, existing, stores)
+    for generator_name in TopologicalSorter(graph).static_order():
+        if generator_name in skip or generator_name not in planned:
+            continue
+        prompts = machine.vars_generators[generator_name]["prompts"]
+        if not prompts:
+            continue
+        prompt_values[generator_name] = {
+            prompt_name: prompt_func(prompt["description"], prompt["type"])
+            for prompt_name, prompt in prompts.items()
+        }
+    return prompt_values
+
+
+# shared generators are identified by their name only
+SHARED = ""
+
+
+def _node(machine: Machine, generator_name: str) -> tuple[str, str]:
+    if machine.vars_generators[generator_name]["share"]:
+        return (SHARED, generator_name)
+    return (machine.name, generator_name)
 
 
 def generate_vars(
     machines: list[Machine],
     generator_name: str | None,
     regenerate: bool,
+    max_workers: int | None = None,
 ) -> bool:
-    was_regenerated = False
+    """
+    Run the generators of all machines in a pool of max_workers threads.
+    Generators run as soon as their dependencies are done,
+    the generated files are committed once at the end.
+    Shared generators run once, on the first machine that uses them,
+    and their secrets are shared with all other machines that use them.
+    """
+    graph: dict[tuple[str, str], set[tuple[str, str]]] = {}
+    # the machine that runs each generator
+    runner: dict[tuple[str, str], Machine] = {}
+    # the machines that use each shared generator
+    consumers: dict[str, list[str]] = {}
+    by_name: dict[str, Machine] = {}
+    stores: dict[str, tuple[SecretStoreBase, FactStoreBase]] = {}
+    # files that exist before any generator runs, listed once per machine
+    existing: dict[str, tuple[set[tuple[str, str]], set[tuple[str, str]]]] = {}
+    prompt_values: dict[tuple[str, str], dict[str, str]] = {}
+    errors: list[BaseException] = []
     for machine in machines:
-        errors = []
         try:
-            was_regenerated |= _generate_vars_for_machine(
-                machine, generator_name, regenerate
+            machine_graph = _generator_graph(machine, generator_name)
+            # creating the stores may add the machine key, do it before running
+            # generators concurrently
+            secret_vars_module = importlib.import_module(machine.secret_vars_module)
+            public_vars_module = importlib.import_module(machine.public_vars_module)
+            secret_vars_store = secret_vars_module.SecretStore(machine=machine)
+            public_vars_store = public_vars_module.FactStore(machine=machine)
+            stores[machine.name] = (secret_vars_store, public_vars_store)
+            existing[machine.name] = (
+                secret_vars_store.list_existing(),
+                public_vars_store.list_existing(),
             )
+            # prompts of shared generators are asked once
+            asked = {
+                gen_name
+                for gen_name in machine_graph
+                if _node(machine, gen_name) in runner
+            }
+            for gen_name, values in _ask_prompts(
+                machine,
+                machine_graph,
+                regenerate,
+                existing[machine.name],
+                stores[machine.name],
+                asked,
+            ).items():
+                prompt_values[_node(machine, gen_name)] = values
         except Exception as exc:
             log.error(f"Failed to generate facts for {machine.name}: {exc}")
-            errors += [exc]
-        if len(errors) > 0:
-            raise ClanError(
-                f"Failed to generate facts for {len(errors)} hosts. Check the logs above"
-            ) from errors[0]
+            errors.append(exc)
+            continue
+        by_name[machine.name] = machine
+        for gen_name, dependencies in machine_graph.items():
+            node = _node(machine, gen_name)
+            if node[0] == SHARED:
+                consumers.setdefault(gen_name, []).append(machine.name)
+                first = runner.get(node)
+                if first is not None:
+                    if (
+                        first.vars_generators[gen_name]["finalScript"]
+                        != machine.vars_generators[gen_name]["finalScript"]
+                    ):
+                        log.warning(
+                            f"Shared generator {gen_name} differs between {first.name} and {machine.name}, running the one of {first.name}"
+                        )
+            runner.setdefault(node, machine)
+            graph.setdefault(node, set()).update(
+                _node(machine, dep) for dep in dependencies
+            )
+
+    updated_machines: set[str] = set()
+
+    def execute(node: tuple[str, str]) -> None:
+        machine = runner[node]
+        gen_name = node[1]
+        secret_vars_store, public_vars_store = stores[machine.name]
+        updated = execute_generator(
+            machine=machine,
+            generator_name=gen_name,
+            regenerate=regenerate,
+            secret_vars_store=secret_vars_store,
+            public_vars_store=public_vars_store,
+            prompt_values=prompt_values.get(node),
+            existing_secret_vars=existing[machine.name][0],
+            existing_public_vars=existing[machine.name][1],
+        )
+        if node[0] != SHARED:
+            if updated:
+                updated_machines.add(machine.name)
+            return
+        # fan out the shared result to all machines that use it
+        files = machine.vars_generators[gen_name]["files"]
+        shared_files = []
+        for file_name, file in files.items():
+            if file["secret"]:
+                shared_files.extend(
+                    secret_vars_store.share_with(
+                        gen_name, file_name, consumers[gen_name]
+                    )
+                )
+        if shared_files:
+            commit_files(
+                shared_files,
+                machine.flake_dir,
+                f"Share generator {gen_name} with machines {', '.join(consumers[gen_name])}",
+            )
+        if updated or shared_files:
+            updated_machines.update(consumers[gen_name])
+
+    with transaction("Update vars"):
+        failed = run_in_dependency_order(graph, execute, max_workers)
+    errors.extend(failed.values())
 
-    if not was_regenerated:
+    for machine_name in updated_machines:
+        # flush caches to make sure the new secrets are available in evaluation
+        by_name[machine_name].flush_caches()
+
+    if len(errors) > 0:
+        raise ClanError(
+            f"Failed to generate facts for {len(errors)} generators. Check the logs above"
+        ) from errors[0]
+
+    if not updated_machines:
         print("All secrets and facts are already up to date")
-    return was_regenerated
+    return len(updated_machines) > 0
 
 
 def generate_command(args: argparse.Namespace) -> None:
@@ -292,7 +513,7 @@ def generate_command(args: argparse.Namespace) -> None:
         machines = get_all_machines(args.flake, args.option)
     else:
         machines = get_selected_machines(args.flake, args.option, args.machines)
-    generate_vars(machines, args.service, args.regenerate)
+    generate_vars(machines, args.service, args.regenerate, args.jobs)
 
 
 def register_generate_parser(parser: argparse.ArgumentParser) -> None:
@@ -320,4 +541,11 @@ def register_generate_parser(parser: argparse.ArgumentParser) -> None:
         help="whether to regenerate facts for the specified machine",
         default=None,
     )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=None,
+        help="the number of generators to run in parallel, defaults to the number of cpus",
+    )
     parser.set_defaults(func=generate_command)
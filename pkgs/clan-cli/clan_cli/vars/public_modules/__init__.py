@@ -1,10 +1,13 @@
 from abc import ABC, abstractmethod
+from collections.abc import Iterator
 from pathlib import Path
 
 from clan_cli.machines.machines import Machine
 
 
 class FactStoreBase(ABC):
+    machine: Machine
+
     @abstractmethod
     def __init__(self, machine: Machine) -> None:
         pass
@@ -13,6 +16,26 @@ class FactStoreBase(ABC):
     def exists(self, service: str, name: str, shared: bool = False) -> bool:
         pass
 
+    def declared_files(self) -> Iterator[tuple[str, str, bool]]:
+        """
+        (generator, file, shared) of all public files of the machine
+        """
+        for generator_name, generator in self.machine.vars_generators.items():
+            for name, file in generator["files"].items():
+                if not file["secret"]:
+                    yield generator_name, name, generator["share"]
+
+    def list_existing(self) -> set[tuple[str, str]]:
+        """
+        (generator, file) of all public files of the machine that exist.
+        Stores should override this to look them up at once.
+        """
+        return {
+            (generator_name, name)
+            for generator_name, name, shared in self.declared_files()
+            if self.exists(generator_name, name, shared=shared)
+        }
+
     @abstractmethod
     def set(
         self, service: str, name: str, value: bytes, shared: bool = False
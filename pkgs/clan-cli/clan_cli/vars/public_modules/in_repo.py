@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 from clan_cli.errors import ClanError
@@ -21,6 +22,17 @@ class FactStore(FactStoreBase):
         else:
             return self.per_machine_folder / generator_name / name
 
+    def list_existing(self) -> set[tuple[str, str]]:
+        present: set[Path] = set()
+        for folder in [self.per_machine_folder, self.shared_folder]:
+            for root, _, files in os.walk(folder):
+                present.update(Path(root, file) for file in files)
+        return {
+            (generator_name, name)
+            for generator_name, name, shared in self.declared_files()
+            if self._var_path(generator_name, name, shared) in present
+        }
+
     def set(
         self, generator_name: str, name: str, value: bytes, shared: bool = False
     ) -> Path | None:
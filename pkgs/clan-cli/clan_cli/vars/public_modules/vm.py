@@ -1,4 +1,5 @@
 import logging
+import os
 from pathlib import Path
 
 from clan_cli.dirs import vm_state_dir
@@ -21,6 +22,16 @@ class FactStore(FactStoreBase):
         fact_path = self.dir / service / name
         return fact_path.exists()
 
+    def list_existing(self) -> set[tuple[str, str]]:
+        present: set[Path] = set()
+        for root, _, files in os.walk(self.dir):
+            present.update(Path(root, file) for file in files)
+        return {
+            (service, name)
+            for service, name, _ in self.declared_files()
+            if self.dir / service / name in present
+        }
+
     def set(
         self, service: str, name: str, value: bytes, shared: bool = False
     ) -> Path | None:
@@ -0,0 +1,53 @@
+import contextvars
+import logging
+import os
+from collections.abc import Callable, Hashable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from graphlib import TopologicalSorter
+from typing import TypeVar
+
+log = logging.getLogger(__name__)
+
+Node = TypeVar("Node", bound=Hashable)
+
+
+def run_in_dependency_order(
+    graph: dict[Node, set[Node]],
+    execute: Callable[[Node], object],
+    max_workers: int | None = None,
+) -> dict[Node, BaseException]:
+    """
+    Run execute for every node of the graph in a pool of max_workers threads.
+    A node is started as soon as all of its dependencies are done,
+    nodes that depend on a failed node are skipped.
+    Returns the exceptions of the nodes that failed.
+    """
+    sorter = TopologicalSorter(graph)
+    sorter.prepare()
+    failed: dict[Node, BaseException] = {}
+    # nodes that are not executed because a dependency failed
+    skipped: set[Node] = set()
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        running: dict[Future, Node] = {}
+        while sorter.is_active():
+            for node in sorter.get_ready():
+                if any(dep in failed or dep in skipped for dep in graph.get(node, ())):
+                    log.info(f"Skipping {node}, a dependency failed")
+                    skipped.add(node)
+                    sorter.done(node)
+                    continue
+                # run in the context of the caller, i.e. its git transaction
+                context = contextvars.copy_context()
+                running[executor.submit(context.run, execute, node)] = node
+            if not running:
+                # skipped nodes made new nodes ready
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                exc = future.exception()
+                if exc is not None:
+                    log.error(f"Failed to run {node}: {exc}")
+                    failed[node] = exc
+                sorter.done(node)
+    return failed
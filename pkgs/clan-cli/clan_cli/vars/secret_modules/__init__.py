@@ -1,14 +1,37 @@
 from abc import ABC, abstractmethod
+from collections.abc import Iterator
 from pathlib import Path
 
 from clan_cli.machines.machines import Machine
 
 
 class SecretStoreBase(ABC):
+    machine: Machine
+
     @abstractmethod
     def __init__(self, machine: Machine) -> None:
         pass
 
+    def declared_files(self) -> Iterator[tuple[str, str, bool]]:
+        """
+        (generator, file, shared) of all secret files of the machine
+        """
+        for generator_name, generator in self.machine.vars_generators.items():
+            for name, file in generator["files"].items():
+                if file["secret"]:
+                    yield generator_name, name, generator["share"]
+
+    def list_existing(self) -> set[tuple[str, str]]:
+        """
+        (generator, file) of all secret files of the machine that exist.
+        Stores should override this to look them up at once.
+        """
+        return {
+            (generator_name, name)
+            for generator_name, name, shared in self.declared_files()
+            if self.exists(generator_name, name, shared=shared)
+        }
+
     @abstractmethod
     def set(
         self,
@@ -28,6 +51,15 @@ class SecretStoreBase(ABC):
     def exists(self, service: str, name: str, shared: bool = False) -> bool:
         pass
 
+    def share_with(
+        self, generator_name: str, name: str, machines: list[str]
+    ) -> list[Path]:
+        """
+        Give all machines that use a shared generator access to one of its
+        secrets. Returns the files that changed.
+        """
+        return []
+
     def update_check(self) -> bool:
         return False
 
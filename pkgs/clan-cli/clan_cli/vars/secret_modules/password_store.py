@@ -2,8 +2,10 @@ import os
 import subprocess
 from pathlib import Path
 
+from clan_cli.git import last_commits, worktree_files
 from clan_cli.machines.machines import Machine
 from clan_cli.nix import nix_shell
+from clan_cli.secrets.secret_cache import cached_decrypt
 
 from . import SecretStoreBase
 
@@ -24,6 +26,31 @@ class SecretStore(SecretStoreBase):
         else:
             return Path(f"machines/{self.machine.name}/{generator_name}/{name}")
 
+    def _list_files(self, *folders: str) -> set[Path]:
+        """
+        Files below the folders of the password store, relative to it.
+        Uses git ls-files and walks the folders if the store is no git repo.
+        """
+        password_store = Path(self._password_store_dir)
+        files = worktree_files(password_store, *folders)
+        if files is not None:
+            return files
+        files = set()
+        for folder in folders:
+            for root, _, names in os.walk(password_store / folder):
+                files.update(
+                    Path(root, name).relative_to(password_store) for name in names
+                )
+        return files
+
+    def list_existing(self) -> set[tuple[str, str]]:
+        present = self._list_files(f"machines/{self.machine.name}", "shared")
+        return {
+            (generator_name, name)
+            for generator_name, name, shared in self.declared_files()
+            if Path(f"{self._var_path(generator_name, name, shared)}.gpg") in present
+        }
+
     def set(
         self,
         generator_name: str,
@@ -48,18 +75,26 @@ class SecretStore(SecretStoreBase):
         return None  # we manage the files outside of the git repo
 
     def get(self, generator_name: str, name: str, shared: bool = False) -> bytes:
-        return subprocess.run(
-            nix_shell(
-                ["nixpkgs#pass"],
-                [
-                    "pass",
-                    "show",
-                    str(self._var_path(generator_name, name, shared)),
-                ],
-            ),
-            check=True,
-            stdout=subprocess.PIPE,
-        ).stdout
+        def decrypt() -> bytes:
+            return subprocess.run(
+                nix_shell(
+                    ["nixpkgs#pass"],
+                    [
+                        "pass",
+                        "show",
+                        str(self._var_path(generator_name, name, shared)),
+                    ],
+                ),
+                check=True,
+                stdout=subprocess.PIPE,
+            ).stdout
+
+        return cached_decrypt(
+            Path(self._password_store_dir)
+            / f"{self._var_path(generator_name, name, shared)}.gpg",
+            decrypt,
+            os.environ.get("GNUPGHOME", ""),
+        )
 
     def exists(self, generator_name: str, name: str, shared: bool = False) -> bool:
         return (
@@ -69,43 +104,13 @@ class SecretStore(SecretStoreBase):
 
     def generate_hash(self) -> bytes:
         password_store = self._password_store_dir
-        hashes = []
-        hashes.append(
-            subprocess.run(
-                nix_shell(
-                    ["nixpkgs#git"],
-                    [
-                        "git",
-                        "-C",
-                        password_store,
-                        "log",
-                        "-1",
-                        "--format=%H",
-                        f"machines/{self.machine.name}",
-                    ],
-                ),
-                stdout=subprocess.PIPE,
-            ).stdout.strip()
-        )
-        for symlink in Path(password_store).glob(f"machines/{self.machine.name}/**/*"):
+        machine_folder = f"machines/{self.machine.name}"
+        last_commit, file_commits = last_commits(Path(password_store), machine_folder)
+        hashes = [last_commit.encode()]
+        for symlink in Path(password_store).glob(f"{machine_folder}/**/*"):
             if symlink.is_symlink():
-                hashes.append(
-                    subprocess.run(
-                        nix_shell(
-                            ["nixpkgs#git"],
-                            [
-                                "git",
-                                "-C",
-                                password_store,
-                                "log",
-                                "-1",
-                                "--format=%H",
-                                str(symlink),
-                            ],
-                        ),
-                        stdout=subprocess.PIPE,
-                    ).stdout.strip()
-                )
+                path = str(symlink.relative_to(password_store))
+                hashes.append(file_commits.get(path, "").encode())
 
         # we sort the hashes to make sure that the order is always the same
         hashes.sort()
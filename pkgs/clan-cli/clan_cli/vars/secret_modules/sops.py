@@ -1,10 +1,23 @@
 from pathlib import Path
 
 from clan_cli.machines.machines import Machine
-from clan_cli.secrets.folders import sops_secrets_folder
+from clan_cli.secrets.folders import sops_machines_folder, sops_secrets_folder
 from clan_cli.secrets.machines import add_machine, has_machine
-from clan_cli.secrets.secrets import decrypt_secret, encrypt_secret, has_secret
-from clan_cli.secrets.sops import generate_private_key
+from clan_cli.secrets.secrets import (
+    allow_member,
+    collect_keys_for_path,
+    decrypt_secret,
+    encrypt_secret,
+    has_secret,
+    list_secret_paths,
+    machines_folder,
+)
+from clan_cli.secrets.sops import generate_private_key, update_keys
+from clan_cli.secrets.upload_manifest import (
+    remote_manifest_matches,
+    upload_manifest,
+    write_manifest,
+)
 
 from . import SecretStoreBase
 
@@ -51,6 +64,22 @@ class SecretStore(SecretStoreBase):
             )
         return base_path / generator_name / secret_name
 
+    def list_existing(self) -> set[tuple[str, str]]:
+        present = list_secret_paths(
+            self.machine.flake_dir / "sops" / "vars" / "per-machine" / self.machine.name
+        )
+        # the shared folder holds the secrets of all machines, only the files
+        # this machine declares are checked
+        return {
+            (generator_name, name)
+            for generator_name, name, shared in self.declared_files()
+            if (
+                has_secret(self.secret_path(generator_name, name, shared))
+                if shared
+                else self.secret_path(generator_name, name, shared) in present
+            )
+        }
+
     def set(
         self,
         generator_name: str,
@@ -79,6 +108,34 @@ class SecretStore(SecretStoreBase):
             self.secret_path(generator_name, name, shared),
         )
 
+    def share_with(
+        self, generator_name: str, name: str, machines: list[str]
+    ) -> list[Path]:
+        path = self.secret_path(generator_name, name, shared=True)
+        changed = []
+        for machine_name in machines:
+            if (machines_folder(path) / machine_name).exists():
+                continue
+            changed.extend(
+                allow_member(
+                    machines_folder(path),
+                    sops_machines_folder(self.machine.flake_dir),
+                    machine_name,
+                    do_update_keys=False,
+                )
+            )
+        if changed:
+            # re-encrypt once for all new machines
+            changed.extend(update_keys(path, sorted(collect_keys_for_path(path))))
+        return changed
+
+    # FIXME: add this when we switch to python3.12
+    # @override
+    def update_check(self) -> bool:
+        return remote_manifest_matches(
+            self.machine, upload_manifest(self.machine.flake_dir, self.machine.name)
+        )
+
     def upload(self, output_dir: Path) -> None:
         key_name = f"{self.machine.name}-age.key"
         if not has_secret(sops_secrets_folder(self.machine.flake_dir) / key_name):
@@ -89,3 +146,6 @@ class SecretStore(SecretStoreBase):
             sops_secrets_folder(self.machine.flake_dir) / key_name,
         )
         (output_dir / "key.txt").write_text(key)
+        write_manifest(
+            output_dir, upload_manifest(self.machine.flake_dir, self.machine.name)
+        )
@@ -1,6 +1,7 @@
 {
   # callPackage args
   argcomplete,
+  cryptography,
   gitMinimal,
   gnupg,
   installShellFiles,
@@ -13,6 +14,7 @@
   pytest-xdist,
   pytest,
   python3,
+  pyyaml,
   runCommand,
   setuptools,
   stdenv,
@@ -28,6 +30,8 @@
 let
   pythonDependencies = [
     argcomplete # Enables shell completions
+    cryptography # X25519 and ChaCha20-Poly1305 for rewrapping age keys
+    pyyaml # yaml input of clan secrets set-many
   ];
 
   # load nixpkgs runtime dependencies from a json file
@@ -64,6 +68,9 @@ let
     cp -r ${../../templates} $out/clan_cli/templates
 
     ${classgen}/bin/classgen ${inventory-schema}/schema.json $out/clan_cli/inventory/classes.py
+
+    # ship the json schema of the API for clients, generated once at build time
+    (cd $out && PYTHONDONTWRITEBYTECODE=1 ${python3.interpreter} -m clan_cli.api.cli --output clan_cli/api/schema.json)
   '';
 
   # Create a custom nixpkgs for use within the project
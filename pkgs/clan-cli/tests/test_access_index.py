@@ -0,0 +1,71 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from clan_cli.secrets.access_index import (
+    index_file,
+    readable_by,
+    secret_members,
+    who_can_read,
+)
+from clan_cli.secrets.folders import (
+    sops_groups_folder,
+    sops_machines_folder,
+    sops_secrets_folder,
+    sops_users_folder,
+)
+
+
+def link(source: Path, target: Path) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.symlink_to(os.path.relpath(source, target.parent))
+
+
+def add_secret(flake_dir: Path, name: str) -> Path:
+    path = sops_secrets_folder(flake_dir) / name
+    path.mkdir(parents=True)
+    (path / "secret").write_text("{}")
+    return path
+
+
+def test_access_index(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    flake_dir = tmp_path / "flake"
+    users = sops_users_folder(flake_dir)
+    machines = sops_machines_folder(flake_dir)
+    groups = sops_groups_folder(flake_dir)
+    link(users / "alice", groups / "admins" / "users" / "alice")
+    link(machines / "server", groups / "admins" / "machines" / "server")
+
+    db = add_secret(flake_dir, "db")
+    link(users / "bob", db / "users" / "bob")
+    link(groups / "admins", db / "groups" / "admins")
+    web = add_secret(flake_dir, "web")
+    link(machines / "web", web / "machines" / "web")
+    link(users / "alice", web / "users" / "alice")
+
+    assert secret_members(flake_dir)["db"] == {
+        "machines": [],
+        "users": ["bob"],
+        "groups": ["admins"],
+    }
+    assert index_file(flake_dir).exists()
+    assert who_can_read(flake_dir, "db") == {
+        "machines": {"server": ["admins"]},
+        "users": {"bob": [""], "alice": ["admins"]},
+    }
+    assert readable_by(flake_dir, "users", "alice") == ["db", "web"]
+    assert readable_by(flake_dir, "machines", "server") == ["db"]
+    assert readable_by(flake_dir, "groups", "admins") == ["db"]
+
+    # changes of a secret's folders are picked up from the cached index
+    link(machines / "server", web / "machines" / "server")
+    os.remove(db / "users" / "bob")
+    assert readable_by(flake_dir, "machines", "server") == ["db", "web"]
+    assert readable_by(flake_dir, "users", "bob") == []
+
+    # and so are removed secrets
+    (web / "secret").unlink()
+    assert readable_by(flake_dir, "users", "alice") == ["db"]
+    assert "web" not in secret_members(flake_dir)
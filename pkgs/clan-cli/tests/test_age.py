@@ -0,0 +1,168 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+
+from clan_cli.errors import ClanError
+from clan_cli.secrets import age
+from clan_cli.secrets.sops import (
+    decrypt_file,
+    encrypt_file,
+    get_public_key,
+    get_public_key_from_file,
+    rewrap_age_keys,
+)
+
+if TYPE_CHECKING:
+    from age_keys import KeyPair
+
+requires_cryptography = pytest.mark.skipif(
+    not age.available(), reason="cryptography is not installed"
+)
+
+
+@requires_cryptography
+def test_x25519() -> None:
+    # RFC 7748, section 5.2
+    scalar = bytes.fromhex(
+        "a546e36bf0527c9d3b16154b82465edd62144c0ac1fc5a18506a2244ba449ac4"
+    )
+    u = bytes.fromhex(
+        "e6db6867583030db3594c1a424b15f7c726624ec26b3353b10a903a6d0ab1c4c"
+    )
+    assert (
+        age.x25519(scalar, u).hex()
+        == "c3da55379de9c6908e94ea4df28d084f32eccf03491c71f754b4075577a28552"
+    )
+    # a low order point leads to an all zero shared secret
+    with pytest.raises(age.AgeError):
+        age.x25519(scalar, bytes(32))
+
+
+@requires_cryptography
+def test_chacha20poly1305() -> None:
+    # RFC 8439, section 2.8.2
+    key = bytes(range(0x80, 0xA0))
+    nonce = bytes.fromhex("070000004041424344454647")
+    aad = bytes.fromhex("50515253c0c1c2c3c4c5c6c7")
+    plaintext = b"Ladies and Gentlemen of the class of '99: If I could offer you only one tip for the future, sunscreen would be it."
+    ciphertext = age.chacha20poly1305_encrypt(key, nonce, plaintext, aad)
+    assert ciphertext[-16:].hex() == "1ae10b594f09e26a7e902ecbd0600691"
+    assert age.chacha20poly1305_decrypt(key, nonce, ciphertext, aad) == plaintext
+    with pytest.raises(age.AgeError):
+        age.chacha20poly1305_decrypt(key, nonce, ciphertext, b"")
+
+
+@requires_cryptography
+def test_decrypt_sops_data_key(test_root: Path, age_keys: list["KeyPair"]) -> None:
+    # the data key of a file encrypted by sops/age
+    secrets_yaml = (test_root / "data" / "secrets.yaml").read_text()
+    match = re.search(r"enc: \|\n(.*?END AGE ENCRYPTED FILE-----)", secrets_yaml, re.S)
+    assert match
+    armored = "\n".join(line.strip() for line in match.group(1).splitlines())
+    data_key = age.decrypt(age.dearmor(armored), [age_keys[1].privkey])
+    assert len(data_key) == 32
+    with pytest.raises(age.AgeError):
+        age.decrypt(age.dearmor(armored), [age_keys[0].privkey])
+
+
+def test_get_public_key(tmp_path: Path, age_keys: list["KeyPair"]) -> None:
+    # the test keys were generated with age-keygen
+    for key in age_keys:
+        assert get_public_key(key.privkey) == key.pubkey
+    if shutil.which("age-keygen"):
+        for key in age_keys:
+            proc = subprocess.run(
+                ["age-keygen", "-y"],
+                input=key.privkey,
+                stdout=subprocess.PIPE,
+                text=True,
+                check=True,
+            )
+            assert get_public_key(key.privkey) == proc.stdout.strip()
+    with pytest.raises(ClanError):
+        get_public_key("AGE-SECRET-KEY-1INVALID")
+    with pytest.raises(ClanError):
+        get_public_key("# created: 2024-01-01")
+
+    key_file = tmp_path / "keys.txt"
+    key_file.write_text(f"# public key: {age_keys[0].pubkey}\n{age_keys[0].privkey}\n")
+    assert get_public_key_from_file(key_file) == age_keys[0].pubkey
+    # a rewritten key file is read again
+    key_file.write_text(age_keys[1].privkey)
+    os.utime(key_file, ns=(0, 1))
+    assert get_public_key_from_file(key_file) == age_keys[1].pubkey
+
+
+@requires_cryptography
+def test_encrypt_decrypt(age_keys: list["KeyPair"]) -> None:
+    recipients = [age_keys[0].pubkey, age_keys[2].pubkey]
+    for plaintext in [b"", b"data key", bytes(200_000)]:
+        encrypted = age.dearmor(age.armor(age.encrypt(plaintext, recipients)))
+        assert age.decrypt(encrypted, [age_keys[2].privkey]) == plaintext
+        with pytest.raises(age.AgeError):
+            age.decrypt(encrypted, [age_keys[1].privkey])
+
+
+@requires_cryptography
+def test_rewrap_age_keys(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, age_keys: list["KeyPair"]
+) -> None:
+    secret_path = tmp_path / "secret"
+    encrypt_file(secret_path / "secret", "hello world", [age_keys[0].pubkey])
+    before = json.loads((secret_path / "secret").read_text())
+
+    monkeypatch.setenv("SOPS_AGE_KEY", age_keys[0].privkey)
+    assert rewrap_age_keys(secret_path, [age_keys[0].pubkey, age_keys[1].pubkey])
+    after = json.loads((secret_path / "secret").read_text())
+    assert after["data"] == before["data"]
+    assert after["sops"]["mac"] == before["sops"]["mac"]
+
+    # sops can decrypt the secret with the newly added key
+    monkeypatch.setenv("SOPS_AGE_KEY", age_keys[1].privkey)
+    assert decrypt_file(secret_path / "secret") == "hello world"
+
+    # and the removed key is gone
+    assert rewrap_age_keys(secret_path, [age_keys[1].pubkey])
+    monkeypatch.setenv("SOPS_AGE_KEY", age_keys[0].privkey)
+    assert not rewrap_age_keys(secret_path, [age_keys[0].pubkey])
+
+
+@requires_cryptography
+def test_rewrap_age_keys_metadata(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, age_keys: list["KeyPair"]
+) -> None:
+    data_key = bytes(32)
+    secret_path = tmp_path / "secret"
+    secret_path.mkdir()
+    path = secret_path / "secret"
+
+    def write(age_entries: list[dict[str, str]]) -> None:
+        sops = {"age": age_entries, "mac": "mac", "version": "3.8.1"}
+        path.write_text(json.dumps({"data": "ENC[...]", "sops": sops}))
+
+    enc = age.armor(age.encrypt(data_key, [age_keys[0].pubkey]))
+    write([{"recipient": age_keys[0].pubkey, "enc": enc}])
+    path.chmod(0o640)
+    monkeypatch.setenv("SOPS_AGE_KEY", age_keys[0].privkey)
+    monkeypatch.setenv("HOME", str(tmp_path))
+    assert rewrap_age_keys(secret_path, [age_keys[0].pubkey, age_keys[1].pubkey])
+    assert path.stat().st_mode & 0o777 == 0o640
+    stanzas = json.loads(path.read_text())["sops"]["age"]
+    assert stanzas[0]["enc"] == enc
+    added = age.dearmor(stanzas[1]["enc"])
+    assert age.decrypt(added, [age_keys[1].privkey]) == data_key
+
+    # malformed stanzas are left to sops
+    write([{"recipient": age_keys[0].pubkey}])
+    assert not rewrap_age_keys(secret_path, [age_keys[1].pubkey])
+    write([{"recipient": age_keys[0].pubkey, "enc": "not armored"}])
+    assert not rewrap_age_keys(secret_path, [age_keys[1].pubkey])
+    broken = age.ARMOR_BEGIN + "\n!!!\n" + age.ARMOR_END
+    write([{"recipient": age_keys[0].pubkey, "enc": broken}])
+    assert not rewrap_age_keys(secret_path, [age_keys[1].pubkey])
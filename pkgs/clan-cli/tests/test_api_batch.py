@@ -0,0 +1,146 @@
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from clan_cli.api import API, BatchCall, ErrorDataClass, MethodRegistry, from_dict
+from clan_cli.errors import ClanError
+from clan_cli.jsonrpc import handle_request
+
+
+@dataclass
+class Item:
+    name: str
+
+
+def make_registry() -> tuple[MethodRegistry, list[str]]:
+    registry = MethodRegistry()
+    items: list[str] = []
+    lock = threading.Lock()
+    # only passed if four calls wait at the same time
+    barrier = threading.Barrier(4)
+
+    @registry.register(read_only=True)
+    def list_items(meet: bool = False) -> list[str]:
+        if meet:
+            barrier.wait(timeout=10)
+        with lock:
+            return list(items)
+
+    @registry.register
+    def add_item(item: Item) -> None:
+        time.sleep(0.05)
+        with lock:
+            items.append(item.name)
+
+    @registry.register(read_only=True)
+    def fail(message: str) -> None:
+        raise ClanError(message)
+
+    @registry.register(read_only=True)
+    def crash() -> None:
+        raise RuntimeError("unexpected")
+
+    return registry, items
+
+
+def test_batch() -> None:
+    registry, items = make_registry()
+    assert registry.read_only == {"list_items", "fail", "crash"}
+    results = registry.batch(
+        [BatchCall("list_items", {"meet": True}) for _ in range(4)]
+        + [
+            BatchCall("add_item", {"item": {"name": "a"}}),
+            BatchCall("list_items"),
+            BatchCall("fail", {"message": "failed"}),
+            BatchCall("crash"),
+            BatchCall("missing"),
+            BatchCall("list_items", {"unknown": 1}),
+            BatchCall("batch", {"calls": []}),
+        ],
+        op_key="op",
+    )
+    # the reads run concurrently, the write after them
+    assert [getattr(result, "data", None) for result in results[:6]] == [
+        [],
+        [],
+        [],
+        [],
+        None,
+        ["a"],
+    ]
+    assert results[4].status == "success"
+    assert items == ["a"]
+    for result in results[6:]:
+        assert isinstance(result, ErrorDataClass)
+    assert isinstance(results[6], ErrorDataClass)
+    assert results[6].errors[0].message == "failed"
+    assert isinstance(results[7], ErrorDataClass)
+    assert results[7].errors[0].description == "RuntimeError"
+
+
+def test_batch_method(tmp_path: Path) -> None:
+    (tmp_path / "file").touch()
+    # the arguments are converted like the webview does
+    data = {
+        "calls": [
+            {"method": "get_directory", "args": {"current_path": str(tmp_path)}},
+            {"method": "no_such_method"},
+        ]
+    }
+    arguments = {
+        name: from_dict(API.get_method_argtype("batch", name), value)
+        for name, value in data.items()
+    }
+    response = API.functions["batch"](**arguments, op_key="op")
+    assert response.status == "success"
+    directory, missing = response.data
+    assert directory["status"] == "success"
+    assert directory["data"]["files"] == [
+        {"path": str(tmp_path / "file"), "file_type": "file"}
+    ]
+    assert missing["status"] == "error"
+    assert missing["errors"][0]["location"][0] == "no_such_method"
+
+
+def test_jsonrpc() -> None:
+    registry, _ = make_registry()
+    request = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "add_item",
+        "params": {"item": {"name": "a"}},
+    }
+    assert handle_request(registry, request) == {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "result": None,
+    }
+    responses = handle_request(
+        registry,
+        [
+            {"jsonrpc": "2.0", "id": 2, "method": "list_items"},
+            # a notification
+            {"jsonrpc": "2.0", "method": "add_item", "params": {"item": {"name": "b"}}},
+            {"jsonrpc": "2.0", "id": 3, "method": "list_items"},
+            {"jsonrpc": "2.0", "id": 4, "method": "missing"},
+            {"jsonrpc": "2.0", "id": 5, "method": "fail", "params": {"message": "x"}},
+            {"id": 6},
+        ],
+    )
+    assert [response["id"] for response in responses] == [2, 3, 4, 5, 6]
+    assert responses[0]["result"] == ["a"]
+    assert responses[1]["result"] == ["a", "b"]
+    assert [response.get("error", {}).get("code") for response in responses] == [
+        None,
+        None,
+        -32601,
+        -32000,
+        -32600,
+    ]
+    assert responses[3]["error"]["message"] == "x"
+    assert handle_request(registry, []) == {
+        "jsonrpc": "2.0",
+        "id": None,
+        "error": {"code": -32600, "message": "Empty batch"},
+    }
@@ -0,0 +1,80 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from clan_cli.api import MethodRegistry, ReadCache
+from clan_cli.git import commit_file
+
+
+def test_read_cache(git_repo: Path, tmp_path_factory: pytest.TempPathFactory) -> None:
+    registry = MethodRegistry()
+    calls: list[str] = []
+
+    @registry.register(cache=ReadCache(invalidate_on=["write"], flake_arg="base_path"))
+    def read(base_path: str, name: str = "a") -> str:
+        calls.append(name)
+        return (Path(base_path) / name).read_text()
+
+    @registry.register
+    def write(base_path: str) -> None:
+        pass
+
+    (git_repo / "a").write_text("1")
+    commit_file(git_repo / "a", git_repo, "init")
+    api_read = registry.functions["read"]
+    assert "read" in registry.read_only
+
+    assert api_read(str(git_repo), op_key="1").data == "1"
+    assert api_read(str(git_repo), name="a", op_key="2").data == "1"
+    assert calls == ["a"]
+    # other arguments are cached separately
+    (git_repo / "b").write_text("2")
+    commit_file(git_repo / "b", git_repo, "b")
+    assert api_read(str(git_repo), "b", op_key="3").data == "2"
+    assert calls == ["a", "b"]
+
+    # a change of the flake misses the cache
+    (git_repo / "a").write_text("changed")
+    assert api_read(str(git_repo), op_key="4").data == "changed"
+    assert calls == ["a", "b", "a"]
+    assert api_read(str(git_repo), op_key="5").data == "changed"
+    assert calls == ["a", "b", "a"]
+
+    # writes invalidate the cache
+    registry.functions["write"](str(git_repo), op_key="6")
+    api_read(str(git_repo), op_key="7")
+    assert calls == ["a", "b", "a", "a"]
+
+    # flakes that are no git repository are not cached
+    plain = tmp_path_factory.mktemp("plain")
+    (plain / "a").write_text("plain")
+    api_read(str(plain), op_key="8")
+    api_read(str(plain), op_key="9")
+    assert calls[-2:] == ["a", "a"]
+
+    # direct calls are not cached
+    read(str(git_repo))
+    assert len(calls) == 7
+
+
+def test_read_cache_ttl() -> None:
+    registry = MethodRegistry()
+    calls: list[int] = []
+
+    @registry.register(cache=ReadCache(ttl=0.05, max_entries=2))
+    def read(value: int) -> int:
+        calls.append(value)
+        return value
+
+    api_read = registry.functions["read"]
+    for value in [1, 1, 2, 2]:
+        assert api_read(value, op_key="op").data == value
+    assert calls == [1, 2]
+    # the oldest entry is dropped
+    api_read(3, op_key="op")
+    api_read(1, op_key="op")
+    assert calls == [1, 2, 3, 1]
+    time.sleep(0.06)
+    api_read(1, op_key="op")
+    assert calls == [1, 2, 3, 1, 1]
@@ -0,0 +1,40 @@
+import json
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+from clan_cli.api import API, MethodRegistry
+
+
+@dataclass
+class Greeting:
+    name: str
+    greeting: str
+    loud: bool = False
+
+
+def test_json_schema_reproducible() -> None:
+    registry = MethodRegistry()
+
+    @registry.register
+    def greet(greeting: Greeting) -> str:
+        return f"{greeting.greeting} {greeting.name}"
+
+    schema = registry.to_json_schema()
+    arguments = schema["properties"]["greet"]["properties"]["arguments"]
+    # in the order of the fields
+    assert arguments["properties"]["greeting"]["required"] == ["name", "greeting"]
+
+
+def test_json_schema_output(tmp_path: Path) -> None:
+    # the schema shipped with the package is written at build time
+    schema_file = tmp_path / "schema.json"
+    subprocess.run(
+        [sys.executable, "-m", "clan_cli.api.cli", "--output", str(schema_file)],
+        cwd=Path(__file__).parent.parent,
+        check=True,
+    )
+    schema = json.loads(schema_file.read_text())
+    assert set(API.functions) <= set(schema["properties"])
+    assert "update_machines" in schema["properties"]
@@ -0,0 +1,158 @@
+import math
+import subprocess
+import threading
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from clan_cli.clan_uri import FlakeId
+from clan_cli.errors import ClanError
+from clan_cli.machines.build_hosts import (
+    BuildHostEntry,
+    BuildHostPool,
+    parse_loadavg,
+    split_weight,
+)
+from clan_cli.machines.machines import Machine
+from clan_cli.ssh import Host
+
+
+class FakeLoadPool(BuildHostPool):
+    def __init__(
+        self, addresses: list[str], loads: dict[str, float], state_file: Path | None
+    ) -> None:
+        super().__init__(addresses, state_file=state_file)
+        self.loads = loads
+
+    def read_load(self, entry: BuildHostEntry) -> float:
+        return self.loads[entry.name]
+
+
+def machine(name: str, system: str = "x86_64-linux") -> Machine:
+    return Machine(
+        name=name,
+        flake=FlakeId("/tmp/flake"),
+        cached_deployment={"targetHost": f"root@{name}", "system": system},
+    )
+
+
+def test_split_weight() -> None:
+    assert split_weight("root@builder") == ("root@builder", 1.0)
+    assert split_weight("root@builder?weight=4") == ("root@builder", 4.0)
+    assert split_weight("root@builder?weight=2&IdentityFile=/key") == (
+        "root@builder?IdentityFile=/key",
+        2.0,
+    )
+    with pytest.raises(ClanError):
+        split_weight("root@builder?weight=0")
+
+
+def test_parse_loadavg() -> None:
+    assert parse_loadavg("8.00 4.00 2.00 1/100 1234\n4\n") == 2.0
+    with pytest.raises(ClanError):
+        parse_loadavg("")
+
+
+def test_weighted_assignment(tmp_path: Path) -> None:
+    pool = FakeLoadPool(
+        ["root@big?weight=3", "root@small"],
+        loads={"big": 0.0, "small": 0.0},
+        state_file=None,
+    )
+    builders = [pool.select(machine(f"m{i}", system=f"s{i}")).name for i in range(4)]
+    # the big builder has three times the capacity of the small one
+    assert builders.count("big") == 3
+    assert builders.count("small") == 1
+
+
+def test_live_load_is_respected() -> None:
+    pool = FakeLoadPool(
+        ["root@busy", "root@idle"],
+        loads={"busy": 3.0, "idle": 0.1},
+        state_file=None,
+    )
+    assert pool.select(machine("m1")).name == "idle"
+
+
+def test_unreachable_hosts_are_skipped() -> None:
+    pool = FakeLoadPool(
+        ["root@down", "root@up"],
+        loads={"down": float("inf"), "up": 5.0},
+        state_file=None,
+    )
+    assert pool.select(machine("m1")).name == "up"
+    pool.loads["up"] = float("inf")
+    for entry in pool.entries:
+        entry.load_checked = float("-inf")
+    with pytest.raises(ClanError):
+        pool.select(machine("m2"))
+
+
+def test_store_locality(tmp_path: Path) -> None:
+    state_file = tmp_path / "build-hosts.json"
+    pool = FakeLoadPool(
+        ["root@a", "root@b"], loads={"a": 0.0, "b": 0.0}, state_file=state_file
+    )
+    first = pool.select(machine("m1", system="aarch64-linux"))
+    # same platform stays on the builder as long as it is not much busier
+    assert pool.select(machine("m2", system="aarch64-linux")) is first
+    other = pool.select(machine("m3", system="x86_64-linux"))
+    assert other is not first
+
+    # the previous builder of a machine is remembered across runs
+    pool = FakeLoadPool(
+        ["root@a", "root@b"], loads={"a": 0.0, "b": 0.0}, state_file=state_file
+    )
+    assert pool.select(machine("m3", system="x86_64-linux")).name == other.name
+
+
+def test_lease_releases_job() -> None:
+    pool = FakeLoadPool(["root@a"], loads={"a": 0.0}, state_file=None)
+    m = machine("m1")
+    with pool.lease(m) as host:
+        assert host.host == "a"
+        assert host.meta["target_host"].host == "m1"
+        assert pool.entries[0].jobs == 1
+    assert pool.entries[0].jobs == 0
+
+
+def test_loads_are_read_in_parallel() -> None:
+    addresses = ["root@a", "root@b", "root@c"]
+    # only passed if all loads are read at the same time
+    barrier = threading.Barrier(len(addresses))
+
+    class ParallelPool(BuildHostPool):
+        def read_load(self, entry: BuildHostEntry) -> float:
+            # select and release are not blocked while the loads are read
+            assert not self._lock.locked()
+            barrier.wait(timeout=10)
+            return 0.0
+
+    pool = ParallelPool(addresses)
+    pool.select(machine("m1"))
+    assert all(entry.load == 0.0 for entry in pool.entries)
+
+
+def test_read_load_failures(monkeypatch: pytest.MonkeyPatch) -> None:
+    pool = BuildHostPool(["root@builder"])
+    entry = pool.entries[0]
+    outputs: list[Any] = [
+        subprocess.CompletedProcess([], 0, stdout="4.00 2.00 1.00 1/100 1234\n2\n"),
+        subprocess.CompletedProcess([], 0, stdout="garbage"),
+        subprocess.CompletedProcess([], 255, stdout=""),
+        subprocess.TimeoutExpired("ssh", 10),
+    ]
+
+    def run(self: Host, *args: Any, **kwargs: Any) -> Any:
+        output = outputs.pop(0)
+        if isinstance(output, Exception):
+            raise output
+        return output
+
+    monkeypatch.setattr(Host, "run", run)
+    assert pool.read_load(entry) == 2.0
+    # hosts whose load cannot be read are skipped instead of failing the update
+    assert pool.read_load(entry) == math.inf
+    assert pool.read_load(entry) == math.inf
+    assert pool.read_load(entry) == math.inf
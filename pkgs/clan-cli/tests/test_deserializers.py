@@ -303,3 +303,118 @@ def test_literal_field() -> None:
     with pytest.raises(ClanError):
         # Not a valid value
         from_dict(Person, {"name": "open"})
+
+
+def test_compiled_plan_matches_reflection() -> None:
+    from clan_cli.api.serde import construct_dataclass, construct_value
+
+    @dataclass
+    class Address:
+        street: str
+        number: int | None = None
+
+    @dataclass
+    class Person:
+        name: str
+        home: Path | None = None
+        tags: list[str] = field(default_factory=list)
+        addresses: dict[str, Address] = field(default_factory=dict)
+        kind: Literal["a", "b"] = "a"
+        weight: float = 0.0
+        admin: bool = False
+        nick: str | None = field(default=None, metadata={"alias": "nickname"})
+        optional_tags: list[str] | None = None
+        _private: str = "private"
+
+    def outcome(func: Any) -> Any:
+        try:
+            return ("ok", func())
+        except Exception as e:
+            return (type(e), str(e), getattr(e, "location", None))
+
+    person_values: list[Any] = [
+        {"name": "John"},
+        {"name": "John", "home": "/home/john", "tags": ["x"], "nickname": "j"},
+        {"name": "John", "addresses": {"home": {"street": "Main", "number": 3}}},
+        {"name": "John", "addresses": {"home": {"number": 3}}},
+        {"name": "John", "addresses": {"home": "Main"}},
+        {"name": "John", "addresses": []},
+        {"name": "John", "home": 3},
+        {"name": 3},
+        {"name": None},
+        {"name": "John", "home": None, "nickname": None},
+        {"name": "John", "optional_tags": None},
+        {"name": "John", "kind": "c"},
+        {"name": "John", "weight": "1.0"},
+        {"name": "John", "weight": 1},
+        {"name": "John", "admin": 1},
+        {"name": "John", "tags": "x"},
+        {"name": "John", "tags": [1]},
+        {"name": "John", "_private": "x"},
+        {},
+    ]
+    for value in person_values:
+        assert outcome(lambda: from_dict(Person, value, ["person"])) == outcome(
+            lambda: construct_dataclass(Person, value, ["person"])
+        )
+
+    value_types: list[tuple[Any, list[Any]]] = [
+        (str, ["x", 1, None]),
+        (int, [1, "1", 1.5, None]),
+        (bool, [True, 1]),
+        (Path | None, ["/x", None, 1]),
+        (list[int] | None, [[1, 2], None, "x"]),
+        (dict[str, int], [{"a": 1}, [1]]),
+        (dict[str, Any], [{"a": [1, None], "b": {"c": "d"}}, [1]]),
+        (list[Address], [[{"street": "x"}], [{}], ["x"]]),
+        (Literal["x", "y"], ["x", "z"]),
+        (None, [None, 1]),
+        (Address | None, [{"street": "x"}, None, "x"]),
+    ]
+    for t, values in value_types:
+        for value in values:
+            assert outcome(lambda: from_dict(t, value, ["loc"])) == outcome(
+                lambda: construct_value(t, value, ["loc"])
+            ), (t, value)
+
+
+def test_compile_plans_concurrently(monkeypatch: pytest.MonkeyPatch) -> None:
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from threading import Event
+
+    from clan_cli.api import serde
+
+    @dataclass
+    class Leaf:
+        name: str
+        tags: list[str] = field(default_factory=list)
+
+    @dataclass
+    class Node:
+        leaves: dict[str, Leaf]
+        kind: Literal["a", "b"] = "a"
+
+    data = {"leaves": {"x": {"name": "x", "tags": ["t"]}}, "kind": "b"}
+    expected = Node(leaves={"x": Leaf(name="x", tags=["t"])}, kind="b")
+
+    # the first thread is still compiling Node when the others convert it
+    compiling = Event()
+    compile_dataclass = serde._compile_dataclass
+
+    def slow_compile(t: Any) -> Any:
+        if t is Node and not compiling.is_set():
+            compiling.set()
+            time.sleep(0.1)
+        return compile_dataclass(t)
+
+    monkeypatch.setattr(serde, "_compile_dataclass", slow_compile)
+
+    def convert(first: bool) -> Node:
+        if not first:
+            compiling.wait()
+        return from_dict(Node, data)
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(convert, [True] + [False] * 7))
+    assert results == [expected] * 8
@@ -67,3 +67,166 @@ def test_clan_flake_in_subdir(git_repo: Path, monkeypatch: pytest.MonkeyPatch) -
         ).decode("utf-8")
         == "test commit\n\n"
     )
+
+
+def test_transaction(git_repo: Path) -> None:
+    (git_repo / "a.txt").write_text("a")
+    git.commit_file(git_repo / "a.txt", git_repo, "init")
+    head = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=git_repo)
+
+    with git.transaction("batch"):
+        for name in ["b", "c"]:
+            (git_repo / f"{name}.txt").write_text(name)
+            git.commit_file(git_repo / f"{name}.txt", git_repo, f"add {name}")
+            # nested transactions join the outer one
+            with git.transaction():
+                (git_repo / f"{name}.nested").write_text(name)
+                git.commit_file(git_repo / f"{name}.nested", git_repo, "nested")
+        # nothing is committed until the outermost transaction exits
+        assert (
+            subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=git_repo) == head
+        )
+    assert not subprocess.check_output(["git", "status", "--porcelain"], cwd=git_repo)
+    assert (
+        subprocess.check_output(["git", "rev-list", "--count", "HEAD"], cwd=git_repo)
+        == b"2\n"
+    )
+    assert (
+        subprocess.check_output(
+            ["git", "log", "-1", "--pretty=%B"], cwd=git_repo
+        ).decode("utf-8")
+        == "batch\n\nadd b\nnested\nadd c\n\n"
+    )
+
+
+def test_transaction_rollback(git_repo: Path) -> None:
+    (git_repo / "a.txt").write_text("a")
+    (git_repo / "deleted.txt").write_text("deleted")
+    (git_repo / "edited.txt").write_text("edited")
+    (git_repo / "dir").mkdir()
+    (git_repo / "dir" / "tracked.txt").write_text("tracked")
+    git.commit_files(
+        [
+            git_repo / "a.txt",
+            git_repo / "deleted.txt",
+            git_repo / "edited.txt",
+            git_repo / "dir",
+        ],
+        git_repo,
+        "init",
+    )
+    # uncommitted changes of the user
+    (git_repo / "edited.txt").write_text("edited by the user")
+    (git_repo / "dir" / "untracked.txt").write_text("untracked")
+
+    with pytest.raises(ClanError), git.transaction(repo_dir=git_repo):
+        (git_repo / "a.txt").write_text("changed")
+        (git_repo / "deleted.txt").unlink()
+        (git_repo / "edited.txt").write_text("changed")
+        (git_repo / "dir" / "tracked.txt").write_text("changed")
+        (git_repo / "dir" / "b.txt").write_text("b")
+        (git_repo / "new").mkdir()
+        (git_repo / "new" / "b.txt").write_text("b")
+        (git_repo / "new" / "link").symlink_to(git_repo / "dir")
+        git.commit_files(
+            [
+                git_repo / "a.txt",
+                git_repo / "deleted.txt",
+                git_repo / "edited.txt",
+                git_repo / "dir",
+                git_repo / "new",
+            ],
+            git_repo,
+            "update",
+        )
+        raise ClanError("failed")
+    assert (git_repo / "a.txt").read_text() == "a"
+    assert (git_repo / "deleted.txt").read_text() == "deleted"
+    assert (git_repo / "dir" / "tracked.txt").read_text() == "tracked"
+    assert not (git_repo / "dir" / "b.txt").exists()
+    assert not (git_repo / "new").exists()
+    # files that had changes before the transaction are not touched
+    assert (git_repo / "edited.txt").read_text() == "changed"
+    assert (git_repo / "dir" / "untracked.txt").read_text() == "untracked"
+    assert subprocess.check_output(
+        ["git", "status", "--porcelain"], cwd=git_repo, text=True
+    ).splitlines() == [" M edited.txt", "?? dir/untracked.txt"]
+
+
+def test_transaction_no_rollback(git_repo: Path) -> None:
+    (git_repo / "a.txt").write_text("a")
+    git.commit_file(git_repo / "a.txt", git_repo, "init")
+
+    # without the repository its state is unknown, nothing is restored
+    with pytest.raises(ClanError), git.transaction():
+        (git_repo / "a.txt").write_text("changed")
+        git.commit_file(git_repo / "a.txt", git_repo, "update")
+        raise ClanError("failed")
+    assert (git_repo / "a.txt").read_text() == "changed"
+
+    # an interrupted transaction leaves its files uncommitted
+    with pytest.raises(KeyboardInterrupt), git.transaction(repo_dir=git_repo):
+        (git_repo / "b.txt").write_text("b")
+        git.commit_file(git_repo / "b.txt", git_repo, "update")
+        raise KeyboardInterrupt
+    assert (git_repo / "b.txt").read_text() == "b"
+    assert (
+        subprocess.check_output(["git", "rev-list", "--count", "HEAD"], cwd=git_repo)
+        == b"1\n"
+    )
+
+
+def test_tree_state(git_repo: Path) -> None:
+    (git_repo / "a.txt").write_text("a")
+    git.commit_file(git_repo / "a.txt", git_repo, "init")
+    state = git.tree_state(git_repo)
+    assert state is not None
+    assert git.tree_state(git_repo) == state
+
+    # untracked files are not part of the flake
+    (git_repo / "untracked.txt").write_text("b")
+    assert git.tree_state(git_repo) == state
+
+    (git_repo / "a.txt").write_text("modified")
+    modified = git.tree_state(git_repo)
+    assert modified != state
+    # the status stays the same, but the content changed again
+    (git_repo / "a.txt").write_text("modified again")
+    assert git.tree_state(git_repo) != modified
+
+    git.commit_file(git_repo / "a.txt", git_repo, "change")
+    assert git.tree_state(git_repo) not in [state, modified]
+
+
+def test_tree_state_subdir(git_repo: Path) -> None:
+    flake = git_repo / "flake"
+    flake.mkdir()
+    (flake / "a.txt").write_text("a")
+    git.commit_file(flake / "a.txt", git_repo, "init")
+    (flake / "a.txt").write_text("modified")
+    modified = git.tree_state(flake)
+    assert modified is not None
+    # the paths of the status are relative to the top level of the repository
+    (flake / "a.txt").write_text("modified again")
+    assert git.tree_state(flake) != modified
+
+
+def test_tree_state_no_repo(tmp_path: Path) -> None:
+    assert git.tree_state(tmp_path) is None
+
+
+def test_worktree_files(git_repo: Path, tmp_path: Path) -> None:
+    machine = git_repo / "machines" / "vm1"
+    machine.mkdir(parents=True)
+    for name in ["kept.gpg", "deleted.gpg"]:
+        (machine / name).write_text(name)
+    git.commit_files(list(machine.iterdir()), git_repo, "add secrets")
+    (machine / "untracked.gpg").write_text("untracked")
+    (machine / "deleted.gpg").unlink()
+    (git_repo / "other.txt").write_text("other")
+
+    assert git.worktree_files(git_repo, "machines/vm1") == {
+        Path("machines/vm1/kept.gpg"),
+        Path("machines/vm1/untracked.gpg"),
+    }
+    assert git.worktree_files(tmp_path / "no-repo", "machines/vm1") is None
@@ -0,0 +1,197 @@
+import json
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from clan_cli import inventory
+from clan_cli.api import MethodRegistry, from_dict
+from clan_cli.errors import ClanError
+from clan_cli.git import commit_file, transaction
+from clan_cli.inventory import Inventory, Machine, MachineDeploy, Meta
+from clan_cli.inventory.json_patch import apply_patch
+
+
+def test_load_inventory_eval_cache(
+    git_repo: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (git_repo / "flake.nix").write_text("{}")
+    commit_file(git_repo / "flake.nix", git_repo, "init")
+    evaluations: list[list[str]] = []
+
+    def run_no_stdout(cmd: list[str]) -> Any:
+        evaluations.append(cmd)
+        data = json.loads(inventory.get_path(git_repo).read_text() or "{}")
+        data.setdefault("meta", {"name": "from nix"})
+        data.setdefault("machines", {})
+        data.setdefault("services", {})
+        return SimpleNamespace(stdout=json.dumps(data))
+
+    monkeypatch.setattr(inventory, "run_no_stdout", run_no_stdout)
+    inventory.get_path(git_repo).write_text("")
+
+    first = inventory.load_inventory_eval(git_repo)
+    first.meta.name = "modified by the caller"
+    second = inventory.load_inventory_eval(git_repo)
+    assert len(evaluations) == 1
+    assert second.meta.name == "from nix"
+
+    inventory.save_inventory(
+        Inventory(
+            meta=Meta(name="saved"),
+            machines={"machine": Machine(name="machine", deploy=MachineDeploy())},
+            services=inventory.Service(),
+        ),
+        git_repo,
+        "save",
+    )
+    saved = inventory.load_inventory_eval(git_repo)
+    assert len(evaluations) == 2
+    assert saved.meta.name == "saved"
+    assert list(saved.machines) == ["machine"]
+    inventory.load_inventory_eval(git_repo)
+    assert len(evaluations) == 2
+
+    # an uncommitted change of another file in the flake
+    (git_repo / "flake.nix").write_text("{ }")
+    inventory.load_inventory_eval(git_repo)
+    assert len(evaluations) == 3
+
+
+def test_apply_patch() -> None:
+    document = {"b": {"c": [1, 2]}, "a": "x", "~/": 0}
+    patched = apply_patch(
+        document,
+        [
+            {"op": "test", "path": "/a", "value": "x"},
+            {"op": "add", "path": "/b/c/-", "value": 3},
+            {"op": "add", "path": "/b/c/0", "value": 0},
+            {"op": "replace", "path": "/a", "value": "y"},
+            {"op": "copy", "from": "/b/c", "path": "/d"},
+            {"op": "move", "from": "/b/c/3", "path": "/e"},
+            {"op": "remove", "path": "/~0~1"},
+        ],
+    )
+    assert patched == {"b": {"c": [0, 1, 2]}, "a": "y", "d": [0, 1, 2, 3], "e": 3}
+    # keys keep their position, added ones are appended
+    assert list(patched) == ["b", "a", "d", "e"]
+    # the document itself is not modified
+    assert document == {"b": {"c": [1, 2]}, "a": "x", "~/": 0}
+
+    for operations in [
+        [{"op": "remove", "path": "/missing"}],
+        [{"op": "replace", "path": "/b/c/2", "value": 0}],
+        [{"op": "add", "path": "/b/c/01", "value": 0}],
+        [{"op": "test", "path": "/b/c/0", "value": True}],
+        [{"op": "move", "from": "/b", "path": "/b/c/x"}],
+        [{"op": "add", "path": "a", "value": 0}],
+        [{"op": "unknown", "path": "/a"}],
+        [{"op": "add", "path": "/a"}],
+    ]:
+        with pytest.raises(ClanError):
+            apply_patch(document, operations)
+
+
+def test_patch_inventory(git_repo: Path) -> None:
+    machines = {
+        f"machine-{i}": Machine(name=f"machine-{i}", deploy=MachineDeploy(), tags=[])
+        for i in range(100)
+    }
+    inventory.save_inventory(
+        Inventory(
+            meta=Meta(name="clan"), machines=machines, services=inventory.Service()
+        ),
+        git_repo,
+        "init",
+    )
+
+    def commits() -> int:
+        return int(
+            subprocess.check_output(
+                ["git", "rev-list", "--count", "HEAD"], cwd=git_repo
+            )
+        )
+
+    before = inventory.get_path(git_repo).read_text()
+    inventory.patch_inventory(
+        str(git_repo),
+        [
+            {"op": "add", "path": f"/machines/{name}/tags/-", "value": "edited"}
+            for name in machines
+        ],
+    )
+    assert commits() == 2
+    after = inventory.load_inventory_json(git_repo)
+    assert all(machine.tags == ["edited"] for machine in after.machines.values())
+    # only the tags lines changed, "tags": [] became three lines
+    diff = subprocess.check_output(
+        ["git", "diff", "--numstat", "HEAD~1", "HEAD"], cwd=git_repo, text=True
+    )
+    assert diff.split()[:2] == ["300", "100"]
+    assert len(before.splitlines()) + 200 == len(
+        inventory.get_path(git_repo).read_text().splitlines()
+    )
+
+    # invalid results are not written
+    with pytest.raises(ClanError):
+        inventory.patch_inventory(
+            str(git_repo), [{"op": "replace", "path": "/machines", "value": 1}]
+        )
+    assert commits() == 2
+
+    # patches in a transaction are committed together
+    with transaction("edit"):
+        inventory.patch_inventory(
+            str(git_repo), [{"op": "replace", "path": "/meta/name", "value": "a"}]
+        )
+        inventory.patch_inventory(
+            str(git_repo),
+            [{"op": "remove", "path": "/machines/machine-0"}],
+            "Remove machine-0",
+        )
+    assert commits() == 3
+    after = inventory.load_inventory_json(git_repo)
+    assert after.meta.name == "a"
+    assert "machine-0" not in after.machines
+
+
+def test_patch_inventory_api(git_repo: Path) -> None:
+    # other tests reset the global registry
+    registry = MethodRegistry()
+    registry.register(inventory.patch_inventory)
+    inventory.save_inventory(
+        Inventory(meta=Meta(name="clan"), machines={}, services=inventory.Service()),
+        git_repo,
+        "init",
+    )
+    ops = [
+        {
+            "op": "add",
+            "path": "/machines/machine",
+            "value": {"name": "machine", "deploy": {}, "tags": ["a"]},
+        },
+        {"op": "replace", "path": "/meta/name", "value": "patched"},
+    ]
+    response = registry.call(
+        "patch_inventory", {"base_path": str(git_repo), "ops": ops}, op_key="op"
+    )
+    assert response.status == "success", response
+    after = inventory.load_inventory_json(git_repo)
+    assert after.meta.name == "patched"
+    assert after.machines["machine"].tags == ["a"]
+
+    # the arguments are converted like the webview does
+    data = {
+        "base_path": str(git_repo),
+        "ops": [{"op": "remove", "path": "/machines/machine"}],
+        "message": "Remove machine",
+    }
+    arguments = {
+        name: from_dict(registry.get_method_argtype("patch_inventory", name), value)
+        for name, value in data.items()
+    }
+    response = registry.functions["patch_inventory"](**arguments, op_key="op")
+    assert response.status == "success", response
+    assert inventory.load_inventory_json(git_repo).machines == {}
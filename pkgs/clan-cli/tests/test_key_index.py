@@ -0,0 +1,93 @@
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from clan_cli.secrets.folders import (
+    sops_groups_folder,
+    sops_machines_folder,
+    sops_secrets_folder,
+    sops_users_folder,
+)
+from clan_cli.secrets.key_index import get_key_index
+from clan_cli.secrets.secrets import collect_keys_for_path, has_secret, list_secrets
+from clan_cli.secrets.sops import ensure_user_or_machine, write_key
+
+if TYPE_CHECKING:
+    from age_keys import KeyPair
+
+
+def link(source: Path, target: Path) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.symlink_to(os.path.relpath(source, target.parent))
+
+
+def test_key_index(tmp_path: Path, age_keys: list["KeyPair"]) -> None:
+    users = sops_users_folder(tmp_path)
+    machines = sops_machines_folder(tmp_path)
+    groups = sops_groups_folder(tmp_path)
+    write_key(users / "alice", age_keys[0].pubkey, False)
+    write_key(users / "bob", age_keys[1].pubkey, False)
+    write_key(machines / "server", age_keys[2].pubkey, False)
+    link(users / "alice", groups / "admins" / "users" / "alice")
+
+    secret = sops_secrets_folder(tmp_path) / "secret"
+    link(machines / "server", secret / "machines" / "server")
+    link(groups / "admins", secret / "groups" / "admins")
+    assert collect_keys_for_path(secret) == {age_keys[0].pubkey, age_keys[2].pubkey}
+    index = get_key_index(tmp_path)
+    assert get_key_index(tmp_path) is index
+    assert ensure_user_or_machine(tmp_path, age_keys[2].pubkey).username == "server"
+
+    # group membership changes are picked up
+    link(users / "bob", groups / "admins" / "users" / "bob")
+    assert collect_keys_for_path(secret) == {
+        age_keys[0].pubkey,
+        age_keys[1].pubkey,
+        age_keys[2].pubkey,
+    }
+    # without reading all keys again
+    assert get_key_index(tmp_path) is index
+
+    # so are rotated keys
+    write_key(machines / "server", age_keys[0].pubkey, True)
+    assert collect_keys_for_path(secret) == {age_keys[0].pubkey, age_keys[1].pubkey}
+    assert ensure_user_or_machine(tmp_path, age_keys[0].pubkey).username == "alice"
+
+    # and keys edited outside of clan, in place or replaced
+    key_file = users / "bob" / "key.json"
+    key_file.write_text(key_file.read_text().replace(age_keys[1].pubkey, "age1edited"))
+    os.utime(key_file, ns=(1, 1))
+    assert get_key_index(tmp_path).keys[(users / "bob").resolve()] == "age1edited"
+
+    replaced = users / "bob" / "key.json.tmp"
+    replaced.write_text(key_file.read_text().replace("age1edited", "age1replaced"))
+    os.utime(replaced, ns=(1, 1))
+    replaced.replace(key_file)
+    assert get_key_index(tmp_path).keys[(users / "bob").resolve()] == "age1replaced"
+
+    # a key edited in place is read again when a group containing it is used
+    bob_key = key_file.read_text()
+    key_file.write_text(bob_key.replace("age1replaced", age_keys[1].pubkey))
+    os.utime(key_file, ns=(2, 2))
+    assert collect_keys_for_path(secret) == {age_keys[0].pubkey, age_keys[1].pubkey}
+
+
+def test_key_index_secrets(tmp_path: Path) -> None:
+    secrets = sops_secrets_folder(tmp_path)
+    (secrets / "a").mkdir(parents=True)
+    (secrets / "a" / "secret").write_text("a")
+    (secrets / "b").mkdir()
+    assert list_secrets(tmp_path) == ["a"]
+    assert has_secret(secrets / "a")
+    assert not has_secret(secrets / "b")
+
+    # the secret file of an existing folder is written later
+    (secrets / "b" / "secret").write_text("b")
+    assert has_secret(secrets / "b")
+    assert sorted(list_secrets(tmp_path)) == ["a", "b"]
+    assert list_secrets(tmp_path, "b") == ["b"]
+
+    (secrets / "a" / "secret").unlink()
+    (secrets / "a").rmdir()
+    assert not has_secret(secrets / "a")
+    assert list_secrets(tmp_path) == ["b"]
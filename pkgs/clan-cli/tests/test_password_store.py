@@ -0,0 +1,204 @@
+import subprocess
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from clan_cli.facts.secret_modules import password_store as facts_password_store
+from clan_cli.git import last_commits
+from clan_cli.vars.secret_modules import password_store as vars_password_store
+
+
+def git(repo: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", "-C", str(repo), *args], check=True, stdout=subprocess.PIPE, text=True
+    ).stdout
+
+
+def last_commit_of(repo: Path, path: str) -> str:
+    return git(repo, "log", "-1", "--full-history", "--format=%H", "--", path).strip()
+
+
+def generate_hash_per_file(password_store: Path, machine_name: str) -> bytes:
+    """
+    The previous implementation, spawning git log once per symlink
+    """
+    hashes = []
+    hashes.append(
+        subprocess.run(
+            [
+                "git",
+                "-C",
+                str(password_store),
+                "log",
+                "-1",
+                "--format=%H",
+                f"machines/{machine_name}",
+            ],
+            stdout=subprocess.PIPE,
+        ).stdout.strip()
+    )
+    for symlink in password_store.glob(f"machines/{machine_name}/**/*"):
+        if symlink.is_symlink():
+            hashes.append(
+                subprocess.run(
+                    [
+                        "git",
+                        "-C",
+                        str(password_store),
+                        "log",
+                        "-1",
+                        "--format=%H",
+                        str(symlink),
+                    ],
+                    stdout=subprocess.PIPE,
+                ).stdout.strip()
+            )
+    hashes.sort()
+    return b"\n".join(hashes)
+
+
+@pytest.fixture
+def password_store(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    store = tmp_path / "pass"
+    store.mkdir()
+    git(store, "init", "-q", "-b", "main")
+    git(store, "config", "user.email", "test@example.com")
+    git(store, "config", "user.name", "test")
+    monkeypatch.setenv("PASSWORD_STORE_DIR", str(store))
+
+    machine = store / "machines" / "machine"
+    (machine / "service").mkdir(parents=True)
+    (store / "shared").mkdir()
+    for name in ["a", "b", "c"]:
+        (store / "shared" / f"{name}.gpg").write_text(name)
+        (machine / f"{name}.gpg").write_text(name)
+    (machine / "service" / "link.gpg").symlink_to("../../../shared/a.gpg")
+    (machine / "link-b.gpg").symlink_to("../../shared/b.gpg")
+    git(store, "add", ".")
+    git(store, "commit", "-qm", "initial")
+
+    (machine / "link-c.gpg").symlink_to("../../shared/c.gpg")
+    git(store, "add", ".")
+    git(store, "commit", "-qm", "add link")
+
+    # a conflicting merge, the merge commit changes the link
+    git(store, "checkout", "-qb", "other")
+    (machine / "link-b.gpg").unlink()
+    (machine / "link-b.gpg").symlink_to("../../shared/a.gpg")
+    git(store, "commit", "-qam", "change link on branch")
+    git(store, "checkout", "-q", "main")
+    (machine / "link-b.gpg").unlink()
+    (machine / "link-b.gpg").symlink_to("../../shared/c.gpg")
+    git(store, "commit", "-qam", "change link on main")
+    subprocess.run(["git", "-C", str(store), "merge", "-q", "other"], check=False)
+    (machine / "link-b.gpg").unlink()
+    (machine / "link-b.gpg").symlink_to("../../shared/b.gpg")
+    git(store, "add", ".")
+    git(store, "commit", "-qm", "merge")
+
+    # a change outside of the machine folder
+    (store / "shared" / "d.gpg").write_text("d")
+    git(store, "add", ".")
+    git(store, "commit", "-qm", "unrelated")
+    # an untracked link
+    (machine / "link-d.gpg").symlink_to("../../shared/d.gpg")
+    return store
+
+
+def test_last_commits(password_store: Path) -> None:
+    last_commit, files = last_commits(password_store, "machines/machine")
+    assert last_commit == last_commit_of(password_store, "machines/machine")
+    assert "machines/machine/link-d.gpg" not in files
+    for path, commit in files.items():
+        assert commit == last_commit_of(password_store, path)
+
+
+def test_last_commits_merge(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    repo = tmp_path / "repo"
+    folder = repo / "machines" / "machine"
+    folder.mkdir(parents=True)
+    git(repo, "init", "-q", "-b", "main")
+    git(repo, "config", "user.email", "test@example.com")
+    git(repo, "config", "user.name", "test")
+    dates = iter(range(1700000000, 1700000100, 10))
+
+    def commit(message: str, *files: str) -> None:
+        monkeypatch.setenv("GIT_COMMITTER_DATE", f"@{next(dates)} +0000")
+        for name in files:
+            (folder / name).write_text(message)
+        git(repo, "add", ".")
+        git(repo, "commit", "-qm", message)
+
+    commit("initial", "a", "b", "c")
+    git(repo, "checkout", "-qb", "other")
+    commit("change b on branch", "b")
+    git(repo, "checkout", "-q", "main")
+    commit("change a", "a")
+    # the same change on both branches, the newer one is on the branch
+    commit("same change", "c")
+    git(repo, "checkout", "-q", "other")
+    commit("same change", "c")
+    git(repo, "checkout", "-q", "main")
+    monkeypatch.setenv("GIT_COMMITTER_DATE", f"@{next(dates)} +0000")
+    git(repo, "merge", "-q", "--no-edit", "other")
+
+    last_commit, files = last_commits(repo, "machines/machine")
+    merge = git(repo, "rev-parse", "HEAD").strip()
+    assert last_commit == merge
+    # the merge brought a and b to the other parent
+    assert files["machines/machine/a"] == merge
+    assert files["machines/machine/b"] == merge
+    assert files["machines/machine/c"] == git(repo, "rev-parse", "other").strip()
+    for path, commit_id in files.items():
+        assert commit_id == last_commit_of(repo, path)
+
+
+def test_last_commits_no_repo(tmp_path: Path) -> None:
+    assert last_commits(tmp_path, "machines/machine") == ("", {})
+
+
+def test_generate_hash(password_store: Path) -> None:
+    machine = SimpleNamespace(name="machine")
+    expected = generate_hash_per_file(password_store, "machine")
+    # the machine folder and four links, one of them untracked
+    assert len(expected.split(b"\n")) == 5
+    for module in [facts_password_store, vars_password_store]:
+        store = module.SecretStore(machine)  # type: ignore
+        assert store.generate_hash() == expected
+
+
+def test_upload(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    machine = SimpleNamespace(
+        name="machine",
+        facts_data=dict(
+            service1=dict(secret=["a", "b"]),
+            service2=dict(secret=[dict(name="c"), dict(name="d")]),
+        ),
+    )
+    decrypted: list[str] = []
+    lock = threading.Lock()
+
+    def get(self: Any, service: str, name: str) -> bytes:
+        with lock:
+            # the first secret is decrypted alone to unlock gpg-agent
+            assert decrypted or name == "a"
+            decrypted.append(name)
+        time.sleep(0.05)
+        return f"{service}/{name}".encode()
+
+    store_class = facts_password_store.SecretStore
+    monkeypatch.setattr(store_class, "get", get)
+    monkeypatch.setattr(store_class, "generate_hash", lambda self: b"hash")
+    store = store_class(machine)  # type: ignore
+    start = time.monotonic()
+    store.upload(tmp_path)
+    # b, c and d are decrypted concurrently
+    assert time.monotonic() - start < 0.18
+    assert sorted(decrypted) == ["a", "b", "c", "d"]
+    assert (tmp_path / "c").read_text() == "service2/c"
+    assert (tmp_path / "a").stat().st_mode & 0o777 == 0o600
+    assert (tmp_path / ".pass_info").read_bytes() == b"hash"
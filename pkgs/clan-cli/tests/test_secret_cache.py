@@ -0,0 +1,59 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from clan_cli.secrets.secret_cache import SecretCache, cached_decrypt, secret_cache
+
+
+def test_cached_decrypt(tmp_path: Path) -> None:
+    secret = tmp_path / "secret"
+    secret.write_text("encrypted-1")
+    calls = []
+
+    def decrypt() -> bytes:
+        calls.append(secret.read_text())
+        return b"value of " + secret.read_bytes()
+
+    assert cached_decrypt(secret, decrypt) == b"value of encrypted-1"
+    assert cached_decrypt(secret, decrypt) == b"value of encrypted-1"
+    assert len(calls) == 1
+
+    # a changed file is decrypted again
+    secret.write_text("encrypted-2")
+    assert cached_decrypt(secret, decrypt) == b"value of encrypted-2"
+    assert len(calls) == 2
+
+    secret_cache.clear()
+    assert cached_decrypt(secret, decrypt) == b"value of encrypted-2"
+    assert len(calls) == 3
+
+
+def test_secret_cache_expiry(tmp_path: Path) -> None:
+    cache = SecretCache(ttl=0.05)
+    cache.put(tmp_path, b"digest", b"secret")
+    assert cache.get(tmp_path, b"digest") == b"secret"
+    assert cache.get(tmp_path, b"other digest") is None
+
+    time.sleep(0.2)
+    # dropped by the timer, without accessing the cache
+    assert not cache._entries
+    assert cache.get(tmp_path, b"digest") is None
+
+    cache.put(tmp_path, b"digest", b"secret")
+    cache.clear()
+    assert cache.get(tmp_path, b"digest") is None
+
+
+def test_cached_decrypt_identity(tmp_path: Path) -> None:
+    secret = tmp_path / "secret"
+    secret.write_text("encrypted")
+    assert cached_decrypt(secret, lambda: b"value", "key-1") == b"value"
+
+    # another key has to decrypt the secret itself
+    def fail() -> bytes:
+        raise ValueError("cannot decrypt")
+
+    with pytest.raises(ValueError):
+        cached_decrypt(secret, fail, "key-2")
+    assert cached_decrypt(secret, fail, "key-1") == b"value"
@@ -1,5 +1,9 @@
 import ipaddress
-from typing import TYPE_CHECKING
+import sys
+import threading
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+from typing import TYPE_CHECKING, Any
 
 import pytest
 from fixtures_flakes import FlakeForTest
@@ -7,6 +11,8 @@ from helpers import cli
 from helpers.validator import is_valid_age_key, is_valid_ssh_key
 
 from clan_cli.clan_uri import FlakeId
+from clan_cli.errors import ClanError
+from clan_cli.facts import generate
 from clan_cli.facts.secret_modules.sops import SecretStore
 from clan_cli.machines.facts import machine_get_fact
 from clan_cli.machines.machines import Machine
@@ -118,3 +124,76 @@ def test_generate_secret(
     pwd_hash = store2.get("", "user-password-hash").decode()
     assert pwd_hash.isprintable()
     assert pwd_hash.isascii()
+
+
+class FakeStore:
+    def __init__(self, machine: Any) -> None:
+        self.machine = machine
+
+    def list_existing(self) -> set[tuple[str, str]]:
+        return set()
+
+
+def test_generate_jobs(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    store_module = ModuleType("fake_facts_store")
+    store_module.SecretStore = FakeStore  # type: ignore
+    store_module.FactStore = FakeStore  # type: ignore
+    monkeypatch.setitem(sys.modules, "fake_facts_store", store_module)
+
+    def machine(name: str, store: str = "fake_facts_store") -> SimpleNamespace:
+        return SimpleNamespace(
+            name=name,
+            facts_data=dict(ssh=dict(generator="ssh"), zerotier=dict(generator="zt")),
+            secret_facts_module=store,
+            public_facts_module=store,
+            flush_caches=lambda: None,
+        )
+
+    machines = [machine("vm1"), machine("vm2"), machine("broken", "no_such_store")]
+    monkeypatch.setattr(generate, "get_all_machines", lambda *args: machines)
+
+    executed: list[tuple[str, str]] = []
+    lock = threading.Lock()
+    # only passed if two services run at the same time
+    barrier = threading.Barrier(2)
+
+    def generate_service_facts(machine: Any, service: str, **kwargs: Any) -> bool:
+        barrier.wait(timeout=10)
+        with lock:
+            executed.append((machine.name, service))
+        return True
+
+    monkeypatch.setattr(generate, "generate_service_facts", generate_service_facts)
+    # the machine whose store cannot be loaded is reported after the others ran
+    with pytest.raises(ClanError, match="Failed to generate facts for 1 services"):
+        cli.run(["facts", "generate", "--flake", str(tmp_path), "--jobs", "2"])
+    assert sorted(executed) == [
+        ("vm1", "ssh"),
+        ("vm1", "zerotier"),
+        ("vm2", "ssh"),
+        ("vm2", "zerotier"),
+    ]
+
+
+def test_sops_list_existing(tmp_path: Path) -> None:
+    secrets = sops_secrets_folder(tmp_path)
+    for name in ["vm1-password", "vm1-missing", "vm2-password"]:
+        (secrets / name).mkdir(parents=True)
+    (secrets / "vm1-password" / "secret").write_text("secret")
+    (secrets / "vm2-password" / "secret").write_text("secret")
+
+    def store(name: str) -> SecretStore:
+        facts_data = {"service": {"secret": ["password", {"name": "missing"}]}}
+        store = SecretStore.__new__(SecretStore)
+        store.machine = SimpleNamespace(  # type: ignore
+            name=name, flake_dir=tmp_path, facts_data=facts_data
+        )
+        return store
+
+    assert store("vm1").list_existing() == {("service", "password")}
+    assert store("vm3").list_existing() == set()
+    (secrets / "vm1-missing" / "secret").write_text("secret")
+    assert store("vm1").list_existing() == {
+        ("service", "password"),
+        ("service", "missing"),
+    }
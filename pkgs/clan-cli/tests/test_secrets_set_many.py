@@ -0,0 +1,100 @@
+import json
+import subprocess
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+from fixtures_flakes import FlakeForTest
+from helpers import cli
+from stdout import CaptureOutput
+
+from clan_cli.errors import ClanError
+from clan_cli.secrets.set_many import SecretEntry, parse_entries
+
+if TYPE_CHECKING:
+    from age_keys import KeyPair
+
+
+def test_parse_entries() -> None:
+    assert parse_entries(
+        json.dumps({"a": "1", "b": {"value": "2", "machines": ["m"]}}), "json"
+    ) == [SecretEntry("a", "1"), SecretEntry("b", "2", machines=["m"])]
+    dotenv = """
+# comment
+export A=1
+B="multi\\nline"
+C='not\\nescaped'
+"""
+    assert parse_entries(dotenv, "dotenv") == [
+        SecretEntry("A", "1"),
+        SecretEntry("B", "multi\nline"),
+        SecretEntry("C", "not\\nescaped"),
+    ]
+    with pytest.raises(ClanError):
+        parse_entries(json.dumps({"a": 1}), "json")
+    with pytest.raises(ClanError):
+        parse_entries("A", "dotenv")
+    # a single name is not split into characters
+    with pytest.raises(ClanError):
+        parse_entries(json.dumps({"a": {"value": "1", "users": "alice"}}), "json")
+    with pytest.raises(ClanError):
+        parse_entries(json.dumps({"a": {"value": "1", "groups": [1]}}), "json")
+
+
+def test_set_many(
+    tmp_path: Path,
+    test_flake: FlakeForTest,
+    capture_output: CaptureOutput,
+    monkeypatch: pytest.MonkeyPatch,
+    age_keys: list["KeyPair"],
+) -> None:
+    monkeypatch.setenv("SOPS_AGE_KEY", age_keys[0].privkey)
+    cli.run(
+        [
+            "secrets",
+            "users",
+            "add",
+            "--flake",
+            str(test_flake.path),
+            "admin",
+            age_keys[0].pubkey,
+        ]
+    )
+    cli.run(
+        [
+            "secrets",
+            "machines",
+            "add",
+            "--flake",
+            str(test_flake.path),
+            "machine1",
+            age_keys[1].pubkey,
+        ]
+    )
+    input_file = tmp_path / "secrets.json"
+    secrets = {f"secret-{i}": f"value-{i}" for i in range(10)}
+    secrets["machine-secret"] = {"value": "machine", "machines": ["machine1"]}  # type: ignore[assignment]
+    input_file.write_text(json.dumps(secrets))
+    commits_before = subprocess.check_output(
+        ["git", "rev-list", "--count", "HEAD"], cwd=test_flake.path
+    )
+    cli.run(["secrets", "set-many", "--flake", str(test_flake.path), str(input_file)])
+    commits_after = subprocess.check_output(
+        ["git", "rev-list", "--count", "HEAD"], cwd=test_flake.path
+    )
+    assert int(commits_after) == int(commits_before) + 1
+
+    with capture_output as output:
+        cli.run(["secrets", "get", "--flake", str(test_flake.path), "secret-3"])
+    assert output.out == "value-3"
+    with capture_output as output:
+        cli.run(
+            [
+                "secrets",
+                "who-can-read",
+                "--flake",
+                str(test_flake.path),
+                "machine-secret",
+            ]
+        )
+    assert "machine1" in output.out
@@ -1,14 +1,23 @@
-from typing import TYPE_CHECKING
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, cast
 
 import pytest
 from fixtures_flakes import FlakeForTest
 from helpers import cli
 
-from clan_cli.ssh import HostGroup
+from clan_cli.secrets.upload_manifest import (
+    MANIFEST_FILE,
+    remote_manifest_matches,
+    upload_manifest,
+)
+from clan_cli.ssh import Host, HostGroup
 
 if TYPE_CHECKING:
     from age_keys import KeyPair
 
+    from clan_cli.machines.machines import Machine
+
 
 @pytest.mark.impure
 def test_secrets_upload(
@@ -60,3 +69,67 @@ def test_secrets_upload(
     sops_key = test_flake_with_core.path.joinpath("key.txt")
     assert sops_key.exists()
     assert sops_key.read_text() == age_keys[0].privkey
+
+    # nothing changed, the upload is skipped without decrypting the key
+    manifest = test_flake_with_core.path.joinpath(".sops_manifest")
+    assert manifest.exists()
+    sops_key.write_text("unchanged")
+    cli.run(["facts", "upload", "--flake", str(test_flake_with_core.path), "vm1"])
+    assert sops_key.read_text() == "unchanged"
+
+    # a different manifest on the target triggers the upload again
+    manifest.write_text("outdated\n")
+    cli.run(["facts", "upload", "--flake", str(test_flake_with_core.path), "vm1"])
+    assert sops_key.read_text() == age_keys[0].privkey
+
+
+def test_upload_manifest(tmp_path: Path) -> None:
+    assert upload_manifest(tmp_path, "vm1") is None
+    secret = tmp_path / "sops" / "secrets" / "vm1-age.key" / "secret"
+    secret.parent.mkdir(parents=True)
+    secret.write_text("encrypted")
+    key = tmp_path / "sops" / "machines" / "vm1" / "key.json"
+    key.parent.mkdir(parents=True)
+    key.write_text('{"publickey": "age1", "type": "age"}')
+
+    manifest = upload_manifest(tmp_path, "vm1")
+    assert manifest is not None
+    assert manifest == upload_manifest(tmp_path, "vm1")
+    secret.write_text("reencrypted")
+    assert upload_manifest(tmp_path, "vm1") != manifest
+    secret.write_text("encrypted")
+    key.write_text('{"publickey": "age2", "type": "age"}')
+    assert upload_manifest(tmp_path, "vm1") != manifest
+
+
+class _LocalMachine:
+    def __init__(self, upload_directory: Path) -> None:
+        self.name = "vm1"
+        self.secrets_upload_directory = str(upload_directory)
+        self.target_host = Host("vm1")
+
+
+def test_remote_manifest_matches(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    # an ssh that runs the remote command locally, so that Host.run is used as is
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    ssh = bin_dir / "ssh"
+    ssh.write_text(
+        '#!/bin/sh\nwhile [ "$1" != "--" ]; do shift; done\nshift\nexec sh -c "$*"\n'
+    )
+    ssh.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+
+    upload_directory = tmp_path / "upload"
+    upload_directory.mkdir()
+    machine = cast("Machine", _LocalMachine(upload_directory))
+
+    assert not remote_manifest_matches(machine, None)
+    # neither key nor manifest were uploaded, cat fails on stderr
+    assert not remote_manifest_matches(machine, "manifest")
+    (upload_directory / "key.txt").write_text("key")
+    (upload_directory / MANIFEST_FILE).write_text("manifest\n")
+    assert remote_manifest_matches(machine, "manifest")
+    assert not remote_manifest_matches(machine, "other")
@@ -1,8 +1,11 @@
+import json
 from dataclasses import dataclass, field
+from pathlib import Path
 
 # Functions to test
 from clan_cli.api import (
     dataclass_to_dict,
+    dataclass_to_json,
     sanitize_string,
 )
 
@@ -124,3 +127,30 @@ def test_filters_null_fields() -> None:
     assert instance.home == "home"
     assert instance.work is None
     assert dataclass_to_dict(instance) == {"home": "home"}
+
+
+def test_strings_are_escaped_once() -> None:
+    @dataclass
+    class Foo:
+        text: str
+        path: Path
+        items: dict[str, list[str]]
+        alias: str = field(default="a", metadata={"alias": "Alias"})
+        _private: str = "hidden"
+
+    text = 'quote " backslash \\ newline \n tab \t unicode \u00e4 `${x}`'
+    instance = Foo(text=text, path=Path("/a b"), items={text: [text, text]})
+    expected = {
+        "text": text,
+        "path": "/a b",
+        "items": {text: [text, text]},
+        "Alias": "a",
+    }
+    assert dataclass_to_dict(instance) == expected
+    assert json.loads(json.dumps(dataclass_to_dict(instance))) == expected
+    assert dataclass_to_dict(instance, use_alias=False)["alias"] == "a"
+
+    for indent in [None, 2]:
+        encoded = dataclass_to_json([instance, (instance, None)], indent=indent)
+        assert json.loads(encoded) == [expected, [expected, None]]
+    assert json.loads(dataclass_to_json(instance, use_alias=False))["alias"] == "a"
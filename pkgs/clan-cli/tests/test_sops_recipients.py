@@ -0,0 +1,89 @@
+import json
+from pathlib import Path
+
+import pytest
+from age_keys import KEYS
+
+from clan_cli.errors import ClanError
+from clan_cli.secrets import secrets as secrets_module
+from clan_cli.secrets import sops
+from clan_cli.secrets.secrets import commit_updated_keys
+from clan_cli.secrets.sops import (
+    UpdateKeysError,
+    get_recipients,
+    needs_update,
+    update_keys_many,
+)
+
+
+def write_secret(secret_path: Path, sops_metadata: dict) -> None:
+    secret_path.mkdir(parents=True)
+    (secret_path / "secret").write_text(
+        json.dumps({"data": "ENC[AES256_GCM,data:...]", "sops": sops_metadata})
+    )
+
+
+def test_get_recipients(tmp_path: Path) -> None:
+    secret = tmp_path / "secret1"
+    write_secret(
+        secret,
+        {"age": [{"recipient": k.pubkey, "enc": "..."} for k in KEYS[:2]], "pgp": []},
+    )
+    assert get_recipients(secret) == {KEYS[0].pubkey, KEYS[1].pubkey}
+    assert not needs_update(secret, [KEYS[1].pubkey, KEYS[0].pubkey])
+    assert needs_update(secret, [KEYS[0].pubkey])
+
+    # other key types would be dropped by updatekeys
+    pgp_secret = tmp_path / "secret2"
+    write_secret(
+        pgp_secret,
+        {"age": [{"recipient": KEYS[0].pubkey}], "pgp": [{"fp": "ABCD"}]},
+    )
+    assert get_recipients(pgp_secret) is None
+    assert needs_update(pgp_secret, [KEYS[0].pubkey])
+
+    assert get_recipients(tmp_path / "missing") is None
+
+
+def test_update_keys_many_skips_unchanged(tmp_path: Path) -> None:
+    secrets = []
+    for i in range(10):
+        secret = tmp_path / f"secret{i}"
+        write_secret(secret, {"age": [{"recipient": KEYS[0].pubkey}]})
+        secrets.append((secret, [KEYS[0].pubkey]))
+    # no sops process is needed if all recipients are up to date
+    assert update_keys_many(secrets) == []
+
+
+def test_update_keys_many_partial_failure(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    secrets = []
+    for i in range(4):
+        secret = tmp_path / f"secret{i}"
+        write_secret(secret, {"age": [{"recipient": KEYS[0].pubkey}]})
+        secrets.append((secret, [KEYS[1].pubkey]))
+
+    def update_keys(secret_path: Path, keys: list[str]) -> list[Path]:
+        if secret_path.name == "secret1":
+            raise ClanError("sops failed")
+        return [secret_path / "secret"]
+
+    monkeypatch.setattr(sops, "update_keys", update_keys)
+    # the other secrets are updated and reported nonetheless
+    with pytest.raises(UpdateKeysError) as exc_info:
+        update_keys_many(secrets, max_workers=2)
+    assert exc_info.value.changed_files == [
+        tmp_path / f"secret{i}" / "secret" for i in [0, 2, 3]
+    ]
+
+    committed: list[list[Path]] = []
+    monkeypatch.setattr(
+        secrets_module,
+        "commit_files",
+        lambda paths, repo_dir, message: committed.append(paths),
+    )
+    paths = [tmp_path / "key.json"]
+    with pytest.raises(UpdateKeysError), commit_updated_keys(paths, tmp_path, "msg"):
+        paths.extend(update_keys_many(secrets))
+    assert committed == [[paths[0], *exc_info.value.changed_files]]
@@ -2,6 +2,7 @@ import subprocess
 from io import StringIO
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from typing import Any
 
 import pytest
 from age_keys import SopsSetup
@@ -365,3 +366,132 @@ def test_share_flag(
     assert not in_repo_store.exists("shared_generator", "my_value", shared=False)
     assert in_repo_store.exists("unshared_generator", "my_value", shared=False)
     assert not in_repo_store.exists("unshared_generator", "my_value", shared=True)
+
+
+def test_fingerprint(tmp_path: Path) -> None:
+    from types import SimpleNamespace
+
+    from clan_cli.vars.fingerprint import (
+        compute_fingerprint,
+        outputs_hash,
+        read_fingerprint,
+        write_fingerprint,
+    )
+
+    coreutils = "/nix/store/" + "a" * 32 + "-coreutils-9.4"
+    generator = dict(
+        finalScript=f"export PATH={coreutils}/bin\necho $RANDOM > $out/f",
+        script="echo $RANDOM > $out/f",
+        share=False,
+        prompts=dict(p=dict(description="a prompt", type="line")),
+        files=dict(f=dict(secret=True)),
+        dependencies=["dep"],
+    )
+    machine = SimpleNamespace(
+        name="machine", flake_dir=tmp_path, vars_generators=dict(gen=generator)
+    )
+    assert outputs_hash(dict(a=b"1", b=b"2")) == outputs_hash(dict(b=b"2", a=b"1"))
+    assert outputs_hash(dict(a=b"1")) != outputs_hash(dict(a=b"2"))
+
+    def fingerprint_with(**changes: Any) -> str:
+        changed = SimpleNamespace(
+            name="machine",
+            flake_dir=tmp_path,
+            vars_generators=dict(gen={**generator, **changes}),
+        )
+        return compute_fingerprint(changed, "gen", dict(dep="x"))  # type: ignore
+
+    fingerprint = compute_fingerprint(machine, "gen", dict(dep="x"))  # type: ignore
+    assert fingerprint == compute_fingerprint(machine, "gen", dict(dep="x"))  # type: ignore
+    assert fingerprint != compute_fingerprint(machine, "gen", dict(dep="y"))  # type: ignore
+    assert fingerprint != fingerprint_with(script="echo 1 > $out/f")
+    assert fingerprint != fingerprint_with(
+        prompts=dict(p=dict(description="another prompt", type="line"))
+    )
+    assert fingerprint != fingerprint_with(files=dict(f=dict(secret=False)))
+
+    # updating nixpkgs changes the wrapper and the store paths in the script
+    updated_coreutils = "/nix/store/" + "b" * 32 + "-coreutils-9.4"
+    assert fingerprint == fingerprint_with(
+        finalScript=f"export PATH={updated_coreutils}/bin\necho $RANDOM > $out/f"
+    )
+    assert fingerprint_with(script=f"{coreutils}/bin/echo") == fingerprint_with(
+        script=f"{updated_coreutils}/bin/echo"
+    )
+
+    assert read_fingerprint(machine, "gen") is None  # type: ignore
+    path = write_fingerprint(machine, "gen", fingerprint)  # type: ignore
+    assert (
+        path == tmp_path / "vars" / "per-machine" / "machine" / "gen" / ".fingerprint"
+    )
+    stored = read_fingerprint(machine, "gen")  # type: ignore
+    assert stored is not None
+    assert stored["fingerprint"] == fingerprint
+
+
+def test_ask_prompts_of_planned_generators(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    from types import SimpleNamespace
+
+    from clan_cli.vars import generate
+    from clan_cli.vars.fingerprint import (
+        compute_fingerprint,
+        dependency_hashes,
+        write_fingerprint,
+    )
+
+    def generator(prompts: list[str], dependencies: list[str]) -> dict[str, Any]:
+        return dict(
+            script="echo",
+            finalScript="echo",
+            share=False,
+            prompts={p: dict(description=p, type="line") for p in prompts},
+            files=dict(value=dict(secret=False)),
+            dependencies=dependencies,
+        )
+
+    machine: Any = SimpleNamespace(
+        name="machine",
+        flake_dir=tmp_path,
+        vars_generators=dict(
+            changed=generator([], []),
+            dependent=generator(["dependent_prompt"], ["changed"]),
+            unchanged=generator(["unchanged_prompt"], []),
+            adopted=generator(["adopted_prompt"], []),
+            missing=generator(["missing_prompt"], []),
+        ),
+    )
+    store: Any = SimpleNamespace(get=lambda generator, name, shared: b"value")
+    stores = (store, store)
+    existing: tuple[set[tuple[str, str]], set[tuple[str, str]]] = (
+        set(),
+        {(name, "value") for name in ["changed", "dependent", "unchanged", "adopted"]},
+    )
+    for name in ["dependent", "unchanged"]:
+        fingerprint = compute_fingerprint(
+            machine, name, dependency_hashes(machine, name, store, store)
+        )
+        write_fingerprint(machine, name, fingerprint)
+    write_fingerprint(machine, "changed", "outdated")
+
+    asked: list[str] = []
+
+    def prompt_func(description: str, input_type: str) -> str:
+        asked.append(description)
+        return description
+
+    monkeypatch.setattr(generate, "prompt_func", prompt_func)
+    graph = generate._generator_graph(machine, None)
+    # the dependent is asked as well, it runs because its input changes
+    assert generate._ask_prompts(machine, graph, False, existing, stores) == {
+        "dependent": {"dependent_prompt": "dependent_prompt"},
+        "missing": {"missing_prompt": "missing_prompt"},
+    }
+    assert sorted(asked) == ["dependent_prompt", "missing_prompt"]
+    assert set(generate._ask_prompts(machine, graph, True, existing, stores)) == {
+        "dependent",
+        "unchanged",
+        "adopted",
+        "missing",
+    }
@@ -0,0 +1,141 @@
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+from typing import Any, ClassVar
+
+import pytest
+
+from clan_cli import git
+from clan_cli.vars import generate
+from clan_cli.vars.scheduler import run_in_dependency_order
+
+
+def test_run_in_dependency_order() -> None:
+    graph = {
+        "a": set(),
+        "b": set(),
+        "c": {"a", "b"},
+        "d": {"c"},
+    }
+    finished: list[str] = []
+    running = 0
+    max_running = 0
+    lock = threading.Lock()
+
+    def execute(node: str) -> None:
+        nonlocal running, max_running
+        with lock:
+            assert all(dep in finished for dep in graph[node])
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+            finished.append(node)
+
+    assert run_in_dependency_order(graph, execute, max_workers=4) == {}
+    assert finished[2:] == ["c", "d"]
+    # a and b run at the same time
+    assert max_running == 2
+
+
+def test_run_in_dependency_order_failure() -> None:
+    graph = {"a": set(), "b": {"a"}, "c": {"b"}, "d": set()}
+    executed = []
+
+    def execute(node: str) -> None:
+        executed.append(node)
+        if node == "a":
+            raise ValueError("a failed")
+
+    failed = run_in_dependency_order(graph, execute, max_workers=2)
+    assert list(failed) == ["a"]
+    assert sorted(executed) == ["a", "d"]
+
+
+def test_run_in_dependency_order_transaction(git_repo: Path) -> None:
+    graph = {f"file{i}": set() for i in range(5)}
+
+    def execute(node: str) -> None:
+        (git_repo / node).write_text(node)
+        git.commit_file(git_repo / node, git_repo, f"add {node}")
+
+    with git.transaction("add files"):
+        run_in_dependency_order(graph, execute, max_workers=5)
+    assert (
+        subprocess.check_output(["git", "rev-list", "--count", "HEAD"], cwd=git_repo)
+        == b"1\n"
+    )
+
+
+class FakeStore:
+    shared_with: ClassVar[list[tuple[str, str, list[str]]]] = []
+
+    def __init__(self, machine: Any) -> None:
+        self.machine = machine
+
+    def list_existing(self) -> set[tuple[str, str]]:
+        return set()
+
+    def share_with(
+        self, generator_name: str, name: str, machines: list[str]
+    ) -> list[Path]:
+        self.shared_with.append((generator_name, name, machines))
+        return []
+
+
+def test_generate_vars_shared_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    store_module = ModuleType("fake_vars_store")
+    store_module.SecretStore = FakeStore  # type: ignore
+    store_module.FactStore = FakeStore  # type: ignore
+    monkeypatch.setitem(sys.modules, "fake_vars_store", store_module)
+
+    def machine(name: str) -> SimpleNamespace:
+        generators = dict(
+            shared=dict(
+                share=True,
+                dependencies=[],
+                prompts={},
+                finalScript="shared",
+                files=dict(key=dict(secret=True)),
+            ),
+            own=dict(
+                share=False,
+                dependencies=["shared"],
+                prompts={},
+                finalScript="own",
+                files=dict(cert=dict(secret=False)),
+            ),
+        )
+        return SimpleNamespace(
+            name=name,
+            vars_generators=generators,
+            secret_vars_module="fake_vars_store",
+            public_vars_module="fake_vars_store",
+            flush_caches=lambda: None,
+        )
+
+    executed: list[tuple[str, str]] = []
+    lock = threading.Lock()
+
+    def execute_generator(machine: Any, generator_name: str, **kwargs: Any) -> bool:
+        with lock:
+            if generator_name == "own":
+                assert ("m1", "shared") in executed
+            executed.append((machine.name, generator_name))
+        return True
+
+    monkeypatch.setattr(generate, "execute_generator", execute_generator)
+    FakeStore.shared_with = []
+    machines = [machine("m1"), machine("m2"), machine("m3")]
+    assert generate.generate_vars(machines, None, False, max_workers=3)  # type: ignore
+    assert sorted(executed) == [
+        ("m1", "own"),
+        ("m1", "shared"),
+        ("m2", "own"),
+        ("m3", "own"),
+    ]
+    assert FakeStore.shared_with == [("shared", "key", ["m1", "m2", "m3"])]